@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server to stream live chart events from /api/live/,
+e.g. ``uvicorn backend.asgi:application --workers 4`` (set
+LIVE_EVENTS_SOCKET_DIR so events reach streams held by every worker).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
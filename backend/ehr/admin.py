@@ -1,3 +1,349 @@
+# Admin
+# Every model is registered for ops staff. The clinical tables grow to
+# hundreds of millions of rows, where the stock changelist is unusable: it
+# counts the table twice per page, sorts it by an unindexed date, runs a
+# LIKE '%term%' over it for every search, and draws its date drill-down from
+# a SELECT DISTINCT over it. LargeTableAdmin instead:
+#     * pages with NoCountPaginator, which reads one row past the page rather
+#       than counting, and hides "show all" and select-across; a single page
+#       is shown from those rows rather than read again (NoCountChangeList);
+#     * orders by the primary key or by a date that leads an index;
+#     * searches exact values of indexed columns only (see
+#       get_search_results), plus patient names from the typeahead index;
+#     * joins the patient (list_select_related), whose name every chart
+#       row's __str__ shows, and edits it as a raw ID, not a <select> of
+#       every patient;
+#     * draws date drill-downs (date_hierarchy, only on dates that lead an
+#       index) from the calendar between the first and last date, two index
+#       probes (see templatetags/ehr_admin.py).
+# Tables the application maintains (snapshots, rollups, archives, logs, the
+# change feed) are read-only here. Deleting patients goes through the
+# batched purge (purge.py).
+
 from django.contrib import admin
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+
+from .autocomplete import autocomplete_index
+from .models import (
+    AccessLog, Appointment, AppointmentRollup, ChangeConsumer, ChangeEvent, ChangeFeedHead,
+    MedicalRecord, MedicalRecordArchive, Medication, Patient, PatientBlockingKey,
+    PatientLatestVitals, ScheduledDose, SlowQuery, VitalSign, VitalSignArchive, VitalSignBlock,
+)
+from .purge import CHILDREN, purge_patient
+
+PATIENT_NAME_MATCHES = 200  # patients a name search returns at most
+PATIENT_SEARCH = ('patient', 'patient__medical_record_number')
+
+
+class NoCountPaginator(Paginator):
+    """
+    Paginator that never runs COUNT(*). The current page is read with one
+    extra row, so ``count`` is the number of rows up to this page plus one
+    when another page follows. The admin then links up to the next page.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, number=1):
+        super().__init__(object_list, per_page, 0, allow_empty_first_page)
+        self.number = number
+
+    @cached_property
+    def rows(self):
+        offset = (self.number - 1) * self.per_page
+        return list(self.object_list[offset:offset + self.per_page + 1])
+
+    @cached_property
+    def count(self):
+        return (self.number - 1) * self.per_page + len(self.rows)
+
+    @property
+    def has_more(self):
+        return len(self.rows) > self.per_page
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number != self.number:
+            return super().page(number)
+        return self._get_page(self.rows[:self.per_page], number, self)
+
+
+class NoCountChangeList(ChangeList):
+    """
+    ChangeList that shows a lone page from the rows the paginator read; the
+    stock one re-runs the query whenever everything fits on one page.
+    """
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.multi_page and not self.show_all and self.paginator.number == 1:
+            self.result_list = self.paginator.page(1).object_list
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings that cost the same on a table of any size."""
+    paginator = NoCountPaginator
+    list_per_page = 50
+    show_full_result_count = False
+    list_max_show_all = 0
+    actions_selection_counter = False  # its "select all N" would use the row count
+    sortable_by = ()  # clicking a column must not sort the whole table
+
+    def get_changelist(self, request, **kwargs):
+        return NoCountChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            number = max(int(request.GET.get(PAGE_VAR, 1)), 1)
+        except ValueError:
+            number = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, number=number)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Rows where, for every word, one of search_fields equals it exactly.
+        A word a column cannot hold (text for an ID) skips that column rather
+        than casting it, which would bypass its index.
+        """
+        search_fields = self.get_search_fields(request)
+        if not search_fields or not search_term:
+            return queryset, False
+        for word in smart_split(search_term):
+            if word.startswith(('"', "'")) and word[0] == word[-1]:
+                word = unescape_string_literal(word)
+            matches = Q()
+            for path in search_fields:
+                field = get_fields_from_path(self.model, path)[-1]
+                field = field.target_field if field.is_relation else field
+                try:
+                    value = field.to_python(word)
+                    field.run_validators(value)
+                except ValidationError:
+                    continue
+                relation, _, rest = path.partition('__')
+                if rest:
+                    # The related IDs themselves, not a join or subquery, so
+                    # each alternative of the OR can use its own index
+                    related = self.model._meta.get_field(relation).related_model
+                    ids = list(related.objects.filter(**{rest: value}).values_list('pk', flat=True))
+                    if ids:
+                        matches |= Q(**{f'{relation}__in': ids})
+                else:
+                    matches |= Q(**{path: value})
+            if not matches:
+                return queryset.none(), False
+            queryset = queryset.filter(matches)
+        return queryset, False
+
+
+class ChartAdmin(LargeTableAdmin):
+    """Rows of one patient's chart."""
+    raw_id_fields = ('patient',)
+    list_select_related = ('patient',)
+    search_fields = ('id',) + PATIENT_SEARCH
+    ordering = ('-id',)
+
+
+class MaintainedAdmin(LargeTableAdmin):
+    """Tables the application writes itself: view only."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Patient)
+class PatientAdmin(LargeTableAdmin):
+    list_display = ('medical_record_number', 'first_name', 'last_name', 'date_of_birth', 'gender', 'created_at')
+    search_fields = ('id', 'medical_record_number')
+    ordering = ('-created_at',)
+    date_hierarchy = 'created_at'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Names ("jane sm") come from the in-process typeahead index
+        exact, _ = super().get_search_results(request, queryset, search_term)
+        if not search_term.strip():
+            return exact, False
+        names = autocomplete_index.lookup(search_term, PATIENT_NAME_MATCHES)
+        return exact | queryset.filter(pk__in=[pk for pk, _ in names]), False
+
+    def get_deleted_objects(self, objs, request):
+        # Row counts per table instead of Django's collector, which would
+        # load every row of every chart just to list it
+        ids = [obj.pk for obj in objs]
+        counts = {Patient: len(ids)}
+        for model in CHILDREN:
+            count = model.objects.filter(patient_id__in=ids).count()
+            if count:
+                counts[model] = count
+        perms_needed = {
+            model._meta.verbose_name for model in counts
+            if not request.user.has_perm(
+                f'{model._meta.app_label}.{get_permission_codename("delete", model._meta)}'
+            )
+        }
+        model_count = {model._meta.verbose_name_plural: count for model, count in counts.items()}
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        purge_patient(obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        for patient_id in queryset.values_list('pk', flat=True):
+            purge_patient(patient_id)
+
+
+@admin.register(MedicalRecord)
+class MedicalRecordAdmin(ChartAdmin):
+    list_display = ('id', 'patient', 'visit_date', 'doctor_name')
+
+
+@admin.register(Medication)
+class MedicationAdmin(ChartAdmin):
+    list_display = ('id', 'patient', 'medication_name', 'dosage', 'frequency', 'start_date', 'end_date', 'is_active')
+    list_filter = ('is_active',)
+
+
+@admin.register(VitalSign)
+class VitalSignAdmin(ChartAdmin):
+    list_display = (
+        'id', 'patient', 'recorded_at', 'heart_rate', 'blood_pressure_systolic',
+        'blood_pressure_diastolic', 'temperature', 'oxygen_saturation',
+    )
+
+
+@admin.register(Appointment)
+class AppointmentAdmin(ChartAdmin):
+    list_display = ('id', 'patient', 'appointment_date', 'department', 'doctor_name', 'status')
+    list_filter = ('status',)
+    ordering = ('-appointment_date',)
+    date_hierarchy = 'appointment_date'
+
+
+@admin.register(ScheduledDose)
+class ScheduledDoseAdmin(MaintainedAdmin):
+    list_display = ('due_at', 'patient', 'medication_name')
+    list_select_related = ('patient', 'medication')
+    raw_id_fields = ('patient', 'medication')
+    search_fields = ('medication',) + PATIENT_SEARCH
+    ordering = ('due_at',)
+    date_hierarchy = 'due_at'
+
+    @admin.display(description='medication')
+    def medication_name(self, obj):
+        return obj.medication.medication_name
+
+
+@admin.register(PatientLatestVitals)
+class PatientLatestVitalsAdmin(MaintainedAdmin):
+    list_display = (
+        'patient', 'recorded_at', 'heart_rate', 'blood_pressure_systolic',
+        'blood_pressure_diastolic', 'oxygen_saturation',
+    )
+    list_select_related = ('patient',)
+    raw_id_fields = ('patient',)
+    search_fields = PATIENT_SEARCH
+    ordering = ('-patient',)
+
+
+@admin.register(VitalSignBlock)
+class VitalSignBlockAdmin(MaintainedAdmin):
+    list_display = ('patient', 'hour_start', 'count')
+    list_select_related = ('patient',)
+    raw_id_fields = ('patient',)
+    search_fields = PATIENT_SEARCH
+    # The packed readings; see vitalstore.read_readings()
+    exclude = (
+        'offsets', 'heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+        'oxygen_saturation', 'temperature',
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(*self.exclude)
+
+
+@admin.register(VitalSignArchive)
+class VitalSignArchiveAdmin(MaintainedAdmin, ChartAdmin):
+    list_display = ('id', 'patient', 'recorded_at', 'heart_rate', 'archived_at')
+
+
+@admin.register(MedicalRecordArchive)
+class MedicalRecordArchiveAdmin(MaintainedAdmin, ChartAdmin):
+    list_display = ('id', 'patient', 'visit_date', 'doctor_name', 'archived_at')
+
+
+@admin.register(PatientBlockingKey)
+class PatientBlockingKeyAdmin(MaintainedAdmin):
+    list_display = ('patient', 'kind', 'key')
+    list_select_related = ('patient',)
+    list_filter = ('kind',)
+    raw_id_fields = ('patient',)
+    search_fields = PATIENT_SEARCH
+    ordering = ('-id',)
+
+
+@admin.register(AppointmentRollup)
+class AppointmentRollupAdmin(MaintainedAdmin):
+    list_display = ('day', 'department', 'doctor_name', 'status', 'count')
+    list_filter = ('status',)
+    search_fields = ('department',)
+    date_hierarchy = 'day'
+
+
+@admin.register(AccessLog)
+class AccessLogAdmin(MaintainedAdmin):
+    list_display = ('timestamp', 'actor', 'patient_id', 'resource', 'action', 'object_id', 'method', 'status_code')
+    search_fields = ('patient_id', 'actor')
+    ordering = ('-timestamp',)
+    date_hierarchy = 'timestamp'
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(MaintainedAdmin):
+    list_display = ('id', 'position', 'occurred_at', 'operation', 'resource', 'object_id', 'patient_id')
+    list_filter = ('operation',)
+    search_fields = ('id', 'position')
+    ordering = ('-id',)
+
+
+# Small tables: the stock changelist is fine
+
+@admin.register(ChangeConsumer)
+class ChangeConsumerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'offset', 'updated_at')
+
+
+@admin.register(ChangeFeedHead)
+class ChangeFeedHeadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'position')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'count', 'total_ms', 'max_ms', 'last_seen', 'sample_path')
+    search_fields = ('fingerprint', 'sql')
+
+    def has_add_permission(self, request):
+        return False
 
-# Register your models here.
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,95 @@
+# Hot/cold archival
+# Moves VitalSign and MedicalRecord rows older than EHR_ARCHIVE_HORIZON_DAYS
+# into VitalSignArchive / MedicalRecordArchive in batches, and back again.
+# Rows keep their IDs, so a restore puts them back exactly as they were.
+#
+# Each batch is an INSERT ... SELECT plus a DELETE by ID inside its own
+# transaction, so rows never pass through Python (timestamps are copied
+# verbatim) and the hot table is never locked for the whole run.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+from .models import MedicalRecord, MedicalRecordArchive, VitalSign, VitalSignArchive
+from .snapshots import rebuild_latest_vitals
+
+# hot model -> (archive model, date field)
+ARCHIVES = {
+    VitalSign: (VitalSignArchive, 'recorded_at'),
+    MedicalRecord: (MedicalRecordArchive, 'visit_date'),
+}
+
+
+def archive_horizon():
+    """Rows dated before this moment belong in the archive."""
+    days = getattr(settings, 'EHR_ARCHIVE_HORIZON_DAYS', 730)
+    return timezone.now() - timedelta(days=days)
+
+
+def insert_select(target, queryset, fields):
+    """INSERT the ``fields`` of every row in ``queryset`` into ``target``."""
+    sql, params = queryset.values(*fields).query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(target._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote(target._meta.db_table)} ({columns}) {sql}', params)
+
+
+def move_rows(source, target, queryset, batch_size):
+    """
+    Move the rows of ``queryset`` (over ``source``) into ``target`` in
+    batches. Yields the IDs moved in each batch.
+    """
+    target_fields = {field.attname for field in target._meta.concrete_fields}
+    fields = [
+        field.attname for field in source._meta.concrete_fields
+        if field.attname in target_fields
+    ]
+    if 'archived_at' in target_fields - set(fields):
+        fields.append('archived_at')
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            batch = source.objects.filter(pk__in=ids)
+            if 'archived_at' in fields:
+                batch = batch.annotate(
+                    archived_at=Value(timezone.now(), output_field=DateTimeField())
+                )
+            insert_select(target, batch, fields)
+            source.objects.filter(pk__in=ids)._raw_delete(connection.alias)
+        yield ids
+
+
+def archive_rows(model, before=None, batch_size=2000):
+    """Move ``model`` rows dated before ``before`` into the archive. Yields batch sizes."""
+    archive_model, date_field = ARCHIVES[model]
+    before = before or archive_horizon()
+    queryset = model.objects.filter(**{f'{date_field}__lt': before})
+    for ids in move_rows(model, archive_model, queryset, batch_size):
+        yield len(ids)
+
+
+def restore_rows(model, patient_id=None, since=None, batch_size=2000):
+    """
+    Move archived ``model`` rows back into the hot table, optionally only for
+    one patient or rows dated on/after ``since``. Yields batch sizes.
+    """
+    archive_model, date_field = ARCHIVES[model]
+    queryset = archive_model.objects.all()
+    if patient_id is not None:
+        queryset = queryset.filter(patient_id=patient_id)
+    if since is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    for ids in move_rows(archive_model, model, queryset, batch_size):
+        if model is VitalSign:
+            # Restored readings may be newer than the current snapshot
+            rebuild_latest_vitals(
+                model.objects.filter(pk__in=ids).values_list('patient_id', flat=True).distinct()
+            )
+        yield len(ids)
@@ -0,0 +1,146 @@
+# Access audit log
+# Requests append a tuple to an in-process bounded buffer; a background
+# thread turns the buffer into AccessLog rows with bulk_create whenever it
+# reaches AUDIT_LOG_BATCH_SIZE entries or AUDIT_LOG_FLUSH_INTERVAL seconds
+# have passed. Recording therefore never waits on the database.
+#
+# When the buffer is full, AUDIT_LOG_BACKPRESSURE decides what happens:
+#     'drop_oldest' - discard the oldest buffered entry (default)
+#     'drop_newest' - discard the entry being recorded
+#     'block'       - wait up to AUDIT_LOG_BLOCK_TIMEOUT seconds for room,
+#                     then drop the new entry
+# Dropped entries are counted in AuditBuffer.dropped and logged at flush time.
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import AccessLog
+
+logger = logging.getLogger(__name__)
+
+ENTRY_FIELDS = (
+    'timestamp', 'actor', 'patient_id', 'resource', 'action', 'object_id',
+    'method', 'status_code',
+)
+
+
+class AuditBuffer:
+    def __init__(self):
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+        self.flushed = 0
+        self._reported_dropped = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUDIT_LOG_BUFFER_SIZE', 10000)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 1.0)
+
+    def record(self, actor, patient_id, resource, action, object_id, method, status_code):
+        """Queue one audit entry. Never touches the database."""
+        if not getattr(settings, 'AUDIT_LOG_ENABLED', True):
+            return
+        if self._pid != os.getpid():
+            self._start()
+
+        entry = (timezone.now(), actor, patient_id, resource, action,
+                 object_id, method, status_code)
+        entries = self._entries
+        if len(entries) >= self.max_size:
+            entry = self._apply_backpressure(entry)
+            if entry is None:
+                return
+        entries.append(entry)
+        if len(entries) >= self.batch_size:
+            self._wakeup.set()
+
+    def _apply_backpressure(self, entry):
+        policy = getattr(settings, 'AUDIT_LOG_BACKPRESSURE', 'drop_oldest')
+        with self._lock:
+            if policy == 'block':
+                self._wakeup.set()
+                timeout = getattr(settings, 'AUDIT_LOG_BLOCK_TIMEOUT', 0.05)
+                if self._not_full.wait_for(
+                    lambda: len(self._entries) < self.max_size, timeout
+                ):
+                    return entry
+            elif policy == 'drop_oldest':
+                try:
+                    self._entries.popleft()
+                except IndexError:
+                    pass
+                self.dropped += 1
+                return entry
+            self.dropped += 1
+            return None
+
+    def _start(self):
+        # Also runs in forked workers, where the parent's thread is gone.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._entries.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='audit-log-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every buffered entry. Safe to call from any thread."""
+        if self._pid != os.getpid():
+            return 0
+        written = 0
+        try:
+            while self._entries:
+                batch = []
+                with self._lock:
+                    while self._entries and len(batch) < self.batch_size:
+                        batch.append(self._entries.popleft())
+                    self._not_full.notify_all()
+                AccessLog.objects.bulk_create(
+                    AccessLog(**dict(zip(ENTRY_FIELDS, entry))) for entry in batch
+                )
+                written += len(batch)
+        except Exception:
+            logger.exception('Failed to write audit log batch')
+        finally:
+            if threading.current_thread() is self._thread:
+                connection.close()
+        self.flushed += written
+        if self.dropped > self._reported_dropped:
+            logger.warning(
+                'Audit log buffer full: %d entries dropped since last flush',
+                self.dropped - self._reported_dropped,
+            )
+            self._reported_dropped = self.dropped
+        return written
+
+
+audit_log = AuditBuffer()
+atexit.register(audit_log.flush)
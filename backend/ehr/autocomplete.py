@@ -0,0 +1,325 @@
+# Patient typeahead index
+# An in-process prefix index over first names, last names and MRNs, so the
+# patient search box never touches the database while the user types.
+#
+# The index is a handful of flat arrays, not per-patient Python objects:
+#     terms      the distinct casefolded terms, sorted, packed into one
+#                UTF-8 buffer with an offsets array; prefix lookups bisect it
+#     postings   row numbers grouped by term (starts[i]:starts[i + 1] are
+#                the rows of terms[i]), in row order within a term
+#     row_terms  the term numbers of each row's first name, last name and MRN,
+#                so other words of "jane sm" are checked as integer ranges
+#     ids        patient IDs by row, sorted
+#     fields     each row's first name, last name, MRN and date of birth as
+#                numbers into one packed pool of distinct display strings
+# 1M patients take about 90MB, and lookups 0.3ms at p99 (see
+# `python manage.py benchmark_autocomplete`).
+#
+# A built PrefixIndex is never modified. Patient post_save/post_delete
+# signals record this process's writes in a small overlay that lookups merge
+# in. Writes made by other processes (other workers, management commands)
+# are picked up by a background rebuild every AUTOCOMPLETE_REBUILD_INTERVAL
+# seconds, or sooner once the overlay holds AUTOCOMPLETE_MAX_OVERLAY
+# patients; overlay entries written during a rebuild carry over to the new
+# index. Until the first build finishes, lookups fall back to the database.
+
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, count
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Patient
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = ('first_name', 'last_name', 'medical_record_number', 'date_of_birth')
+TERM_FIELDS = 3  # the first RECORD_FIELDS are searched
+NO_TERM = 0xFFFFFFFF  # row_terms entry for an empty name or MRN
+PREFIX_END = '\U0010ffff'.encode()  # sorts after every UTF-8 character
+SCAN_CHUNK = 256  # postings checked by a lookup's first step; each step doubles it
+
+
+def normalize_term(value):
+    return (value or '').strip().casefold()
+
+
+def make_record(record):
+    first_name, last_name, mrn, date_of_birth = record
+    if hasattr(date_of_birth, 'isoformat'):
+        date_of_birth = date_of_birth.isoformat()
+    return (first_name or '', last_name or '', mrn or '', date_of_birth or '')
+
+
+def record_terms(record):
+    return [normalize_term(value) for value in record[:TERM_FIELDS]]
+
+
+def overlay_entry(record):
+    """(record, searchable) for the overlay; searchable is '\\0'-prefixed terms."""
+    record = make_record(record)
+    return record, ''.join('\0' + term for term in record_terms(record))
+
+
+class PackedStrings:
+    """A list of strings stored as one UTF-8 buffer; items are bytes."""
+
+    def __init__(self, strings):
+        encoded = [string.encode() for string in strings]
+        self.offsets = array('Q', accumulate(map(len, encoded), initial=0))
+        self.data = b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return self.data[self.offsets[position]:self.offsets[position + 1]]
+
+    def text(self, position):
+        return self[position].decode()
+
+    @property
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+
+class PrefixIndex:
+    @classmethod
+    def build(cls, rows):
+        """Build from (id, first_name, last_name, mrn, date_of_birth) rows."""
+        import numpy as np  # on first use, as in views.py
+
+        index = cls()
+        rows = sorted(rows, key=lambda row: row[0])
+        index.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+        # Distinct display strings, numbered in order of appearance
+        pool = {}
+        index.fields = np.fromiter((
+            pool.setdefault(value, len(pool))
+            for _, *record in rows for value in make_record(record)
+        ), dtype=np.uint32, count=len(RECORD_FIELDS) * len(rows))
+        index.values = PackedStrings(pool)
+        del pool
+
+        # Distinct terms, numbered in order of appearance and then renumbered
+        # in sorted order (NO_TERM stays last)
+        numbers = {}
+        row_terms = np.fromiter((
+            numbers.setdefault(term, len(numbers)) if term else NO_TERM
+            for _, *record in rows for term in record_terms(make_record(record))
+        ), dtype=np.uint32, count=TERM_FIELDS * len(rows)).reshape(-1, TERM_FIELDS)
+        del rows
+        terms = sorted(numbers)
+        renumber = np.empty(len(terms) + 1, dtype=np.uint32)
+        renumber[np.fromiter((numbers[term] for term in terms), dtype=np.int64, count=len(terms))] = np.arange(len(terms))
+        del numbers
+        index.terms = PackedStrings(terms)
+        del terms
+        renumber[-1] = NO_TERM
+        row_terms[row_terms == NO_TERM] = len(index.terms)
+        index.row_terms = renumber[row_terms]
+        del row_terms, renumber
+
+        # Rows per term, each row once per term, in row order within a term
+        flat = index.row_terms.ravel()
+        rows = np.repeat(np.arange(len(index.ids), dtype=np.uint32), TERM_FIELDS)
+        repeated = np.zeros_like(flat, dtype=bool)
+        for field in range(1, TERM_FIELDS):
+            repeated[field::TERM_FIELDS] = (index.row_terms[:, :field] == index.row_terms[:, field:field + 1]).any(axis=1)
+        keep = (flat != NO_TERM) & ~repeated
+        flat, rows = flat[keep], rows[keep]
+        order = np.argsort(flat, kind='stable')
+        index.postings = rows[order]
+        index.starts = np.zeros(len(index.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat, minlength=len(index.terms)), out=index.starts[1:])
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        arrays = (self.ids, self.fields, self.row_terms, self.starts, self.postings)
+        return self.values.nbytes + self.terms.nbytes + sum(a.nbytes for a in arrays)
+
+    def record(self, row):
+        start = len(RECORD_FIELDS) * row
+        return tuple(self.values.text(value) for value in self.fields[start:start + len(RECORD_FIELDS)])
+
+    def term_range(self, prefix):
+        """Numbers of the terms starting with ``prefix``, as (start, end)."""
+        prefix = prefix.encode()
+        start = bisect_left(self.terms, prefix)
+        return start, bisect_left(self.terms, prefix + PREFIX_END, start)
+
+    def lookup(self, query, limit=10, overlay=None):
+        """
+        Return up to ``limit`` (id, record) pairs whose terms match every
+        word, ordered by matching term, then ID. ``overlay`` maps IDs written
+        since the build to their current overlay_entry(), or to None once
+        deleted; it replaces those patients' rows.
+        """
+        import numpy as np
+
+        tokens = set(normalize_term(query).split())
+        if not tokens:
+            return []
+        overlay = overlay or {}
+        ranges = {token: self.term_range(token) for token in tokens}
+        # Walk the postings of the word with the fewest, checking the other
+        # words' term ranges a chunk of rows at a time
+        sizes = {token: self.starts[end] - self.starts[start] for token, (start, end) in ranges.items()}
+        scan_token = min(tokens, key=lambda token: (sizes[token], token))
+        others = [ranges[token] for token in tokens if token != scan_token]
+        start, end = ranges[scan_token]
+        first, last = int(self.starts[start]), int(self.starts[end])
+
+        matches = []
+        seen = set()
+        chunk, size = first, SCAN_CHUNK
+        while chunk < last:
+            rows = self.postings[chunk:min(chunk + size, last)]
+            positions = np.arange(chunk, chunk + len(rows))
+            chunk, size = chunk + size, size * 2
+            if others:
+                terms = self.row_terms[rows]
+                wanted = np.ones(len(rows), dtype=bool)
+                for low, high in others:
+                    # low <= term < high as one unsigned comparison
+                    hits = terms - np.uint32(low) < np.uint32(high - low)
+                    wanted &= hits[:, 0] | hits[:, 1] | hits[:, 2]
+                rows, positions = rows[wanted], positions[wanted]
+            for row, position in zip(rows.tolist(), positions.tolist()):
+                pk = int(self.ids[row])
+                if row in seen or pk in overlay:
+                    continue
+                seen.add(row)
+                matches.append((position, pk, row))
+                if len(matches) >= limit:
+                    break
+            if len(matches) >= limit:
+                break
+        term_numbers = np.searchsorted(self.starts, [position for position, _, _ in matches], side='right') - 1
+        results = [
+            (self.terms.text(term), pk, self.record(row))
+            for term, (_, pk, row) in zip(term_numbers.tolist(), matches)
+        ]
+
+        markers = ['\0' + token for token in tokens]
+        for pk, entry in overlay.items():
+            if entry is not None and all(marker in entry[1] for marker in markers):
+                term = min(term for term in entry[1].split('\0') if term.startswith(scan_token))
+                results.append((term, pk, entry[0]))
+        results.sort(key=lambda result: result[:2])
+        return [(pk, record) for _, pk, record in results[:limit]]
+
+
+class AutocompleteIndex:
+    """Process-wide PrefixIndex, its overlay of local writes and background (re)builds."""
+
+    def __init__(self):
+        self.index = None
+        self.built_at = 0.0
+        self.overlay = {}  # id -> overlay_entry() or None; replaced, never mutated
+        self._written = {}  # id -> sequence of its overlay entry
+        self._sequence = count(1)
+        self._building = threading.Lock()
+        self._swap_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A build running in the parent does not exist in the child
+        self._building = threading.Lock()
+        self._swap_lock = threading.Lock()
+
+    @property
+    def rebuild_interval(self):
+        return getattr(settings, 'AUTOCOMPLETE_REBUILD_INTERVAL', 900)
+
+    @property
+    def max_overlay(self):
+        return getattr(settings, 'AUTOCOMPLETE_MAX_OVERLAY', 1000)
+
+    def ensure_fresh(self):
+        stale = time.monotonic() - self.built_at > self.rebuild_interval or len(self.overlay) > self.max_overlay
+        if (self.index is None or stale) and self._building.acquire(blocking=False):
+            threading.Thread(target=self._build, name='autocomplete-index', daemon=True).start()
+
+    def _build(self):
+        try:
+            started = time.perf_counter()
+            sequence = next(self._sequence)
+            rows = Patient.objects.order_by().values_list('pk', *RECORD_FIELDS)
+            index = PrefixIndex.build(rows.iterator(chunk_size=10000))
+            self.swap(index, sequence)
+            logger.info('Built autocomplete index for %d patients (%.0fMB) in %.2fs',
+                        len(index), index.nbytes / 2 ** 20, time.perf_counter() - started)
+        except Exception:
+            logger.exception('Failed to build autocomplete index')
+        finally:
+            connection.close()
+            self._building.release()
+
+    def swap(self, index, sequence=0):
+        """
+        Serve ``index``. Overlay entries written after ``sequence`` (taken
+        before the index's rows were read) may be missing from it and stay.
+        """
+        with self._swap_lock:
+            self._written = {pk: written for pk, written in self._written.items() if written > sequence}
+            self.overlay = {pk: self.overlay[pk] for pk in self._written}
+            self.index = index
+            self.built_at = time.monotonic()
+
+    def apply(self, pk, record):
+        """Add/replace (record) or remove (record=None) one patient."""
+        entry = None if record is None else overlay_entry(record)
+        with self._swap_lock:
+            self._written[pk] = next(self._sequence)
+            self.overlay = {**self.overlay, pk: entry}
+
+    def lookup(self, query, limit=10):
+        if not query.strip():
+            return []
+        self.ensure_fresh()
+        index = self.index
+        if index is None:
+            return self.lookup_database(query, limit)
+        return index.lookup(query, limit, self.overlay)
+
+    def lookup_database(self, query, limit):
+        patients = Patient.objects.order_by('last_name', 'first_name')
+        for token in query.split():
+            patients = patients.filter(
+                Q(first_name__istartswith=token) | Q(last_name__istartswith=token)
+                | Q(medical_record_number__istartswith=token)
+            )
+        return [
+            (pk, make_record(record))
+            for pk, *record in patients.values_list('pk', *RECORD_FIELDS)[:limit]
+        ]
+
+    def patient_saved(self, sender, instance, raw=False, **kwargs):
+        if not raw:
+            record = [getattr(instance, field) for field in RECORD_FIELDS]
+            transaction.on_commit(lambda: self.apply(instance.pk, record))
+
+    def patient_deleted(self, sender, instance, **kwargs):
+        pk = instance.pk
+        transaction.on_commit(lambda: self.apply(pk, None))
+
+    def refresh(self, patient_ids):
+        """Re-read ``patient_ids`` after bulk updates that bypass signals."""
+        rows = Patient.objects.filter(pk__in=patient_ids).values_list('pk', *RECORD_FIELDS)
+        for pk, *record in rows:
+            transaction.on_commit(lambda pk=pk, record=record: self.apply(pk, record))
+
+
+autocomplete_index = AutocompleteIndex()
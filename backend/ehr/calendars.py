@@ -0,0 +1,182 @@
+# Appointment calendar
+# Day and week views of every appointment in a date window, optionally for
+# one department or doctor, read through the (appointment_date, department)
+# index with the patient's name joined in: one query, no model instances.
+#
+# Windows are cached for APPOINTMENT_CALENDAR_CACHE_TIMEOUT seconds. Every
+# day has a version in the cache, bumped on commit when an appointment on
+# that day is saved or deleted, and a window's key includes the versions of
+# its days, so a booking only invalidates the windows that contain its day. Bulk changes
+# bump a generation that every key includes. Versions start at a timestamp,
+# so an evicted version never brings an old window back. Windows show
+# patient names, so renaming a patient bumps the generation too.
+#
+# The default cache is per process: other workers see a change only when
+# their copy expires. Configure a shared cache (CACHES) in production.
+
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import record_cache_lookup
+from .models import Appointment
+
+CACHE_PREFIX = 'ehr:calendar:'
+GENERATION_KEY = CACHE_PREFIX + 'generation'
+ROW_FIELDS = (
+    'pk', 'appointment_date', 'patient_id', 'patient__first_name', 'patient__last_name',
+    'doctor_name', 'department', 'status', 'reason',
+)
+NAME_FIELDS = ('first_name', 'last_name')
+
+
+def cache_timeout():
+    return getattr(settings, 'APPOINTMENT_CALENDAR_CACHE_TIMEOUT', 60)
+
+
+def local_day(value):
+    value = Appointment._meta.get_field('appointment_date').to_python(value)
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def day_key(day):
+    return f'{CACHE_PREFIX}day:{day.isoformat()}'
+
+
+def versions(keys):
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:  # evicted or never read
+            cache.set(key, time.time_ns(), None)
+
+
+def window_key(start, end, department, doctor):
+    days = [start + timedelta(days=n) for n in range((end - start).days)]
+    keys = [GENERATION_KEY] + [day_key(day) for day in days]
+    state = [start.isoformat(), end.isoformat(), department, doctor, versions(keys)]
+    return CACHE_PREFIX + 'window:' + hashlib.sha1(json.dumps(state).encode()).hexdigest()
+
+
+def timestamp(value, tz):
+    """``value`` as AppointmentSerializer renders it: local time, ISO 8601."""
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def build_calendar(start, end, department=None, doctor=None):
+    """[{'date', 'appointments'}] for every day in [start, end), in local time."""
+    appointments = Appointment.objects.filter(
+        appointment_date__gte=timezone.make_aware(datetime.combine(start, dt_time.min)),
+        appointment_date__lt=timezone.make_aware(datetime.combine(end, dt_time.min)),
+    )
+    if department:
+        appointments = appointments.filter(department=department)
+    if doctor:
+        appointments = appointments.filter(doctor_name=doctor)
+
+    tz = timezone.get_current_timezone()
+    days = {start + timedelta(days=n): [] for n in range((end - start).days)}
+    rows = appointments.order_by('appointment_date', 'pk').values_list(*ROW_FIELDS)
+    for pk, when, patient_id, first_name, last_name, doctor_name, department_name, status, reason in rows:
+        when = when.astimezone(tz)
+        days[when.date()].append({
+            'id': pk,
+            'appointment_date': timestamp(when, tz),
+            'patient': patient_id,
+            'patient_name': f'{first_name} {last_name}',
+            'doctor_name': doctor_name,
+            'department': department_name,
+            'status': status,
+            'reason': reason,
+        })
+    return [{'date': day.isoformat(), 'appointments': items} for day, items in days.items()]
+
+
+def calendar_json(start, end, department=None, doctor=None, refresh=False):
+    """
+    The encoded response body for a window, from the cache when it is still
+    current; refresh=True always queries. The body is cached rather than the
+    rows because encoding a full week costs about as much as reading it.
+    """
+    key = window_key(start, end, department, doctor)
+    if not refresh:
+        body = cache.get(key)
+        record_cache_lookup('calendar', body is not None)
+        if body is not None:
+            return body
+    body = json.dumps({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'department': department,
+        'doctor': doctor,
+        'days': build_calendar(start, end, department, doctor),
+    }).encode()
+    cache.set(key, body, cache_timeout())
+    return body
+
+
+def invalidate_days(days):
+    """Drop cached windows containing any of ``days`` once the change commits."""
+    keys = [day_key(day) for day in days]
+    transaction.on_commit(lambda: bump(keys))
+
+
+def invalidate_all():
+    """Drop every cached window once the change commits (bulk changes)."""
+    transaction.on_commit(lambda: bump([GENERATION_KEY]))
+
+
+# Signal handlers, connected in EhrConfig.ready()
+
+def appointment_pre_save(sender, instance, raw=False, **kwargs):
+    # The day the appointment is moving away from; None when it is new
+    instance._calendar_old_day = None
+    if raw or instance._state.adding:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'appointment_date' in loaded:
+        instance._calendar_old_day = local_day(loaded['appointment_date'])
+    else:
+        # Previous date unknown (deferred field, hand-built instance)
+        invalidate_all()
+
+
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    days = {local_day(instance.appointment_date)}
+    old_day = getattr(instance, '_calendar_old_day', None)
+    if old_day is not None:
+        days.add(old_day)
+    invalidate_days(days)
+
+
+def appointment_deleted(sender, instance, **kwargs):
+    invalidate_days({local_day(instance.appointment_date)})
+
+
+def patient_saved(sender, instance, created, raw=False, **kwargs):
+    # A new patient has no appointments yet
+    if raw or created:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if any(field not in loaded or loaded[field] != getattr(instance, field) for field in NAME_FIELDS):
+        invalidate_all()
@@ -0,0 +1,251 @@
+# Cohort query engine
+# Compiles a structured filter tree into a single Patient query built from
+# Exists() subqueries, and caches cohort membership as patient-ID bitmaps so
+# repeated and combined cohorts can be answered without touching the database.
+#
+# Filter tree grammar:
+#     {"and": [node, ...]}
+#     {"or": [node, ...]}
+#     {"not": node}
+#     {"diagnosis": {"contains": "diabetes", "within_days": 365}}
+#     {"medication": {"name": "Metformin", "active": true}}
+#     {"vital": {"field": "blood_pressure_systolic", "gt": 140, "within_days": 90}}
+#     {"patient": {"gender": "F", "blood_type": "O-", "age_gte": 40, "age_lte": 65}}
+#
+# Example: patients on Metformin with systolic >140 in the last 90 days
+#     {"and": [
+#         {"medication": {"name": "Metformin", "active": true}},
+#         {"vital": {"field": "blood_pressure_systolic", "gt": 140, "within_days": 90}}
+#     ]}
+
+import hashlib
+import json
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Patient, MedicalRecord, Medication, VitalSign
+from .metrics import record_cache_lookup
+
+CACHE_PREFIX = 'cohort:'
+UNIVERSE_KEY = CACHE_PREFIX + 'all-patients'
+
+BOOLEAN_OPERATORS = ('and', 'or', 'not')
+VITAL_FIELDS = (
+    'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate',
+    'temperature', 'weight', 'height', 'oxygen_saturation',
+)
+COMPARISONS = ('gt', 'gte', 'lt', 'lte')
+
+
+class InvalidCohortFilter(ValueError):
+    pass
+
+
+def cache_timeout():
+    return getattr(settings, 'COHORT_CACHE_TIMEOUT', 300)
+
+
+# Bitmaps
+# Bit N is set when patient N is in the cohort. Python ints give us compact
+# storage and fast &, | and ~ for combining cohorts.
+
+def ids_to_bitmap(ids):
+    ids = np.fromiter(ids, dtype=np.int64)
+    if not len(ids):
+        return 0
+    bits = np.zeros(int(ids.max()) + 1, dtype=bool)
+    bits[ids] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+def bitmap_to_ids(bitmap):
+    if not bitmap:
+        return []
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder='little')
+    return np.flatnonzero(bits).tolist()
+
+
+# Compilation
+
+def node_key(node):
+    canonical = json.dumps(node, sort_keys=True, separators=(',', ':'))
+    return CACHE_PREFIX + hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def parse_node(node):
+    if not isinstance(node, dict) or len(node) != 1:
+        raise InvalidCohortFilter('Each filter node must be an object with exactly one key.')
+    kind, spec = next(iter(node.items()))
+    if kind in ('and', 'or'):
+        if not isinstance(spec, list) or not spec:
+            raise InvalidCohortFilter(f'"{kind}" expects a non-empty list of filters.')
+    elif kind != 'not' and not isinstance(spec, dict):
+        raise InvalidCohortFilter(f'"{kind}" expects an object.')
+    return kind, spec
+
+
+def days_ago(spec, key='within_days'):
+    days = spec.get(key)
+    if days is None:
+        return None
+    if not isinstance(days, int) or days < 0:
+        raise InvalidCohortFilter(f'"{key}" must be a non-negative integer.')
+    return timezone.now() - timedelta(days=days)
+
+
+def compile_diagnosis(spec):
+    if not spec.get('contains'):
+        raise InvalidCohortFilter('"diagnosis" requires "contains".')
+    records = MedicalRecord.objects.filter(
+        patient=OuterRef('pk'), diagnosis__icontains=spec['contains']
+    )
+    since = days_ago(spec)
+    if since is not None:
+        records = records.filter(visit_date__gte=since)
+    return Q(Exists(records))
+
+
+def compile_medication(spec):
+    if not spec.get('name'):
+        raise InvalidCohortFilter('"medication" requires "name".')
+    medications = Medication.objects.filter(
+        patient=OuterRef('pk'), medication_name__iexact=spec['name']
+    )
+    if 'active' in spec:
+        medications = medications.filter(is_active=bool(spec['active']))
+    return Q(Exists(medications))
+
+
+def compile_vital(spec):
+    field = spec.get('field')
+    if field not in VITAL_FIELDS:
+        raise InvalidCohortFilter(f'"vital.field" must be one of: {", ".join(VITAL_FIELDS)}.')
+    ranges = {f'{field}__{op}': spec[op] for op in COMPARISONS if op in spec}
+    if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in ranges.values()):
+        raise InvalidCohortFilter('"vital" comparisons must be numbers.')
+    if not ranges:
+        raise InvalidCohortFilter(f'"vital" requires at least one of: {", ".join(COMPARISONS)}.')
+    vitals = VitalSign.objects.filter(patient=OuterRef('pk'), **ranges)
+    since = days_ago(spec)
+    if since is not None:
+        vitals = vitals.filter(recorded_at__gte=since)
+    return Q(Exists(vitals))
+
+
+def age_limit(spec, key):
+    years = spec[key]
+    if not isinstance(years, int) or years < 0:
+        raise InvalidCohortFilter(f'"{key}" must be a non-negative integer.')
+    return years
+
+
+def years_ago(years):
+    today = date.today()
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # 29 February
+        return today.replace(year=today.year - years, day=28)
+
+
+def compile_patient(spec):
+    q = Q()
+    for field in ('gender', 'blood_type'):
+        if field in spec:
+            q &= Q(**{field: spec[field]})
+    if 'age_gte' in spec:
+        q &= Q(date_of_birth__lte=years_ago(age_limit(spec, 'age_gte')))
+    if 'age_lte' in spec:
+        q &= Q(date_of_birth__gt=years_ago(age_limit(spec, 'age_lte') + 1))
+    if not q:
+        raise InvalidCohortFilter('"patient" requires at least one demographic filter.')
+    return q
+
+
+LEAF_COMPILERS = {
+    'diagnosis': compile_diagnosis,
+    'medication': compile_medication,
+    'vital': compile_vital,
+    'patient': compile_patient,
+}
+
+
+def compile_filter(node):
+    """Compile a filter tree into a Q object over Patient."""
+    kind, spec = parse_node(node)
+    if kind == 'and':
+        q = Q()
+        for child in spec:
+            q &= compile_filter(child)
+        return q
+    if kind == 'or':
+        q = Q()
+        for child in spec:
+            q |= compile_filter(child)
+        return q
+    if kind == 'not':
+        return ~compile_filter(spec)
+    if kind not in LEAF_COMPILERS:
+        raise InvalidCohortFilter(f'Unknown filter "{kind}".')
+    return LEAF_COMPILERS[kind](spec)
+
+
+# Resolution
+
+def all_patients_bitmap():
+    bitmap = cache.get(UNIVERSE_KEY)
+    if bitmap is None:
+        bitmap = ids_to_bitmap(Patient.objects.values_list('pk', flat=True).iterator())
+        cache.set(UNIVERSE_KEY, bitmap, cache_timeout())
+    return bitmap
+
+
+def combine_cached(kind, spec):
+    """
+    Combine the cached bitmaps of a boolean node's children, or return None
+    if any child has to be queried.
+    """
+    children = [spec] if kind == 'not' else spec
+    bitmaps = [cache.get(node_key(child)) for child in children]
+    if any(bitmap is None for bitmap in bitmaps):
+        return None
+    if kind == 'not':
+        return all_patients_bitmap() & ~bitmaps[0]
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        result = result & bitmap if kind == 'and' else result | bitmap
+    return result
+
+
+def resolve_cohort(node, refresh=False):
+    """
+    Return (bitmap, from_cache) for a filter tree.
+
+    Whole trees and boolean combinations of already cached cohorts are
+    answered in memory; anything else runs as a single query.
+    """
+    compile_filter(node)  # validate before touching the cache
+    key = node_key(node)
+    if not refresh:
+        bitmap = cache.get(key)
+        if bitmap is not None:
+            record_cache_lookup('cohorts', hit=True)
+            return bitmap, True
+        kind, spec = parse_node(node)
+        if kind in BOOLEAN_OPERATORS:
+            bitmap = combine_cached(kind, spec)
+            if bitmap is not None:
+                cache.set(key, bitmap, cache_timeout())
+                record_cache_lookup('cohorts', hit=True)
+                return bitmap, True
+        record_cache_lookup('cohorts', hit=False)
+
+    ids = Patient.objects.filter(compile_filter(node)).values_list('pk', flat=True)
+    bitmap = ids_to_bitmap(ids.order_by().iterator())
+    cache.set(key, bitmap, cache_timeout())
+    return bitmap, False
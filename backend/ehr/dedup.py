@@ -0,0 +1,313 @@
+# Duplicate-patient detection
+# Comparing every pair of patients is quadratic, so each patient gets a few
+# blocking keys (PatientBlockingKey) and only patients that share a key are
+# compared:
+#     last_name_dob   Soundex(last name) + date of birth
+#     first_name_dob  Soundex(first name) + date of birth (catches surname changes)
+#     phone           last 10 digits of the phone number
+#     email           lower-cased email address
+#
+# Candidate pairs are scored with Jaro-Winkler similarity on names plus
+# date of birth, phone and email agreement. Pairs scoring at least
+# DEDUP_MATCH_THRESHOLD are reported. Blocks larger than DEDUP_MAX_BLOCK_SIZE
+# (a shared clinic phone number, say) are skipped because they carry no
+# signal and would dominate the run time.
+#
+# Keys are refreshed by a Patient post_save handler; the find_duplicates
+# command runs the full comparison in parallel. It sends blocks, not pairs,
+# to the workers, which expand them: a pair sharing several blocks is
+# compared only in the first (block_pairs), so the candidate pairs, which
+# outnumber the patients many times over, are never all held at once.
+
+import logging
+import re
+import unicodedata
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Q
+from django.utils.dateparse import parse_date
+
+from .models import Patient, PatientBlockingKey
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = ('first_name', 'last_name', 'date_of_birth', 'phone', 'email')
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'), 'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+WEIGHTS = {'last_name': 0.3, 'first_name': 0.2, 'date_of_birth': 0.3, 'phone': 0.1, 'email': 0.1}
+
+
+def match_threshold():
+    return getattr(settings, 'DEDUP_MATCH_THRESHOLD', 0.85)
+
+
+def max_block_size():
+    return getattr(settings, 'DEDUP_MAX_BLOCK_SIZE', 1000)
+
+
+# Normalization
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return re.sub(r'[^a-z]', '', decomposed.encode('ascii', 'ignore').decode().lower())
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def soundex(name):
+    name = normalize_name(name)
+    if not name:
+        return ''
+    code = name[0].upper()
+    previous = SOUNDEX_CODES.get(name[0])
+    for letter in name[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def blocking_keys(first_name, last_name, date_of_birth, phone, email):
+    """Return {kind: key} for one patient; empty values produce no key."""
+    dob = date_of_birth.isoformat() if hasattr(date_of_birth, 'isoformat') else str(date_of_birth or '')
+    keys = {}
+    if dob:
+        if soundex(last_name):
+            keys['last_name_dob'] = f'{soundex(last_name)}:{dob}'
+        if soundex(first_name):
+            keys['first_name_dob'] = f'{soundex(first_name)}:{dob}'
+    if normalize_phone(phone):
+        keys['phone'] = normalize_phone(phone)
+    if normalize_email(email):
+        keys['email'] = normalize_email(email)
+    return keys
+
+
+# Scoring
+
+def jaro_winkler(a, b):
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    a_matched = [False] * len(a)
+    b_matched = [False] * len(b)
+    matches = 0
+    for i, letter in enumerate(a):
+        for j in range(max(0, i - window), min(i + window + 1, len(b))):
+            if not b_matched[j] and b[j] == letter:
+                a_matched[i] = b_matched[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    a_letters = [letter for letter, hit in zip(a, a_matched) if hit]
+    b_letters = [letter for letter, hit in zip(b, b_matched) if hit]
+    transpositions = sum(x != y for x, y in zip(a_letters, b_letters)) / 2
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+def dob_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if (a.year, a.month, a.day) == (b.year, b.day, b.month):
+        return 0.8  # day and month swapped
+    same = (a.year == b.year) + (a.month == b.month) + (a.day == b.day)
+    return 0.5 if same == 2 else 0.0
+
+
+def field_getter(patient):
+    if isinstance(patient, dict):
+        return patient.get
+    return lambda name: getattr(patient, name, None)
+
+
+def comparable(patient):
+    """Normalized tuple used for scoring, from a Patient or a dict of fields."""
+    get = field_getter(patient)
+    date_of_birth = get('date_of_birth')
+    if isinstance(date_of_birth, str):
+        date_of_birth = parse_date(date_of_birth)
+    return (
+        normalize_name(get('first_name')), normalize_name(get('last_name')),
+        date_of_birth, normalize_phone(get('phone')), normalize_email(get('email')),
+    )
+
+
+def score_pair(a, b):
+    """
+    Score two comparable() tuples. Returns (score, matched fields). Phone
+    and email only count when both sides have one.
+    """
+    first = jaro_winkler(a[0], b[0])
+    last = jaro_winkler(a[1], b[1])
+    dob = dob_similarity(a[2], b[2])
+    parts = {'first_name': first, 'last_name': last, 'date_of_birth': dob}
+    if a[3] and b[3]:
+        parts['phone'] = float(a[3] == b[3])
+    if a[4] and b[4]:
+        parts['email'] = float(a[4] == b[4])
+    total_weight = sum(WEIGHTS[name] for name in parts)
+    score = sum(WEIGHTS[name] * value for name, value in parts.items()) / total_weight
+    matched = [name for name, value in parts.items() if value >= 0.9]
+    return round(score, 4), matched
+
+
+# Key maintenance
+
+def key_rows(patient_id, values):
+    return [
+        PatientBlockingKey(patient_id=patient_id, kind=kind, key=key)
+        for kind, key in blocking_keys(*values).items()
+    ]
+
+
+def refresh_blocking_keys(patient):
+    with transaction.atomic():
+        PatientBlockingKey.objects.filter(patient_id=patient.pk).delete()
+        PatientBlockingKey.objects.bulk_create(
+            key_rows(patient.pk, [getattr(patient, field) for field in KEY_FIELDS])
+        )
+
+
+def rebuild_blocking_keys(patient_ids=None, batch_size=5000):
+    """Recompute keys for ``patient_ids`` (or every patient). Returns rows written."""
+    patients = Patient.objects.order_by()
+    keys = PatientBlockingKey.objects.all()
+    if patient_ids is not None:
+        patient_ids = list(patient_ids)
+        patients = patients.filter(pk__in=patient_ids)
+        keys = keys.filter(patient_id__in=patient_ids)
+    written = 0
+    with transaction.atomic():
+        keys._raw_delete(keys.db)
+        batch = []
+        for patient_id, *values in patients.values_list('pk', *KEY_FIELDS).iterator():
+            batch.extend(key_rows(patient_id, values))
+            if len(batch) >= batch_size:
+                written += len(PatientBlockingKey.objects.bulk_create(batch))
+                batch = []
+        written += len(PatientBlockingKey.objects.bulk_create(batch))
+    return written
+
+
+def patient_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_blocking_keys(instance)
+
+
+# Matching
+
+def possible_duplicates(values, exclude_id=None, limit=10):
+    """
+    Existing patients that look like the patient described by ``values``
+    (a Patient or dict of fields), best first. Only patients sharing a
+    blocking key are loaded, so this stays fast on large registries.
+    """
+    keys = blocking_keys(*[field_getter(values)(field) for field in KEY_FIELDS])
+    if not keys:
+        return []
+    in_small_block = Q()
+    for kind, key in keys.items():
+        block = PatientBlockingKey.objects.filter(kind=kind, key=key).order_by()
+        # Oversized blocks are skipped, as in candidate_blocks(); the check
+        # probes the row just past the limit rather than counting the block
+        in_small_block |= Q(kind=kind, key=key) & ~Exists(block[max_block_size():])
+    candidate_ids = set(
+        PatientBlockingKey.objects.filter(in_small_block).values_list('patient_id', flat=True)
+    )
+    candidate_ids.discard(exclude_id)
+
+    target = comparable(values)
+    matches = []
+    for patient in Patient.objects.filter(pk__in=candidate_ids).only('pk', 'medical_record_number', *KEY_FIELDS):
+        score, matched = score_pair(target, comparable(patient))
+        if score >= match_threshold():
+            matches.append({'patient': patient, 'score': score, 'matched_fields': matched})
+    matches.sort(key=lambda match: -match['score'])
+    return matches[:limit]
+
+
+def candidate_blocks():
+    """Yield the patient IDs of every block with 2..DEDUP_MAX_BLOCK_SIZE members."""
+    rows = PatientBlockingKey.objects.order_by('kind', 'key').values_list('kind', 'key', 'patient_id')
+    current, members = None, []
+    for kind, key, patient_id in rows.iterator(chunk_size=10000):
+        if (kind, key) != current:
+            yield from check_block(current, members)
+            current, members = (kind, key), []
+        members.append(patient_id)
+    yield from check_block(current, members)
+
+
+def check_block(block, members):
+    if len(members) > max_block_size():
+        logger.info('Skipping oversized block %s with %d patients', block, len(members))
+    elif len(members) > 1:
+        yield members
+
+
+def block_memberships(blocks):
+    """{patient id: [block number, ...]} for a list of blocks (lists of IDs)."""
+    memberships = {}
+    for number, members in enumerate(blocks):
+        for patient_id in members:
+            memberships.setdefault(patient_id, []).append(number)
+    return memberships
+
+
+def block_pairs(number, members, memberships):
+    """
+    Pairs (low id, high id) of block ``number`` that share no earlier block.
+    A pair sharing several keys is thus compared once, in the first block
+    both are in, without remembering every pair seen.
+    """
+    for a, b in combinations(sorted(members), 2):
+        later = memberships[b]
+        if next(shared for shared in memberships[a] if shared in later) == number:
+            yield a, b
+
+
+def score_pairs(pairs, records, threshold):
+    """
+    Score (id, id) pairs using ``records`` ({id: comparable tuple}) and keep
+    those at or above ``threshold``. Pure Python, so it runs in worker
+    processes without database access.
+    """
+    results = []
+    for a, b in pairs:
+        score, matched = score_pair(records[a], records[b])
+        if score >= threshold:
+            results.append((a, b, score, matched))
+    return results
+
+
+def score_blocks(blocks, records, memberships, threshold):
+    """
+    Score the pairs of ``blocks`` ([(number, member IDs)]) as score_pairs()
+    does. Returns (matches, pairs compared); runs in worker processes too.
+    """
+    pairs = [pair for number, members in blocks for pair in block_pairs(number, members, memberships)]
+    return score_pairs(pairs, records, threshold), len(pairs)
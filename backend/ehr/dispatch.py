@@ -0,0 +1,143 @@
+# Internal request dispatch
+# Runs an API view for a relative URL inside the current process, without
+# going through HTTP or the middleware stack. Used by the batch endpoints.
+#
+# dispatch_gets() runs independent GETs on a few threads at once (not on
+# SQLite, where that only adds overhead). Each thread has its own database
+# connection (opened on first use, closed when the thread is done) and a
+# copy of the request's context, so the current timezone and the request's
+# query count in the metrics carry over. A view that raises fails only its
+# own sub-request, with a 500.
+
+import io
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/'
+
+# Headers copied from the outer request so sub-requests run as the same user
+FORWARDED_META = (
+    'HTTP_AUTHORIZATION', 'HTTP_COOKIE', 'HTTP_HOST', 'HTTP_ACCEPT_LANGUAGE',
+    'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL',
+)
+
+
+class SubrequestError(ValueError):
+    pass
+
+
+def build_subrequest(parent, method, path, body=None):
+    """Build a Django request for ``path`` that inherits the parent's identity."""
+    path, _, query_string = path.partition('?')
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        key: parent.META[key] for key in FORWARDED_META if key in parent.META
+    }
+    environ.update({
+        'REQUEST_METHOD': method.upper(),
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': parent.scheme,
+    })
+    environ.setdefault('SERVER_NAME', 'localhost')
+    environ.setdefault('SERVER_PORT', '80')
+
+    request = WSGIRequest(environ)
+    # Authentication already happened on the outer request
+    request.user = getattr(parent, 'user', None)
+    request.session = getattr(parent, 'session', None)
+    request._dont_enforce_csrf_checks = True
+    return request
+
+
+def dispatch_subrequest(parent, method, path, body=None, excluded_views=()):
+    """
+    Run the API view for ``path`` and return (status_code, data).
+
+    ``parent`` is the outer Django request. Paths must point into the API,
+    and views listed in ``excluded_views`` (the batch endpoints themselves)
+    are refused to prevent recursion. Async views (the /api/live/ stream)
+    are refused too: they cannot be called from this synchronous code.
+    """
+    if not isinstance(path, str) or not path.startswith(API_PREFIX):
+        raise SubrequestError(f'Path must start with {API_PREFIX}')
+    try:
+        match = resolve(path.partition('?')[0])
+    except Resolver404:
+        return 404, {'detail': 'Not found.'}
+    if getattr(match.func, 'cls', None) in excluded_views:
+        raise SubrequestError('Batch endpoints cannot be nested.')
+    if iscoroutinefunction(match.func):
+        raise SubrequestError('Streaming endpoints cannot be batched.')
+
+    request = build_subrequest(parent, method, path, body)
+    response = match.func(request, *match.args, **match.kwargs)
+    data = getattr(response, 'data', None)
+    if data is None and response.get('Content-Type', '').startswith('application/json'):
+        if hasattr(response, 'render'):
+            response.render()
+        data = json.loads(response.content or b'null')
+    return response.status_code, data
+
+
+def can_run_concurrently():
+    """Whether GETs may run on other connections; see dispatch_gets()."""
+    return connection.vendor != 'sqlite' and not connection.in_atomic_block
+
+
+def dispatch_gets(parent, paths, excluded_views=(), workers=1):
+    """
+    GET every path in ``paths`` and return [(status_code, data)] in the same
+    order. Up to ``workers`` run at once on a client/server database, where
+    threads overlap their waits for query results. They run one after
+    another on this connection instead on SQLite, whose queries run in this
+    process and hold the GIL for most of a view's time, and inside a
+    transaction, whose uncommitted rows other connections cannot see.
+    """
+    def get(path):
+        try:
+            return dispatch_subrequest(parent, 'GET', path, excluded_views=excluded_views)
+        except SubrequestError as exc:
+            return 400, {'detail': str(exc)}
+        except Exception:
+            logger.exception('Batch GET of %s failed', path)
+            return 500, {'detail': 'A server error occurred.'}
+
+    workers = min(workers, len(paths))
+    if workers <= 1 or not can_run_concurrently():
+        return [get(path) for path in paths]
+
+    results = [None] * len(paths)
+    pending = deque(enumerate(paths))
+
+    def drain():
+        try:
+            while pending:
+                try:
+                    index, path = pending.popleft()
+                except IndexError:
+                    return
+                results[index] = get(path)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-get') as executor:
+        futures = [executor.submit(copy_context().run, drain) for _ in range(workers)]
+    for future in futures:
+        future.result()  # views' exceptions are caught in get(); this is anything else
+    return results
@@ -0,0 +1,105 @@
+# Scheduled expiry
+# Time-driven status changes nobody makes by hand:
+#     medications   active -> inactive once end_date has passed
+#     appointments  scheduled -> no_show APPOINTMENT_NO_SHOW_AFTER_HOURS after
+#                   the appointment time
+#
+# Each transition runs in batches of IDs taken in primary-key order. A batch
+# is one short transaction: an INSERT ... SELECT writes one AccessLog row per
+# changed row (actor "system:expire_records", action = the transition), a
+# second one writes the change-feed events, then one UPDATE by ID makes the
+# change. Rows never pass through Python, and no lock is held longer than
+# one batch. Appointment batches also apply their rollup deltas, drop the
+# cached calendars and publish the no-shows to live chart streams on commit.
+# Every statement of a batch re-applies the transition's
+# filter, so a row someone else changed after its ID was read (a medication
+# extended, an appointment checked in) is neither logged nor updated.
+#
+# Run `python manage.py expire_records` from cron, e.g. every 15 minutes.
+
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, DateTimeField, IntegerField, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .archive import insert_select
+from .calendars import invalidate_all as invalidate_calendars
+from .live import publish_appointments
+from .models import AccessLog, Appointment, Medication
+from .outbox import record_changes
+from .rollups import apply_rollup_deltas, rollup_update_deltas
+
+AUDIT_ACTOR = 'system:expire_records'
+
+# name: used as the audit action; queryset: a callable returning the rows
+# due for the change; values: the UPDATE
+Transition = namedtuple('Transition', 'name resource model queryset values')
+
+
+def ended_medications():
+    return Medication.objects.filter(is_active=True, end_date__lt=timezone.localdate())
+
+
+def missed_appointments():
+    hours = getattr(settings, 'APPOINTMENT_NO_SHOW_AFTER_HOURS', 24)
+    return Appointment.objects.filter(
+        status='scheduled', appointment_date__lt=timezone.now() - timedelta(hours=hours)
+    )
+
+
+TRANSITIONS = {
+    'medications': Transition('expire', 'medication', Medication, ended_medications, {'is_active': False}),
+    'appointments': Transition('no_show', 'appointment', Appointment, missed_appointments, {'status': 'no_show'}),
+}
+
+
+def audit_rows(batch, transition, now):
+    """``batch`` annotated with the AccessLog columns, in insert order."""
+    return batch.annotate(
+        timestamp=Value(now, output_field=DateTimeField()),
+        actor=Value(AUDIT_ACTOR, output_field=CharField()),
+        resource=Value(transition.resource, output_field=CharField()),
+        action=Value(transition.name, output_field=CharField()),
+        object_id=Cast('pk', output_field=CharField()),
+        method=Value('SYSTEM', output_field=CharField()),
+        status_code=Value(200, output_field=IntegerField()),
+    )
+
+
+AUDIT_FIELDS = ['patient_id', 'timestamp', 'actor', 'resource', 'action', 'object_id', 'method', 'status_code']
+
+
+def run_transition(transition, batch_size=1000, pause=0.0):
+    """Apply ``transition`` to every due row. Yields the rows changed per batch."""
+    last_pk = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                transition.queryset().filter(pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return
+            batch = transition.queryset().filter(pk__in=ids)
+            insert_select(AccessLog, audit_rows(batch, transition, now), AUDIT_FIELDS)
+            values = dict(transition.values, updated_at=now)
+            record_changes(batch, 'update', values)
+            if transition.model is Appointment:
+                deltas = rollup_update_deltas(batch, values)
+                changed_ids = list(batch.values_list('pk', flat=True))
+            changed = batch.order_by().update(**values)
+            if transition.model is Appointment:
+                apply_rollup_deltas(deltas)
+                invalidate_calendars()
+                if changed_ids:
+                    publish_appointments(changed_ids)
+        last_pk = ids[-1]
+        yield changed
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,205 @@
+# Live chart events
+# New VitalSign rows and Appointment status changes are published once, on
+# transaction commit, to a process-wide ChangeBroadcaster. Each open
+# /api/live/ stream is one asyncio.Queue subscribed to a few patients, so an
+# ASGI worker holds thousands of idle streams without a thread apiece.
+#
+# Several workers: set LIVE_EVENTS_SOCKET_DIR to a directory shared by the
+# workers on one host. Every process that streams binds a Unix datagram
+# socket there, and every publish is also sent to the other sockets, so an
+# event raised in any worker (or a management command) reaches every stream.
+# Sockets left behind by dead workers are removed on the first failed send.
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+from collections import defaultdict
+from itertools import count
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Appointment
+from .serializers import AppointmentSerializer, VitalSignSerializer
+
+logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM = 60000
+
+
+class Subscription:
+    def __init__(self, patient_ids, loop, maxsize):
+        self.patient_ids = frozenset(patient_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, message):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind must reload the chart anyway
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class ChangeBroadcaster:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)  # patient id -> subscriptions
+        self._lock = threading.Lock()
+        self._sequence = count(1)
+        self._socket = None
+        self._socket_path = None
+        self._pid = None
+
+    @property
+    def socket_dir(self):
+        return getattr(settings, 'LIVE_EVENTS_SOCKET_DIR', None)
+
+    # Subscribing (event loop side)
+
+    def subscribe(self, patient_ids):
+        self.ensure_listener()
+        subscription = Subscription(
+            patient_ids, asyncio.get_running_loop(),
+            getattr(settings, 'LIVE_EVENTS_QUEUE_SIZE', 100),
+        )
+        with self._lock:
+            for patient_id in subscription.patient_ids:
+                self._subscriptions[patient_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for patient_id in subscription.patient_ids:
+                subscribers = self._subscriptions.get(patient_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[patient_id]
+
+    # Publishing (any thread)
+
+    def publish(self, event_type, patient_id, data):
+        """Fan an event out to local streams and, if configured, other workers."""
+        payload = json.dumps(
+            {'type': event_type, 'patient': patient_id, 'data': data}, cls=DjangoJSONEncoder
+        )
+        self.deliver_local(event_type, patient_id, payload)
+        if self.socket_dir:
+            self.send_to_peers(payload)
+
+    def deliver_local(self, event_type, patient_id, payload):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(patient_id, ()))
+        if not subscriptions:
+            return
+        message = f"id: {next(self._sequence)}\nevent: {event_type}\ndata: {payload}\n\n"
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:  # loop already closed
+                self.unsubscribe(subscription)
+
+    # Cross-worker fan-out
+
+    def ensure_listener(self):
+        """Bind this process's datagram socket and start its reader thread."""
+        if not self.socket_dir or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.socket_dir, exist_ok=True)
+            path = os.path.join(self.socket_dir, f'live-{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._socket, self._socket_path, self._pid = sock, path, os.getpid()
+        threading.Thread(target=self._listen, args=(sock,), name='live-events', daemon=True).start()
+
+    def _listen(self, sock):
+        while True:
+            try:
+                payload = sock.recv(MAX_DATAGRAM).decode()
+                event = json.loads(payload)
+                self.deliver_local(event['type'], event['patient'], payload)
+            except Exception:
+                logger.exception('Failed to deliver live event from another worker')
+
+    def send_to_peers(self, payload):
+        data = payload.encode()
+        if len(data) > MAX_DATAGRAM:
+            logger.warning('Live event too large for cross-worker delivery (%d bytes)', len(data))
+            return
+        own = self._socket_path if self._pid == os.getpid() else None
+        try:
+            names = [name for name in os.listdir(self.socket_dir) if name.endswith('.sock')]
+        except FileNotFoundError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            sender.setblocking(False)
+            for name in names:
+                path = os.path.join(self.socket_dir, name)
+                if path == own:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                except BlockingIOError:
+                    logger.warning('Live event dropped: worker socket %s is full', path)
+
+
+broadcaster = ChangeBroadcaster()
+
+
+def publish_on_commit(event_type, patient_id, data):
+    transaction.on_commit(lambda: broadcaster.publish(event_type, patient_id, data))
+
+
+# Signal handlers
+
+def vital_sign_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish_on_commit('vital_sign', instance.patient_id, VitalSignSerializer(instance).data)
+
+
+def appointment_pre_save(sender, instance, raw=False, **kwargs):
+    instance._live_old_status = None
+    if raw or instance._state.adding:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'status' in loaded:
+        instance._live_old_status = loaded['status']
+    else:
+        instance._live_old_status = (
+            Appointment.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.status != getattr(instance, '_live_old_status', None):
+        publish_on_commit('appointment', instance.patient_id, AppointmentSerializer(instance).data)
+
+
+def publish_appointments(appointment_ids):
+    """Publish appointments changed by a bulk update, which bypasses signals."""
+    def publish():
+        for appointment in Appointment.objects.filter(pk__in=appointment_ids):
+            broadcaster.publish('appointment', appointment.patient_id, AppointmentSerializer(appointment).data)
+    transaction.on_commit(publish)
@@ -0,0 +1,108 @@
+"""
+Django management command to move old vital signs and visit notes into the
+archive tables.
+Usage: python manage.py archive_records [--horizon-days 730] [--benchmark]
+"""
+
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.ehr.archive import ARCHIVES, archive_horizon, archive_rows
+from backend.ehr.models import MedicalRecord, VitalSign
+
+MODELS = {'vitals': VitalSign, 'records': MedicalRecord}
+
+
+class Command(BaseCommand):
+    help = 'Move rows older than the archive horizon into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon-days',
+            type=int,
+            default=None,
+            help='Archive rows older than this many days (default: EHR_ARCHIVE_HORIZON_DAYS)',
+        )
+        parser.add_argument(
+            '--models',
+            default='vitals,records',
+            help='Comma-separated list of: vitals, records (default: both)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows moved per transaction (default: 2000)',
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Time the hot-path list queries before and after archiving',
+        )
+
+    def handle(self, *args, **options):
+        if options['horizon_days'] is not None:
+            before = timezone.now() - timedelta(days=options['horizon_days'])
+        else:
+            before = archive_horizon()
+        names = [name.strip() for name in options['models'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in MODELS]
+        if unknown:
+            raise CommandError(f'Unknown --models value: {", ".join(unknown)}')
+        models = [MODELS[name] for name in names]
+
+        if options['benchmark']:
+            patient_ids = list(
+                VitalSign.objects.values_list('patient_id', flat=True).distinct()[:1000]
+            )
+            before_timings = {model: self.time_hot_path(model, patient_ids) for model in models}
+
+        for model in models:
+            started = time.perf_counter()
+            moved = 0
+            for batch in archive_rows(model, before, options['batch_size']):
+                moved += batch
+                self.stdout.write(f'  {model.__name__}: {moved} rows archived...')
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {moved} {model.__name__} rows older than {before:%Y-%m-%d} '
+                f'in {elapsed:.2f}s'
+            ))
+
+        if options['benchmark']:
+            for model in models:
+                self.report(model, before_timings[model], self.time_hot_path(model, patient_ids))
+
+    def time_hot_path(self, model, patient_ids, samples=200):
+        """
+        Time the queries behind GET /api/<resource>/?patient=N (count + first
+        page) for a sample of patients. Returns per-request latencies in ms.
+        """
+        date_field = ARCHIVES[model][1]
+        sample = random.Random(0).choices(patient_ids, k=samples) if patient_ids else []
+        timings = []
+        for patient_id in sample:
+            started = time.perf_counter()
+            queryset = model.objects.filter(patient_id=patient_id).order_by(f'-{date_field}')
+            queryset.count()
+            list(queryset[:20])
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, model, before, after):
+        if not before or not after:
+            self.stdout.write(f'{model.__name__}: no patients to benchmark')
+            return
+
+        def summary(timings):
+            timings = sorted(timings)
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            return f'median {statistics.median(timings):.3f}ms, p95 {p95:.3f}ms'
+
+        self.stdout.write(f'{model.__name__} hot path before: {summary(before)}')
+        self.stdout.write(f'{model.__name__} hot path after:  {summary(after)}')
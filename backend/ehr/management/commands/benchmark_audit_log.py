@@ -0,0 +1,80 @@
+"""
+Django management command to measure what the access audit log adds to a
+request: the cost of AuditBuffer.record(), with the buffer filling up and
+when it is full, and the flush cost the background thread pays per entry.
+The flush runs inside a transaction that is rolled back, so the database is
+unchanged.
+Usage: python manage.py benchmark_audit_log [--entries 100000]
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from backend.ehr.audit import AuditBuffer
+
+TARGET_US = 100  # per-request budget for recording an entry
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the per-request cost of the access audit log'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--entries',
+            type=int,
+            default=100000,
+            help='Entries recorded per measurement (default: 100000)',
+        )
+
+    def handle(self, *args, **options):
+        entries = options['entries']
+        with override_settings(
+            AUDIT_LOG_ENABLED=True, AUDIT_LOG_BUFFER_SIZE=entries, AUDIT_LOG_BATCH_SIZE=entries + 1,
+        ):
+            buffer = self.buffer()
+            self.report('record(), buffer filling', self.time_records(buffer, entries))
+            self.report('record(), buffer full (drop_oldest)', self.time_records(buffer, entries))
+
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    written = buffer.flush()
+                    raise Rollback
+            except Rollback:
+                pass
+            per_entry = (time.perf_counter() - started) * 1e6 / max(written, 1)
+        self.stdout.write(f'flush(): {per_entry:.1f}us per entry, on the flusher thread')
+        self.stdout.write(self.style.SUCCESS('Benchmark finished; all data rolled back'))
+
+    def buffer(self):
+        buffer = AuditBuffer()
+        buffer._pid = os.getpid()  # no flusher thread: only record() is timed
+        return buffer
+
+    def time_records(self, buffer, entries):
+        timings = []
+        for number in range(entries):
+            started = time.perf_counter()
+            buffer.record('benchmark', number, 'patient', 'retrieve', str(number), 'GET', 200)
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        return timings
+
+    def report(self, label, timings):
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+        mean = sum(timings) / len(timings)
+        style = self.style.SUCCESS if percentile(0.99) < TARGET_US else self.style.ERROR
+        self.stdout.write(style(
+            f'{label}: mean {mean:.1f}us, p50 {percentile(0.5):.1f}us, '
+            f'p99 {percentile(0.99):.1f}us (target {TARGET_US}us)'
+        ))
@@ -0,0 +1,109 @@
+"""
+Django management command to measure patient autocomplete latency on a
+synthetic in-memory index (no database rows are created).
+Usage: python manage.py benchmark_autocomplete [--patients 1000000] [--queries 20000]
+"""
+
+import random
+import resource
+import string
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from backend.ehr.autocomplete import AutocompleteIndex, PrefixIndex
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+    'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+    'Thomas', 'Sarah', 'Charles', 'Karen', 'Emma', 'Olivia', 'Liam', 'Noah', 'Ava',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark autocomplete lookups against a synthetic prefix index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patients',
+            type=int,
+            default=1000000,
+            help='Synthetic patients in the index (default: 1000000)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=20000,
+            help='Lookups to time (default: 20000)',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        last_names = sorted({
+            rng.choice(string.ascii_uppercase) + ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+            for _ in range(50000)
+        })
+        epoch = date(1930, 1, 1)
+
+        def rows():
+            for pk in range(1, options['patients'] + 1):
+                yield (
+                    pk, rng.choice(FIRST_NAMES), rng.choice(last_names),
+                    f'MRN{pk:07d}', epoch + timedelta(days=rng.randint(0, 30000)),
+                )
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        index = PrefixIndex.build(rows())
+        build = time.perf_counter() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(
+            f'Built index for {len(index)} patients in {build:.1f}s '
+            f'(index {index.nbytes / 2 ** 20:.0f}MB, peak RSS +{(rss_after - rss_before) / 1024:.0f}MB)'
+        )
+
+        def random_query():
+            kind = rng.random()
+            if kind < 0.4:
+                return rng.choice(last_names)[:rng.randint(1, 4)]
+            if kind < 0.7:
+                return rng.choice(FIRST_NAMES)[:rng.randint(1, 3)]
+            if kind < 0.9:
+                return f'{rng.choice(FIRST_NAMES)[:rng.randint(1, 4)]} {rng.choice(last_names)[:rng.randint(1, 3)]}'
+            return f'MRN{rng.randint(1, options["patients"]):07d}'[:rng.randint(4, 10)]
+
+        queries = [random_query() for _ in range(options['queries'])]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.lookup(query, 10)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+        self.stdout.write(
+            f'Lookup latency: p50 {percentile(0.5):.3f}ms, p99 {percentile(0.99):.3f}ms, '
+            f'max {timings[-1]:.3f}ms'
+        )
+        served = AutocompleteIndex()
+        served.swap(index)
+        updates = 1000
+        started = time.perf_counter()
+        for pk in range(1, updates + 1):
+            served.apply(pk, ('Updated', 'Patient', f'MRN{pk:07d}', epoch))
+        per_update = (time.perf_counter() - started) * 1000 / updates
+        self.stdout.write(f'Signal update: {per_update:.3f}ms per patient')
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            served.index.lookup(query, 10, served.overlay)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'Lookup latency with {updates} updated patients: p50 {percentile(0.5):.3f}ms, '
+            f'p99 {percentile(0.99):.3f}ms, max {timings[-1]:.3f}ms'
+        )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
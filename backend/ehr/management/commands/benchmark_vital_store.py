@@ -0,0 +1,155 @@
+"""
+Django management command to compare the compact vital stream store with
+plain VitalSign rows: bytes per reading and range-read throughput.
+Runs inside a transaction that is rolled back, so the database is unchanged.
+Usage: python manage.py benchmark_vital_store [--hours 24] [--interval 5]
+"""
+
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.ehr.models import Patient, VitalSign, VitalSignBlock
+from backend.ehr.serializers import VitalSignSerializer
+from backend.ehr.vitalstore import BYTES_PER_READING, append_readings, read_readings, readings_to_json
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compact vital stream store against VitalSign rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Hours of monitor data to generate (default: 24)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=5,
+            help='Seconds between readings (default: 5)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Range reads timed per store (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        patient = Patient.objects.create(
+            first_name='Benchmark', last_name='Monitor', date_of_birth='1970-01-01',
+            gender='O', phone='000-000-0000', email='benchmark@example.com', address='-',
+            emergency_contact_name='-', emergency_contact_phone='-',
+            medical_record_number=f'BENCH-{uuid.uuid4().hex[:14]}',  # 20 characters, the field's limit
+        )
+        end = timezone.now().replace(minute=0, second=0, microsecond=0)
+        start = end - timedelta(hours=options['hours'])
+        readings = self.generate(start, end, options['interval'])
+        self.stdout.write(f'Generated {len(readings)} readings over {options["hours"]}h')
+
+        tables = [VitalSign._meta.db_table, VitalSignBlock._meta.db_table]
+        sizes_before = self.table_sizes(tables)
+
+        started = time.perf_counter()
+        VitalSign.objects.bulk_create(
+            (VitalSign(patient=patient, weight=165, notes='', **r) for r in readings),
+            batch_size=2000,
+        )
+        row_write = time.perf_counter() - started
+
+        started = time.perf_counter()
+        append_readings(patient.pk, readings)
+        block_write = time.perf_counter() - started
+
+        sizes_after = self.table_sizes(tables)
+        count = len(readings)
+        if sizes_before is not None and sizes_after is not None:
+            row_bytes = sizes_after[tables[0]] - sizes_before[tables[0]]
+            block_bytes = sizes_after[tables[1]] - sizes_before[tables[1]]
+            self.stdout.write(f'VitalSign rows:    {row_bytes / count:.1f} bytes/reading on disk')
+            self.stdout.write(f'VitalSignBlock:    {block_bytes / count:.1f} bytes/reading on disk')
+        else:
+            self.stdout.write('On-disk sizes need SQLite with dbstat; reporting payload only')
+        self.stdout.write(f'Block payload:     {BYTES_PER_READING} bytes/reading')
+        self.stdout.write(f'Writes: rows {row_write:.2f}s, blocks {block_write:.2f}s')
+
+        def read_rows():
+            rows = VitalSign.objects.filter(
+                patient=patient, recorded_at__gte=start, recorded_at__lt=end
+            ).order_by('recorded_at')
+            return VitalSignSerializer(rows, many=True).data
+
+        def read_blocks():
+            return readings_to_json(patient.pk, read_readings(patient.pk, start, end))
+
+        def decode_blocks():
+            return read_readings(patient.pk, start, end)['recorded_at']
+
+        for label, read in (
+            ('rows + serializer', read_rows),
+            ('blocks + JSON shape', read_blocks),
+            ('blocks, arrays only', decode_blocks),
+        ):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                assert len(read()) == count
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            self.stdout.write(
+                f'Range read, {label}: {best * 1000:.1f}ms ({count / best:,.0f} readings/s)'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished; all data rolled back'))
+
+    def generate(self, start, end, interval):
+        rng = random.Random(0)
+        readings = []
+        moment = start
+        while moment < end:
+            readings.append({
+                'recorded_at': moment,
+                'heart_rate': rng.randint(55, 120),
+                'blood_pressure_systolic': rng.randint(95, 160),
+                'blood_pressure_diastolic': rng.randint(55, 100),
+                'oxygen_saturation': rng.randint(88, 100),
+                'temperature': round(rng.uniform(97.0, 101.0), 1),
+            })
+            moment += timedelta(seconds=interval)
+        return readings
+
+    def table_sizes(self, tables):
+        """Bytes used by each table and its indexes, or None off SQLite/dbstat."""
+        if connection.vendor != 'sqlite':
+            return None
+        sizes = {}
+        try:
+            with connection.cursor() as cursor:
+                for table in tables:
+                    cursor.execute(
+                        'SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN '
+                        '(SELECT name FROM sqlite_master WHERE tbl_name = %s)',
+                        [table],
+                    )
+                    sizes[table] = cursor.fetchone()[0]
+        except Exception:
+            return None
+        return sizes
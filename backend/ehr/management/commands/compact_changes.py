@@ -0,0 +1,42 @@
+"""
+Django management command to trim the change feed: deletes events every
+consumer has acknowledged once they are past CHANGE_FEED_RETENTION_HOURS,
+and any event past CHANGE_FEED_MAX_RETENTION_HOURS. Run it from cron.
+Usage: python manage.py compact_changes [--batch-size 5000] [--pause 0.05]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from backend.ehr.models import ChangeConsumer, ChangeEvent
+from backend.ehr.outbox import compact
+
+
+class Command(BaseCommand):
+    help = 'Delete change-feed events that every consumer has processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Events deleted per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between batches (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = sum(compact(options['batch_size'], options['pause']))
+        elapsed = time.perf_counter() - started
+
+        for consumer in ChangeConsumer.objects.order_by('name'):
+            behind = ChangeEvent.objects.filter(position__gt=consumer.offset).count()
+            self.stdout.write(f'  {consumer.name}: at {consumer.offset}, {behind} events behind')
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} change events in {elapsed:.2f}s; {ChangeEvent.objects.count()} remain'
+        ))
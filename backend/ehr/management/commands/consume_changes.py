@@ -0,0 +1,58 @@
+"""
+Django management command to read the change feed as JSON lines on stdout,
+one event per line, from a consumer's checkpoint. The checkpoint moves after
+each batch is written, so a restarted consumer re-reads at most one batch.
+Usage: python manage.py consume_changes <consumer> [--batch-size 500] [--follow] [--poll-interval 1.0]
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from backend.ehr.outbox import acknowledge, consumer_offset, read_changes
+from backend.ehr.serializers import ChangeEventSerializer
+
+
+class Command(BaseCommand):
+    help = 'Stream change-feed events as JSON lines, checkpointing a named consumer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumer', help='Consumer name; its checkpoint is kept in ChangeConsumer')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Events read per query (default: 500)',
+        )
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            help='Keep polling for new events instead of stopping at the end of the feed',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds between polls with --follow (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        consumer = options['consumer']
+        offset = consumer_offset(consumer)
+        read = 0
+        while True:
+            events = read_changes(offset, options['batch_size'])
+            for data in ChangeEventSerializer(events, many=True).data:
+                self.stdout.write(json.dumps(data, cls=DjangoJSONEncoder))
+            self.stdout.flush()
+            if events:
+                offset = events[-1].position
+                acknowledge(consumer, offset)
+                read += len(events)
+            elif not options['follow']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+        self.stderr.write(self.style.SUCCESS(f'{consumer}: read {read} events, checkpoint at {offset}'))
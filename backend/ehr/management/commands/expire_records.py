@@ -0,0 +1,67 @@
+"""
+Django management command to apply time-driven status changes: deactivate
+medications whose end date has passed and mark missed appointments as no-shows.
+Each change is written to the access audit log. Run it from cron.
+Usage: python manage.py expire_records [--only medications,appointments] [--batch-size 1000] [--pause 0.05] [--dry-run]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ehr.expiry import TRANSITIONS, run_transition
+
+
+class Command(BaseCommand):
+    help = 'Deactivate ended medications and mark missed appointments as no-shows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            default=','.join(TRANSITIONS),
+            help=f'Comma-separated list of: {", ".join(TRANSITIONS)} (default: all)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows changed per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between batches to leave room for other writers (default: 0)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would change',
+        )
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['only'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in TRANSITIONS]
+        if unknown:
+            raise CommandError(f'Unknown --only value: {", ".join(unknown)}')
+
+        for name in names:
+            transition = TRANSITIONS[name]
+            if options['dry_run']:
+                self.stdout.write(f'{name}: {transition.queryset().count()} rows due for "{transition.name}"')
+                continue
+
+            started = time.perf_counter()
+            changed = batches = 0
+            for size in run_transition(transition, options['batch_size'], options['pause']):
+                changed += size
+                batches += 1
+                if options['verbosity'] > 1:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'  {name}: {changed} rows ({changed / elapsed:.0f} rows/s)...')
+            elapsed = time.perf_counter() - started
+            rate = changed / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {transition.name} applied to {changed} rows in {batches} batches, '
+                f'{elapsed:.2f}s ({rate:.0f} rows/s)'
+            ))
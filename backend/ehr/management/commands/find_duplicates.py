@@ -0,0 +1,138 @@
+"""
+Django management command to find likely duplicate patients. Only patients
+sharing a blocking key are compared; blocks are handed to worker processes,
+which expand them into pairs and score them.
+Usage: python manage.py find_duplicates [--workers 4] [--threshold 0.85] [--csv out.csv]
+"""
+
+import csv
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from backend.ehr.dedup import (
+    KEY_FIELDS, block_memberships, candidate_blocks, comparable, match_threshold, rebuild_blocking_keys,
+    score_blocks,
+)
+from backend.ehr.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Find likely duplicate patients using blocking keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes used for scoring (default: CPU count)',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=None,
+            help='Minimum score to report (default: DEDUP_MATCH_THRESHOLD)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20000,
+            help='Candidate pairs per worker task, in whole blocks (default: 20000)',
+        )
+        parser.add_argument(
+            '--rebuild-keys',
+            action='store_true',
+            help='Recompute every blocking key before matching',
+        )
+        parser.add_argument(
+            '--csv',
+            help='Write all matches to this CSV file',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Matches printed to the console (default: 50)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild_keys']:
+            written = rebuild_blocking_keys()
+            self.stdout.write(f'Rebuilt {written} blocking keys')
+
+        blocks = list(candidate_blocks())
+        memberships = block_memberships(blocks)
+        self.stdout.write(
+            f'{len(blocks)} blocks among {len(memberships)} patients (of {Patient.objects.count()})'
+        )
+
+        records = {}
+        id_list = sorted(memberships)
+        for offset in range(0, len(id_list), 5000):
+            patients = Patient.objects.filter(pk__in=id_list[offset:offset + 5000])
+            for row in patients.values('pk', *KEY_FIELDS):
+                records[row['pk']] = comparable(row)
+
+        threshold = options['threshold'] if options['threshold'] is not None else match_threshold()
+        chunks = list(self.chunks(blocks, options['chunk_size']))
+        matches, compared = [], 0
+        if options['workers'] > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(options['workers'], initializer=django.setup) as pool:
+                # A few tasks queued per worker, so their pairs are never all
+                # expanded at once
+                pending = set()
+                for chunk in chunks:
+                    if len(pending) >= 2 * options['workers']:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        compared += self.collect(done, matches)
+                    ids = {pk for _, members in chunk for pk in members}
+                    pending.add(pool.submit(
+                        score_blocks, chunk, {pk: records[pk] for pk in ids},
+                        {pk: memberships[pk] for pk in ids}, threshold,
+                    ))
+                compared += self.collect(pending, matches)
+        else:
+            for chunk in chunks:
+                chunk_matches, chunk_compared = score_blocks(chunk, records, memberships, threshold)
+                matches.extend(chunk_matches)
+                compared += chunk_compared
+        matches.sort(key=lambda match: (-match[2], match[0], match[1]))
+        self.stdout.write(f'Compared {compared} candidate pairs')
+
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(['patient_a', 'patient_b', 'score', 'matched_fields'])
+                for a, b, score, matched in matches:
+                    writer.writerow([a, b, score, ' '.join(matched)])
+        for a, b, score, matched in matches[:options['limit']]:
+            self.stdout.write(f'  {a} ~ {b}: {score:.3f} ({", ".join(matched)})')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {len(matches)} likely duplicate pairs in {elapsed:.2f}s'
+        ))
+
+    def chunks(self, blocks, size):
+        """[(block number, members)] lists of whole blocks, about ``size`` pairs each."""
+        chunk, pairs = [], 0
+        for number, members in enumerate(blocks):
+            chunk.append((number, members))
+            pairs += len(members) * (len(members) - 1) // 2
+            if pairs >= size:
+                yield chunk
+                chunk, pairs = [], 0
+        if chunk:
+            yield chunk
+
+    def collect(self, futures, matches):
+        compared = 0
+        for future in futures:
+            chunk_matches, chunk_compared = future.result()
+            matches.extend(chunk_matches)
+            compared += chunk_compared
+        return compared
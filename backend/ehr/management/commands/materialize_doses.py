@@ -0,0 +1,54 @@
+"""
+Django management command to keep the materialized medication schedule
+current: extends every active medication's doses to the scheduling horizon
+and drops expired doses and those of ended or deactivated medications.
+Run it hourly.
+Usage: python manage.py materialize_doses [--rebuild] [--chunk-size 2000]
+"""
+
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from backend.ehr.models import Medication, ScheduledDose
+from backend.ehr.schedules import materialize_doses, parse_frequency
+
+
+class Command(BaseCommand):
+    help = 'Materialize upcoming medication doses for every active medication'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Delete every scheduled dose first, e.g. after changing the parser',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Medications read and doses inserted per batch (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['rebuild']:
+            ScheduledDose.objects.all()._raw_delete(ScheduledDose.objects.db)
+        created, deleted = materialize_doses(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scheduled {created} new doses and removed {deleted} in {elapsed:.2f}s'
+        ))
+        frequencies = Counter(
+            Medication.objects.filter(is_active=True).values_list('frequency', flat=True).iterator()
+        )
+        unscheduled = {text: count for text, count in frequencies.items() if parse_frequency(text) is None}
+        if unscheduled:
+            self.stdout.write(
+                f'{sum(unscheduled.values())} active medications have no schedule '
+                '(as needed, or frequency not recognised):'
+            )
+            for text, count in sorted(unscheduled.items(), key=lambda item: -item[1])[:20]:
+                self.stdout.write(f'  {count:>6}  {text!r}')
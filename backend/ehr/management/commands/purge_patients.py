@@ -0,0 +1,52 @@
+"""
+Django management command to delete patients and their whole charts in
+bounded batches, without loading the related rows into memory. Also finishes
+a background purge that was cut short.
+Usage: python manage.py purge_patients <patient_id> [<patient_id> ...] [--batch-size 2000] [--pause 0.05]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.ehr.purge import default_batch_size, purge_patient
+
+
+class Command(BaseCommand):
+    help = 'Delete patients and everything that refers to them, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('patient_ids', nargs='+', type=int, help='IDs of the patients to delete')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows deleted per transaction (default: PATIENT_PURGE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between batches to leave room for other writers (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or default_batch_size()
+        for patient_id in options['patient_ids']:
+            started = time.perf_counter()
+            deleted = purge_patient(patient_id, batch_size, options['pause'])
+            elapsed = time.perf_counter() - started
+            total = sum(deleted.values())
+            if options['verbosity'] > 1:
+                for label, count in deleted.items():
+                    if count:
+                        self.stdout.write(f'  {label}: {count}')
+            if not deleted.pop('ehr.Patient'):
+                self.stdout.write(self.style.WARNING(
+                    f'Patient {patient_id} not found; {total} leftover rows deleted'
+                ))
+                continue
+            rate = total / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'Patient {patient_id}: {total} rows deleted in {elapsed:.2f}s ({rate:.0f} rows/s)'
+            ))
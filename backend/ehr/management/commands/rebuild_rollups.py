@@ -0,0 +1,41 @@
+"""
+Django management command to backfill or rebuild appointment rollups.
+Usage: python manage.py rebuild_rollups [--start 2025-01-01] [--end 2025-01-31]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from backend.ehr.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild appointment rollups from the Appointment table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First day to rebuild, YYYY-MM-DD (default: earliest appointment)',
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to rebuild, YYYY-MM-DD (default: latest appointment)',
+        )
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                bounds[name] = parse_date(options[name])
+                if bounds[name] is None:
+                    raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+
+        started = time.perf_counter()
+        rows = rebuild_rollups(**bounds)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {rows} rollup rows in {elapsed:.2f}s')
+        )
@@ -0,0 +1,63 @@
+"""
+Django management command to move archived vital signs and visit notes back
+into the hot tables.
+Usage: python manage.py restore_archive [--patient 1] [--since 2020-01-01]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from backend.ehr.archive import restore_rows
+from backend.ehr.models import MedicalRecord, VitalSign
+
+MODELS = {'vitals': VitalSign, 'records': MedicalRecord}
+
+
+class Command(BaseCommand):
+    help = 'Restore archived rows into the hot tables (reverses archive_records)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patient',
+            type=int,
+            default=None,
+            help='Only restore rows for this patient ID',
+        )
+        parser.add_argument(
+            '--since',
+            default=None,
+            help='Only restore rows dated on/after this day, YYYY-MM-DD',
+        )
+        parser.add_argument(
+            '--models',
+            default='vitals,records',
+            help='Comma-separated list of: vitals, records (default: both)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows moved per transaction (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        names = [name.strip() for name in options['models'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in MODELS]
+        if unknown:
+            raise CommandError(f'Unknown --models value: {", ".join(unknown)}')
+
+        for name in names:
+            model = MODELS[name]
+            restored = sum(restore_rows(
+                model, patient_id=options['patient'], since=since,
+                batch_size=options['batch_size'],
+            ))
+            self.stdout.write(
+                self.style.SUCCESS(f'Restored {restored} {model.__name__} rows')
+            )
@@ -0,0 +1,64 @@
+"""
+Django management command to compute early-warning scores for every patient.
+Usage: python manage.py score_ward --days 1 --min-score 5
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.ehr.models import VitalSign
+from backend.ehr.scoring import compute_early_warning_scores
+
+
+class Command(BaseCommand):
+    help = 'Compute NEWS2-style early-warning scores for the whole ward in one pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only score readings from the last N days (default: all readings)',
+        )
+        parser.add_argument(
+            '--min-score',
+            type=int,
+            default=0,
+            help='Only list patients at or above this score (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        queryset = VitalSign.objects.all()
+        if options['days'] is not None:
+            queryset = queryset.filter(
+                recorded_at__gte=timezone.now() - timedelta(days=options['days'])
+            )
+
+        started = time.perf_counter()
+        scores = compute_early_warning_scores(queryset)
+        elapsed = time.perf_counter() - started
+
+        flagged = sorted(
+            (s for s in scores.values() if s['score'] >= options['min_score']),
+            key=lambda s: (-s['score'], s['patient']),
+        )
+        for summary in flagged:
+            trend = f"{summary['trend']:+d}"
+            line = (
+                f"Patient {summary['patient']:>8}  score {summary['score']:>2} "
+                f"({summary['risk']}, trend {trend}, max {summary['max_score']})"
+            )
+            if summary['risk'] in ('high', 'medium'):
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
+
+        readings = sum(s['readings'] for s in scores.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Scored {readings} readings for {len(scores)} patients in {elapsed:.2f}s'
+            )
+        )
@@ -0,0 +1,68 @@
+"""
+Django management command to report the slowest SQL statements recorded by
+the slow-query log, each with its slowest execution and EXPLAIN plan.
+Usage: python manage.py slow_queries [--order total|mean|max|count] [--top 20] [--no-plans] [--reset]
+"""
+
+from django.core.management.base import BaseCommand
+
+from backend.ehr.models import SlowQuery
+from backend.ehr.slowqueries import ORDERINGS, top_slow_queries
+
+
+class Command(BaseCommand):
+    help = 'Report the slowest recorded SQL statements and their plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--order',
+            choices=list(ORDERINGS),
+            default='total',
+            help='Rank by total, mean or max time, or by count (default: total)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Statements to report (default: 20)',
+        )
+        parser.add_argument(
+            '--no-plans',
+            action='store_true',
+            help='Omit the sample execution and plan',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Delete every recorded statement instead of reporting',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow-query entries'))
+            return
+
+        queries = list(top_slow_queries(options['order'], options['top']))
+        if not queries:
+            self.stdout.write('No slow queries recorded.')
+            return
+
+        for rank, query in enumerate(queries, 1):
+            self.stdout.write(self.style.SUCCESS(
+                f'#{rank} {query.fingerprint} ({query.database}): {query.count} runs, '
+                f'{query.total_ms:.0f}ms total, {query.mean_ms:.1f}ms mean, {query.max_ms:.1f}ms max'
+            ))
+            self.stdout.write(f'  {query.sql}')
+            self.stdout.write(f'  last seen {query.last_seen:%Y-%m-%d %H:%M:%S}'
+                              + (f' on {query.sample_path}' if query.sample_path else ''))
+            if options['no_plans']:
+                continue
+            self.stdout.write(f'  slowest: {query.sample_sql}')
+            if query.sample_params:
+                self.stdout.write(f'  params: {query.sample_params}')
+            if query.plan:
+                self.stdout.write('  plan:')
+                for line in query.plan.splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write('')
@@ -0,0 +1,155 @@
+"""
+Django management command to measure worker cold start: per-module import
+time (as reported by python -X importtime) and time to the first request,
+for the full and/or API-only (EHR_PROFILE=api) startup profiles. Each run
+uses a fresh interpreter, so nothing is shared with this process.
+Usage: python manage.py startup_profile [--profile full|api] [--compare] [--runs 3] [--top 15]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in the child interpreter: set up Django, then serve one request
+# through the WSGI handler (the URLconf and views load on first request)
+CHILD_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': %(path)r, 'QUERY_STRING': %(query)r}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+print('STARTUP ' + json.dumps({
+    'setup': setup_done - started,
+    'first_request': time.perf_counter() - setup_done,
+    'status': status[0],
+    'bytes': len(body),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return [(depth, module, self_us, cumulative_us)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2 - 1
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report import time per module and time to first request for a fresh worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile',
+            choices=['full', 'api'],
+            default=os.environ.get('EHR_PROFILE', 'full'),
+            help='Startup profile to measure (default: EHR_PROFILE or full)',
+        )
+        parser.add_argument(
+            '--compare',
+            action='store_true',
+            help='Measure both profiles and print the difference',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=3,
+            help='Cold starts per profile; medians are reported (default: 3)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Modules to list by cumulative import time (default: 15)',
+        )
+        parser.add_argument(
+            '--path',
+            default='/api/patients/',
+            help='URL of the first request (default: /api/patients/)',
+        )
+
+    def handle(self, *args, **options):
+        profiles = ['full', 'api'] if options['compare'] else [options['profile']]
+        results = {}
+        for profile in profiles:
+            results[profile] = self.measure(profile, options)
+            self.report(profile, results[profile], options['top'])
+
+        if options['compare']:
+            full, api = results['full'], results['api']
+            self.stdout.write(self.style.SUCCESS(
+                f"api profile starts {full['total'] - api['total']:.0f}ms faster "
+                f"({api['total']:.0f}ms vs {full['total']:.0f}ms to first response)"
+            ))
+
+    def measure(self, profile, options):
+        path, _, query = options['path'].partition('?')
+        script = CHILD_SCRIPT % {'path': path, 'query': query}
+        env = {**os.environ, 'EHR_PROFILE': profile, 'DJANGO_SETTINGS_MODULE': 'backend.settings'}
+        runs = []
+        for _ in range(max(options['runs'], 1)):
+            started = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', script],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            total = time.perf_counter() - started
+            marker = next((line for line in result.stdout.splitlines() if line.startswith('STARTUP ')), None)
+            if result.returncode or marker is None:
+                raise CommandError(f'{profile} profile failed to start:\n{result.stderr[-2000:]}')
+            timings = json.loads(marker[len('STARTUP '):])
+            timings['total'] = total
+            timings['imports'] = parse_importtime(result.stderr)
+            runs.append(timings)
+
+        # Median run by total time, so the module table matches the headline
+        runs.sort(key=lambda run: run['total'])
+        median = runs[len(runs) // 2]
+        return {
+            'total': statistics.median(run['total'] for run in runs) * 1000,
+            'setup': statistics.median(run['setup'] for run in runs) * 1000,
+            'first_request': statistics.median(run['first_request'] for run in runs) * 1000,
+            'status': median['status'],
+            'imports': median['imports'],
+        }
+
+    def report(self, profile, result, top):
+        imports = result['imports']
+        packages = defaultdict(int)
+        for _, name, self_us, _ in imports:
+            packages[name.split('.')[0]] += self_us
+
+        self.stdout.write(f'\n{profile} profile')
+        rows = [
+            ('process start to first response', f"{result['total']:8.1f}ms"),
+            ('  django.setup()', f"{result['setup']:8.1f}ms"),
+            (f"  first request ({result['status']})", f"{result['first_request']:8.1f}ms"),
+            ('modules imported', f'{len(imports):8d}'),
+            ('import time (sum of self)', f'{sum(row[2] for row in imports) / 1000:8.1f}ms'),
+        ]
+        for label, value in rows:
+            self.stdout.write(f'  {label:<34}{value}')
+        self.stdout.write('  slowest modules (cumulative ms, self ms):')
+        for depth, name, self_us, cumulative_us in sorted(imports, key=lambda row: -row[3])[:top]:
+            self.stdout.write(f'    {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {"  " * depth}{name}')
+        self.stdout.write('  by top-level package (self ms):')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'    {self_us / 1000:8.1f}  {package}')
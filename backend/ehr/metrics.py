@@ -0,0 +1,177 @@
+# Prometheus metrics
+# MetricsMiddleware times every request and labels it with the view class
+# and DRF action that served it; an execute wrapper (installed from
+# connection_created) times every SQL statement. GET /metrics renders them
+# in the Prometheus text format.
+#
+# Several workers: set PROMETHEUS_MULTIPROC_DIR to an empty directory before
+# the server starts (backend/gunicorn.conf.py does this). Each process then
+# writes its samples to memory-mapped files there, and whichever worker
+# answers a scrape sums all of them, so counters and histograms cover every
+# worker. Recording a sample costs a few microseconds either way.
+
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+# A one-item list per request, shared with the threads a request's sync code
+# runs in under ASGI, counting its SQL statements
+request_queries = ContextVar('ehr_request_queries', default=None)
+
+REQUEST_LATENCY = Histogram(
+    'ehr_http_request_duration_seconds', 'Time to produce a response, by view and action',
+    ['view', 'action', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'ehr_http_requests_in_progress', 'Requests being handled',
+    multiprocess_mode='livesum',
+)
+REQUEST_QUERIES = Histogram(
+    'ehr_http_request_db_queries', 'SQL statements run per request, by view and action',
+    ['view', 'action'], buckets=QUERY_COUNT_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    'ehr_db_query_duration_seconds', 'SQL statement execution time',
+    ['database', 'statement'], buckets=QUERY_BUCKETS,
+)
+CONNECTIONS_OPENED = Counter(
+    'ehr_db_connections_opened', 'Database connections opened', ['database'],
+)
+CONNECTIONS_OPEN = Gauge(
+    'ehr_db_connections_open', 'Database connections held open between requests',
+    ['database'], multiprocess_mode='livesum',
+)
+CACHE_LOOKUPS = Counter(
+    'ehr_cache_lookups', 'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def view_labels(view_func, method):
+    """(view, action) label values for a resolved view function."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return view_func.__name__, ''
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(method.lower(), '')
+
+
+def statement_type(sql):
+    keyword = sql.lstrip()[:6].upper()
+    return keyword if keyword in STATEMENTS else 'OTHER'
+
+
+def record_cache_lookup(cache, hit):
+    if enabled():
+        CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+class MetricsMiddleware:
+    """Outermost middleware: latency, status, queries and in-flight count."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        started, queries, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            request_queries.reset(token)
+        self.finish(request, response, started, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        started, queries, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            request_queries.reset(token)
+        self.finish(request, response, started, queries)
+        return response
+
+    def start(self, request):
+        REQUESTS_IN_PROGRESS.inc()
+        request._metrics_view = ('unresolved', '')
+        queries = [0]
+        return time.perf_counter(), queries, request_queries.set(queries)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_labels(view_func, request.method)
+
+    def finish(self, request, response, started, queries):
+        elapsed = time.perf_counter() - started
+        view, action = request._metrics_view
+        REQUEST_LATENCY.labels(view, action, request.method, str(response.status_code)).observe(elapsed)
+        REQUEST_QUERIES.labels(view, action).observe(queries[0])
+
+
+# Signal handlers and execute wrapper
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver: time every query on the connection."""
+    CONNECTIONS_OPENED.labels(connection.alias).inc()
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        if enabled():
+            QUERY_LATENCY.labels(context['connection'].alias, statement_type(sql)).observe(elapsed)
+            queries = request_queries.get()
+            if queries is not None:
+                queries[0] += 1
+
+
+def request_finished(sender, **kwargs):
+    # Connected after Django's close_old_connections, so this counts the
+    # connections this worker keeps for the next request (CONN_MAX_AGE)
+    if enabled():
+        for alias in connections:
+            CONNECTIONS_OPEN.labels(alias).set(int(connections[alias].connection is not None))
+
+
+def metrics_view(request):
+    """Every metric from every worker, in the Prometheus text format."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
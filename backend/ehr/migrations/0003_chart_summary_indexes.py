@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0002_vitalsign_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', '-visit_date'], name='medrec_patient_visit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['patient', 'is_active'], name='medication_patient_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['-created_at'], name='patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsign',
+            index=models.Index(fields=['patient', '-recorded_at'], name='vitalsign_patient_recorded_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:16
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Appointment = apps.get_model('ehr', 'Appointment')
+    AppointmentRollup = apps.get_model('ehr', 'AppointmentRollup')
+    groups = (
+        Appointment.objects.annotate(day=TruncDate('appointment_date'))
+        .values('day', 'department', 'doctor_name', 'status')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    AppointmentRollup.objects.bulk_create(
+        (AppointmentRollup(**group) for group in groups.iterator()), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0003_chart_summary_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('department', models.CharField(max_length=100)),
+                ('doctor_name', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('confirmed', 'Confirmed'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('no_show', 'No Show')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day', 'department', 'doctor_name', 'status'],
+                'indexes': [models.Index(fields=['department', 'day'], name='rollup_department_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'department', 'doctor_name', 'status'), name='unique_appointment_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0004_appointment_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('actor', models.CharField(max_length=150)),
+                ('patient_id', models.BigIntegerField(blank=True, null=True)),
+                ('resource', models.CharField(max_length=50)),
+                ('action', models.CharField(max_length=50)),
+                ('object_id', models.CharField(blank=True, max_length=50)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['patient_id', '-timestamp'], name='accesslog_patient_time_idx'), models.Index(fields=['actor', '-timestamp'], name='accesslog_actor_time_idx'), models.Index(fields=['-timestamp'], name='accesslog_time_idx')],
+            },
+        ),
+    ]
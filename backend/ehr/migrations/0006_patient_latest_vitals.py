@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_latest_vitals(apps, schema_editor):
+    VitalSign = apps.get_model('ehr', 'VitalSign')
+    PatientLatestVitals = apps.get_model('ehr', 'PatientLatestVitals')
+    newest = VitalSign.objects.filter(
+        patient_id=OuterRef('patient_id')
+    ).order_by('-recorded_at', '-pk').values('pk')[:1]
+    fields = [
+        'recorded_at', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+        'heart_rate', 'temperature', 'weight', 'height', 'oxygen_saturation',
+    ]
+    PatientLatestVitals.objects.bulk_create(
+        (
+            PatientLatestVitals(
+                patient_id=vital.patient_id, vital_sign_id=vital.pk,
+                **{field: getattr(vital, field) for field in fields}
+            )
+            for vital in VitalSign.objects.filter(pk=Subquery(newest)).order_by().iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0005_access_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientLatestVitals',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_vitals', serialize=False, to='ehr.patient')),
+                ('vital_sign_id', models.BigIntegerField(db_index=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('blood_pressure_systolic', models.IntegerField()),
+                ('blood_pressure_diastolic', models.IntegerField()),
+                ('heart_rate', models.IntegerField()),
+                ('temperature', models.DecimalField(decimal_places=1, max_digits=4)),
+                ('weight', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('height', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('oxygen_saturation', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_latest_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0006_patient_latest_vitals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalRecordArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('visit_date', models.DateTimeField()),
+                ('chief_complaint', models.TextField()),
+                ('diagnosis', models.TextField()),
+                ('treatment_plan', models.TextField()),
+                ('notes', models.TextField(blank=True)),
+                ('doctor_name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_medical_records', to='ehr.patient')),
+            ],
+            options={
+                'ordering': ['-visit_date'],
+                'indexes': [models.Index(fields=['patient', '-visit_date'], name='medrecarch_patient_visit_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VitalSignArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('recorded_at', models.DateTimeField()),
+                ('blood_pressure_systolic', models.IntegerField()),
+                ('blood_pressure_diastolic', models.IntegerField()),
+                ('heart_rate', models.IntegerField()),
+                ('temperature', models.DecimalField(decimal_places=1, max_digits=4)),
+                ('weight', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('height', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('oxygen_saturation', models.IntegerField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_vital_signs', to='ehr.patient')),
+            ],
+            options={
+                'ordering': ['-recorded_at'],
+                'indexes': [models.Index(fields=['patient', '-recorded_at'], name='vitalarchive_patient_rec_idx')],
+            },
+        ),
+    ]
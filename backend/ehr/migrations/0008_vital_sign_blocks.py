@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0007_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalSignBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('offsets', models.BinaryField(default=b'')),
+                ('heart_rate', models.BinaryField(default=b'')),
+                ('blood_pressure_systolic', models.BinaryField(default=b'')),
+                ('blood_pressure_diastolic', models.BinaryField(default=b'')),
+                ('oxygen_saturation', models.BinaryField(default=b'')),
+                ('temperature', models.BinaryField(default=b'')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vital_blocks', to='ehr.patient')),
+            ],
+            options={
+                'ordering': ['patient', 'hour_start'],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'hour_start'), name='unique_vital_block_hour')],
+            },
+        ),
+    ]
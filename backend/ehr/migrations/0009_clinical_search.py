@@ -0,0 +1,79 @@
+# Full-text index over clinical notes (SQLite FTS5). Other databases skip it;
+# the search endpoint reports itself unavailable there.
+
+from django.db import migrations
+
+TABLE = 'ehr_clinical_search'
+TEXT_COLUMNS = ('chief_complaint', 'diagnosis', 'treatment_plan', 'notes', 'reason')
+
+# source -> (table, rowid code, {search column: source column})
+SOURCES = {
+    'medical_record': ('ehr_medicalrecord', 1, {
+        'chief_complaint': 'chief_complaint', 'diagnosis': 'diagnosis',
+        'treatment_plan': 'treatment_plan', 'notes': 'notes',
+    }),
+    'medication': ('ehr_medication', 2, {'notes': 'notes'}),
+    'appointment': ('ehr_appointment', 3, {'reason': 'reason'}),
+}
+
+
+def row_values(source, prefix):
+    table, code, columns = SOURCES[source]
+    return [
+        f'{prefix}id * 4 + {code}', f"'{source}'", f'{prefix}id', f'{prefix}patient_id',
+        f"'p' || {prefix}patient_id",
+    ] + [f"{prefix}{columns[column]}" if column in columns else "''" for column in TEXT_COLUMNS]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    insert_columns = ', '.join(('rowid', 'source', 'object_id', 'patient_id', 'patient_key') + TEXT_COLUMNS)
+    statements = [
+        f'''CREATE VIRTUAL TABLE {TABLE} USING fts5(
+            source UNINDEXED, object_id UNINDEXED, patient_id UNINDEXED, patient_key,
+            {', '.join(TEXT_COLUMNS)},
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )''',
+        f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(0, 0, 0, 0, 4.0, 3.0, 2.0, 1.0, 2.0)')",
+    ]
+    for source, (table, code, columns) in SOURCES.items():
+        new_row = ', '.join(row_values(source, 'new.'))
+        watched = ', '.join(['patient_id', *columns.values()])
+        statements += [
+            f'''CREATE TRIGGER {TABLE}_{source}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {TABLE}({insert_columns}) VALUES ({new_row});
+            END''',
+            f'''CREATE TRIGGER {TABLE}_{source}_au AFTER UPDATE OF {watched} ON {table} BEGIN
+                DELETE FROM {TABLE} WHERE rowid = old.id * 4 + {code};
+                INSERT INTO {TABLE}({insert_columns}) VALUES ({new_row});
+            END''',
+            f'''CREATE TRIGGER {TABLE}_{source}_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM {TABLE} WHERE rowid = old.id * 4 + {code};
+            END''',
+            f"INSERT INTO {TABLE}({insert_columns}) SELECT {', '.join(row_values(source, ''))} FROM {table}",
+        ]
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for source in SOURCES:
+            for suffix in ('ai', 'au', 'ad'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{source}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0008_vital_sign_blocks'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_blocking_keys(apps, schema_editor):
+    from backend.ehr.dedup import KEY_FIELDS, blocking_keys
+
+    Patient = apps.get_model('ehr', 'Patient')
+    PatientBlockingKey = apps.get_model('ehr', 'PatientBlockingKey')
+    PatientBlockingKey.objects.bulk_create(
+        (
+            PatientBlockingKey(patient_id=patient_id, kind=kind, key=key)
+            for patient_id, *values in Patient.objects.values_list('pk', *KEY_FIELDS).iterator()
+            for kind, key in blocking_keys(*values).items()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0009_clinical_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientBlockingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('last_name_dob', 'Phonetic last name + date of birth'), ('first_name_dob', 'Phonetic first name + date of birth'), ('phone', 'Normalized phone'), ('email', 'Normalized email')], max_length=20)),
+                ('key', models.CharField(max_length=254)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocking_keys', to='ehr.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'key'], name='blockingkey_kind_key_idx')],
+                'constraints': [models.UniqueConstraint(fields=('patient', 'kind'), name='unique_patient_blocking_kind')],
+            },
+        ),
+        migrations.RunPython(backfill_blocking_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0010_patient_blocking_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('database', models.CharField(max_length=100)),
+                ('fingerprint', models.CharField(max_length=16)),
+                ('sql', models.TextField(help_text='Statement with literals and parameters replaced by ?')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('sample_sql', models.TextField(help_text='The slowest execution, as sent to the database')),
+                ('sample_params', models.TextField(blank=True)),
+                ('sample_path', models.CharField(blank=True, max_length=500)),
+                ('plan', models.TextField(blank=True)),
+                ('plan_captured_at', models.DateTimeField(blank=True, null=True)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+                'constraints': [models.UniqueConstraint(fields=('database', 'fingerprint'), name='unique_slow_query_fingerprint')],
+            },
+        ),
+    ]
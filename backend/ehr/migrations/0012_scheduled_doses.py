@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_scheduled_doses(apps, schema_editor):
+    from datetime import timedelta
+
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from backend.ehr.schedules import dose_times, horizon, parse_frequency
+
+    Medication = apps.get_model('ehr', 'Medication')
+    ScheduledDose = apps.get_model('ehr', 'ScheduledDose')
+    now, until = timezone.now(), horizon()
+    medications = Medication.objects.filter(is_active=True).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=now.date() - timedelta(days=1))
+    ).values_list('pk', 'patient_id', 'frequency', 'start_date', 'end_date')
+    schedules = {}
+    doses = []
+    for pk, patient_id, frequency, start_date, end_date in medications.iterator():
+        if frequency not in schedules:
+            schedules[frequency] = parse_frequency(frequency)
+        if schedules[frequency] is not None:
+            doses.extend(
+                ScheduledDose(medication_id=pk, patient_id=patient_id, due_at=due)
+                for due in dose_times(schedules[frequency], start_date, end_date, now, until)
+            )
+    ScheduledDose.objects.bulk_create(doses, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0011_slow_query_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledDose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_at', models.DateTimeField()),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_doses', to='ehr.medication')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_doses', to='ehr.patient')),
+            ],
+            options={
+                'ordering': ['due_at', 'pk'],
+                'indexes': [models.Index(fields=['due_at'], name='dose_due_idx'), models.Index(fields=['patient', 'due_at'], name='dose_patient_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medication', 'due_at'), name='unique_medication_dose')],
+            },
+        ),
+        migrations.RunPython(backfill_scheduled_doses, migrations.RunPython.noop),
+    ]
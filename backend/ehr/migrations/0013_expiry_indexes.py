@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0012_scheduled_doses'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'appointment_date'], name='appt_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medication',
+            index=models.Index(fields=['is_active', 'end_date'], name='medication_active_end_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0013_expiry_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'department'], name='appt_date_department_idx'),
+        ),
+    ]
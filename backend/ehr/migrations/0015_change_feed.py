@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:09
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0014_appointment_calendar_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeConsumer',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurred_at', models.DateTimeField()),
+                ('resource', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField(blank=True, null=True)),
+                ('operation', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=6)),
+                ('changes', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='New values of the changed fields; every field on create, none on delete', null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
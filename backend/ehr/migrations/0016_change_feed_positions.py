@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:37
+
+from django.db import migrations, models
+
+
+def backfill_positions(apps, schema_editor):
+    # Every event written so far has committed, so ID order is commit order
+    from django.db.models import F, Max
+
+    ChangeEvent = apps.get_model('ehr', 'ChangeEvent')
+    ChangeFeedHead = apps.get_model('ehr', 'ChangeFeedHead')
+    ChangeEvent.objects.update(position=F('id'))
+    head = ChangeEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    ChangeFeedHead.objects.create(pk=1, position=head)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0015_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='position',
+            field=models.BigIntegerField(blank=True, help_text='Offset in the change feed, in commit order; empty until the event is first read', null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_positions, migrations.RunPython.noop),
+    ]
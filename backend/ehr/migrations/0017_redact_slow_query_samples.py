@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from urllib.parse import parse_qsl
+
+from django.db import migrations
+
+
+def redact_samples(apps, schema_editor):
+    # Samples recorded before SLOW_QUERY_CAPTURE_PARAMS existed kept
+    # parameters and query strings, which hold patient identifiers
+    SlowQuery = apps.get_model('ehr', 'SlowQuery')
+    for query in SlowQuery.objects.only('pk', 'sample_path').iterator():
+        path, _, query_string = query.sample_path.partition('?')
+        if query_string:
+            path += '?' + '&'.join(f'{key}=?' for key, _ in parse_qsl(query_string, keep_blank_values=True))
+        SlowQuery.objects.filter(pk=query.pk).update(sample_params='', sample_path=path[:500])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0016_change_feed_positions'),
+    ]
+
+    operations = [
+        migrations.RunPython(redact_samples, migrations.RunPython.noop),
+    ]
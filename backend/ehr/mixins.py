@@ -2,6 +2,21 @@
 # Mixins for ViewSets
 # Mixins provide reusable functionality that can be shared across multiple ViewSets.
 
+from datetime import datetime, time
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .archive import archive_horizon
+from .audit import audit_log
+from .outbox import record_changes
+
 class PatientFilterMixin:
     """
     Mixin to add patient filtering to ViewSets.
@@ -23,3 +38,221 @@ class PatientFilterMixin:
             queryset = queryset.filter(patient_id=patient_id)
         
         return queryset
+
+
+class AuditMixin:
+    """
+    Mixin to record every request in the access audit log.
+
+    Records the actor, patient, resource, action and response status after
+    the response is built. Entries are buffered and written in batches by a
+    background thread (see audit.py), so this adds no database work to the
+    request.
+
+    The patient is taken from the URL, the response or the request, in that
+    order. Override get_audit_patient_id() when a ViewSet knows better.
+    """
+
+    def get_audit_patient_id(self, request, response):
+        data = response.data if isinstance(getattr(response, 'data', None), dict) else {}
+        patient_id = (
+            data.get('patient')
+            or request.query_params.get('patient')
+            or (request.data.get('patient') if isinstance(request.data, dict) else None)
+        )
+        try:
+            return int(patient_id) if patient_id is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        user = getattr(request, 'user', None)
+        audit_log.record(
+            actor=user.get_username() if user is not None and user.is_authenticated else 'anonymous',
+            patient_id=self.get_audit_patient_id(request, response),
+            resource=getattr(self, 'basename', None) or type(self).__name__,
+            action=getattr(self, 'action', None) or request.method.lower(),
+            object_id=str(kwargs.get('pk', '')),
+            method=request.method,
+            status_code=response.status_code,
+        )
+        return response
+
+
+class BulkActionsMixin:
+    """
+    Mixin to add set-based bulk update and delete actions to ViewSets.
+
+    Rows are selected by an ID list, by filters, or both, and changed with a
+    single UPDATE or DELETE statement:
+        POST /api/resource/bulk-update/
+        {"ids": [1, 2], "filter": {"patient": 1}, "values": {"is_active": false}}
+
+        POST /api/resource/bulk-delete/
+        {"filter": {"patient": 1, "appointment_date__gte": "2025-01-01T00:00:00Z"}}
+
+    Only lookups listed in bulk_filter_fields may be used in "filter". Values
+    are validated with the ViewSet's serializer as a partial update.
+    Queryset updates and deletes bypass model signals, so ViewSets whose
+    models have derived data override perform_bulk_update() and
+    perform_bulk_delete() to keep it in step. Change-feed events are written
+    here for every row.
+    """
+    bulk_filter_fields = ['patient']
+
+    def get_bulk_queryset(self, request):
+        if not isinstance(request.data, dict):
+            raise ValidationError({'detail': 'Request body must be an object.'})
+        ids = request.data.get('ids')
+        filters = request.data.get('filter') or {}
+        if ids is None and not filters:
+            raise ValidationError({'detail': 'Provide "ids", "filter" or both.'})
+        if not isinstance(filters, dict):
+            raise ValidationError({'filter': 'Must be an object.'})
+        unknown = sorted(set(filters) - set(self.bulk_filter_fields))
+        if unknown:
+            raise ValidationError({
+                'filter': f'Unsupported filters: {", ".join(unknown)}. '
+                          f'Allowed: {", ".join(self.bulk_filter_fields)}.'
+            })
+
+        queryset = self.get_queryset().order_by()
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+                raise ValidationError({'ids': 'Must be a list of integer IDs.'})
+            queryset = queryset.filter(pk__in=ids)
+        try:
+            return queryset.filter(**filters)
+        except (ValueError, TypeError) as exc:
+            raise ValidationError({'filter': str(exc)})
+        except DjangoValidationError as exc:
+            # e.g. {"visit_date__gte": "garbage"}, rejected by the field
+            raise ValidationError({'filter': exc.messages})
+
+    def get_bulk_values(self, request):
+        values = request.data.get('values')
+        if not isinstance(values, dict) or not values:
+            raise ValidationError({'values': 'Must be a non-empty object.'})
+        serializer = self.get_serializer(data=values, partial=True)
+        serializer.is_valid(raise_exception=True)
+        values = dict(serializer.validated_data)
+        if any(field.name == 'updated_at' for field in self.get_queryset().model._meta.fields):
+            values['updated_at'] = timezone.now()
+        return values
+
+    def perform_bulk_update(self, queryset, values):
+        record_changes(queryset, 'update', values)
+        return queryset.update(**values)
+
+    def perform_bulk_delete(self, queryset):
+        # A single DELETE statement, without loading rows for signals
+        record_changes(queryset, 'delete')
+        return queryset._raw_delete(queryset.db)
+
+    @action(detail=False, methods=['post'], url_path='bulk-update')
+    def bulk_update(self, request):
+        queryset = self.get_bulk_queryset(request)
+        values = self.get_bulk_values(request)
+        with transaction.atomic():
+            updated = self.perform_bulk_update(queryset, values)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        queryset = self.get_bulk_queryset(request)
+        with transaction.atomic():
+            deleted = self.perform_bulk_delete(queryset)
+        return Response({'deleted': deleted})
+
+
+class ArchiveFallbackMixin:
+    """
+    Mixin to add a date range to list endpoints and fall back to the archive
+    table when the range reaches past the archive horizon (see archive.py).
+
+    Query parameters, as dates or datetimes:
+        start: only rows dated on/after this
+        end: only rows dated before this
+    GET /api/resource/?patient=1&start=2020-01-01
+
+    Requests whose range reaches past the horizon (a start before it, or an
+    end with no start) or with include_archived=true also read the archive.
+    Those results come from a UNION of the hot and archive tables, ordered
+    and paginated as usual. Without start or end only the hot table is read.
+    """
+    archive_model = None
+    archive_date_field = None
+
+    def get_range_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({name: 'Must be a date or datetime.'})
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def filter_date_range(self, queryset):
+        start = self.get_range_param('start')
+        end = self.get_range_param('end')
+        if start is not None:
+            queryset = queryset.filter(**{f'{self.archive_date_field}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{self.archive_date_field}__lt': end})
+        return queryset
+
+    def get_queryset(self):
+        return self.filter_date_range(super().get_queryset())
+
+    def reads_archive(self):
+        if self.request.query_params.get('include_archived', '').lower() == 'true':
+            return True
+        start = self.get_range_param('start')
+        if start is None:
+            return self.get_range_param('end') is not None
+        return start < archive_horizon()
+
+    def get_archive_queryset(self):
+        queryset = self.archive_model.objects.all()
+        patient_id = self.request.query_params.get('patient')
+        if patient_id is not None:
+            queryset = queryset.filter(patient_id=patient_id)
+        return self.filter_date_range(queryset)
+
+    def list(self, request, *args, **kwargs):
+        if not self.reads_archive():
+            return super().list(request, *args, **kwargs)
+
+        model = self.get_queryset().model
+        fields = [field.attname for field in model._meta.concrete_fields]
+        hot = self.filter_queryset(self.get_queryset())
+        ordering = hot.query.order_by or model._meta.ordering
+        combined = hot.order_by().values(*fields).union(
+            self.get_archive_queryset().order_by().values(*fields), all=True
+        ).order_by(*ordering)
+
+        page = self.paginate_queryset(combined)
+        rows = page if page is not None else combined
+        serializer = self.get_serializer([model(**row) for row in rows], many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            pk = str(self.kwargs.get('pk', ''))
+            if self.action != 'retrieve' or not pk.isdigit():
+                raise
+            archived = self.archive_model.objects.filter(pk=pk).values().first()
+            if archived is None:
+                raise
+            archived.pop('archived_at', None)
+            return self.get_queryset().model(**archived)
@@ -1,7 +1,66 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
-class Patient(models.Model):
+class TrackedModel(models.Model):
+    """
+    Base for the models in the change feed (see outbox.py).
+
+    Remembers the values loaded from the database so signal handlers can see
+    what a save changed, and saves inside a transaction so the change event
+    written by the post_save handler commits or rolls back with the row.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+class PatientQuerySet(models.QuerySet):
+    def with_chart_summary(self):
+        """
+        Annotate each patient with a summary of their chart.
+
+        Every value is computed inside the same SELECT as the patient rows
+        using correlated subqueries, so a page of patients costs a fixed
+        number of queries no matter how large each chart is. The subqueries
+        are served by the (patient, date) indexes on the related tables.
+        Latest vitals come from the PatientLatestVitals snapshot instead.
+        """
+        last_visit = MedicalRecord.objects.filter(
+            patient=OuterRef('pk')
+        ).order_by('-visit_date').values('visit_date')[:1]
+
+        next_appointment = Appointment.objects.filter(
+            patient=OuterRef('pk'),
+            appointment_date__gte=timezone.now(),
+            status__in=['scheduled', 'confirmed'],
+        ).order_by('appointment_date')
+
+        active_medications = Medication.objects.filter(
+            patient=OuterRef('pk'), is_active=True
+        ).order_by().values('patient').annotate(total=Count('pk')).values('total')
+
+        return self.annotate(
+            last_visit_date=Subquery(last_visit),
+            next_appointment_date=Subquery(next_appointment.values('appointment_date')[:1]),
+            next_appointment_department=Subquery(next_appointment.values('department')[:1]),
+            active_medication_count=Coalesce(Subquery(active_medications), 0),
+        )
+
+class Patient(TrackedModel):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -28,14 +87,50 @@ class Patient(models.Model):
     emergency_contact_phone = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PatientQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.medical_record_number}"
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='patient_created_idx'),
+        ]
+
+class PatientLatestVitals(models.Model):
+    """
+    Snapshot of each patient's most recent VitalSign.
 
-class MedicalRecord(models.Model):
+    Kept current by the signal handlers in snapshots.py so chart headers and
+    ward boards read one row per patient instead of sorting VitalSign.
+    vital_sign_id is a plain ID so archiving or bulk-deleting readings never
+    trips over the snapshot.
+    """
+    patient = models.OneToOneField(
+        Patient, on_delete=models.CASCADE, primary_key=True, related_name='latest_vitals'
+    )
+    vital_sign_id = models.BigIntegerField(db_index=True)
+    recorded_at = models.DateTimeField()
+    blood_pressure_systolic = models.IntegerField()
+    blood_pressure_diastolic = models.IntegerField()
+    heart_rate = models.IntegerField()
+    temperature = models.DecimalField(max_digits=4, decimal_places=1)
+    weight = models.DecimalField(max_digits=5, decimal_places=2)
+    height = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    oxygen_saturation = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    SNAPSHOT_FIELDS = [
+        'recorded_at', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+        'heart_rate', 'temperature', 'weight', 'height', 'oxygen_saturation',
+    ]
+
+    def __str__(self):
+        return f"Latest vitals for patient {self.patient_id} at {self.recorded_at:%Y-%m-%d %H:%M}"
+
+class MedicalRecord(TrackedModel):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medical_records')
     visit_date = models.DateTimeField()
     chief_complaint = models.TextField()
@@ -51,8 +146,11 @@ class MedicalRecord(models.Model):
     
     class Meta:
         ordering = ['-visit_date']
+        indexes = [
+            models.Index(fields=['patient', '-visit_date'], name='medrec_patient_visit_idx'),
+        ]
 
-class Medication(models.Model):
+class Medication(TrackedModel):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medications')
     medication_name = models.CharField(max_length=200)
     dosage = models.CharField(max_length=100)
@@ -64,14 +162,41 @@ class Medication(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
     def __str__(self):
         return f"{self.medication_name} - {self.patient}"
     
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['patient', 'is_active'], name='medication_patient_active_idx'),
+            models.Index(fields=['is_active', 'end_date'], name='medication_active_end_idx'),
+        ]
+
+class ScheduledDose(models.Model):
+    """
+    One upcoming administration of an active medication, materialized from
+    its free-text frequency by schedules.py so due-dose lists are a range
+    scan on due_at. Kept MEDICATION_SCHEDULE_HORIZON_HOURS ahead.
+    """
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='scheduled_doses')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='scheduled_doses')
+    due_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.medication_id} due {self.due_at:%Y-%m-%d %H:%M}"
 
-class VitalSign(models.Model):
+    class Meta:
+        ordering = ['due_at', 'pk']
+        constraints = [
+            models.UniqueConstraint(fields=['medication', 'due_at'], name='unique_medication_dose'),
+        ]
+        indexes = [
+            models.Index(fields=['due_at'], name='dose_due_idx'),
+            models.Index(fields=['patient', 'due_at'], name='dose_patient_due_idx'),
+        ]
+
+class VitalSign(TrackedModel):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vital_signs')
     recorded_at = models.DateTimeField()
     blood_pressure_systolic = models.IntegerField(validators=[MinValueValidator(0), MaxValueValidator(300)])
@@ -90,8 +215,11 @@ class VitalSign(models.Model):
     
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['patient', '-recorded_at'], name='vitalsign_patient_recorded_idx'),
+        ]
 
-class Appointment(models.Model):
+class Appointment(TrackedModel):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
         ('confirmed', 'Confirmed'),
@@ -115,3 +243,259 @@ class Appointment(models.Model):
     
     class Meta:
         ordering = ['-appointment_date']
+        indexes = [
+            models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+            models.Index(fields=['status', 'appointment_date'], name='appt_status_date_idx'),
+            models.Index(fields=['appointment_date', 'department'], name='appt_date_department_idx'),
+        ]
+
+class AppointmentRollup(models.Model):
+    """
+    Appointment counts per (day, department, doctor, status).
+
+    Maintained incrementally by the signal handlers in rollups.py and rebuilt
+    with `python manage.py rebuild_rollups`.
+    """
+    day = models.DateField()
+    department = models.CharField(max_length=100)
+    doctor_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.department} {self.doctor_name} {self.status}: {self.count}"
+
+    class Meta:
+        ordering = ['day', 'department', 'doctor_name', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'department', 'doctor_name', 'status'],
+                name='unique_appointment_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['department', 'day'], name='rollup_department_day_idx'),
+        ]
+
+class AccessLog(models.Model):
+    """
+    Who read or changed which patient chart.
+
+    Written in batches by the background flusher in audit.py, so patient is
+    a plain ID rather than a foreign key: audit rows must outlive the chart
+    and never block or cascade with it.
+    """
+    timestamp = models.DateTimeField()
+    actor = models.CharField(max_length=150)
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    resource = models.CharField(max_length=50)
+    action = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=50, blank=True)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.timestamp:%Y-%m-%d %H:%M:%S} {self.actor} {self.action} {self.resource}"
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['patient_id', '-timestamp'], name='accesslog_patient_time_idx'),
+            models.Index(fields=['actor', '-timestamp'], name='accesslog_actor_time_idx'),
+            models.Index(fields=['-timestamp'], name='accesslog_time_idx'),
+        ]
+
+class VitalSignArchive(models.Model):
+    """
+    VitalSign rows older than the archive horizon.
+
+    Same columns and IDs as VitalSign, moved here in bulk by
+    `python manage.py archive_records` so the hot table and its indexes stay
+    small. See archive.py.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_vital_signs')
+    recorded_at = models.DateTimeField()
+    blood_pressure_systolic = models.IntegerField()
+    blood_pressure_diastolic = models.IntegerField()
+    heart_rate = models.IntegerField()
+    temperature = models.DecimalField(max_digits=4, decimal_places=1)
+    weight = models.DecimalField(max_digits=5, decimal_places=2)
+    height = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    oxygen_saturation = models.IntegerField(null=True, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived vitals {self.id} for patient {self.patient_id}"
+
+    class Meta:
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['patient', '-recorded_at'], name='vitalarchive_patient_rec_idx'),
+        ]
+
+class MedicalRecordArchive(models.Model):
+    """MedicalRecord rows older than the archive horizon. See VitalSignArchive."""
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_medical_records')
+    visit_date = models.DateTimeField()
+    chief_complaint = models.TextField()
+    diagnosis = models.TextField()
+    treatment_plan = models.TextField()
+    notes = models.TextField(blank=True)
+    doctor_name = models.CharField(max_length=200)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived medical record {self.id} for patient {self.patient_id}"
+
+    class Meta:
+        ordering = ['-visit_date']
+        indexes = [
+            models.Index(fields=['patient', '-visit_date'], name='medrecarch_patient_visit_idx'),
+        ]
+
+class VitalSignBlock(models.Model):
+    """
+    One hour of high-frequency monitor readings for a patient, stored as
+    packed fixed-width arrays instead of one VitalSign row per reading.
+
+    Each column is a little-endian array of ``count`` values (see
+    vitalstore.py for the layout). Use vitalstore.append_readings() and
+    vitalstore.read_readings() rather than touching the blobs directly.
+    """
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vital_blocks')
+    hour_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    offsets = models.BinaryField(default=b'')
+    heart_rate = models.BinaryField(default=b'')
+    blood_pressure_systolic = models.BinaryField(default=b'')
+    blood_pressure_diastolic = models.BinaryField(default=b'')
+    oxygen_saturation = models.BinaryField(default=b'')
+    temperature = models.BinaryField(default=b'')
+
+    def __str__(self):
+        return f"{self.count} readings for patient {self.patient_id} from {self.hour_start:%Y-%m-%d %H:00}"
+
+    class Meta:
+        ordering = ['patient', 'hour_start']
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'hour_start'], name='unique_vital_block_hour'),
+        ]
+
+
+class PatientBlockingKey(models.Model):
+    """
+    Blocking keys for duplicate-patient detection (see dedup.py). Patients
+    sharing a (kind, key) pair land in the same block, and only patients in
+    the same block are ever compared.
+    """
+    KIND_CHOICES = [
+        ('last_name_dob', 'Phonetic last name + date of birth'),
+        ('first_name_dob', 'Phonetic first name + date of birth'),
+        ('phone', 'Normalized phone'),
+        ('email', 'Normalized email'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='blocking_keys')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=254)
+
+    def __str__(self):
+        return f"{self.kind}={self.key} (patient {self.patient_id})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'kind'], name='unique_patient_blocking_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'key'], name='blockingkey_kind_key_idx'),
+        ]
+
+
+class SlowQuery(models.Model):
+    """
+    One normalized SQL statement that has run slower than
+    SLOW_QUERY_THRESHOLD_MS, with running totals, its slowest execution and
+    the database's plan for it. Written by the background thread in
+    slowqueries.py.
+    """
+    database = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=16)
+    sql = models.TextField(help_text='Statement with literals and parameters replaced by ?')
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    sample_sql = models.TextField(help_text='The slowest execution, as sent to the database')
+    sample_params = models.TextField(blank=True)
+    sample_path = models.CharField(max_length=500, blank=True)
+    plan = models.TextField(blank=True)
+    plan_captured_at = models.DateTimeField(null=True, blank=True)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.fingerprint}: {self.count} x, {self.total_ms:.0f}ms total"
+
+    class Meta:
+        ordering = ['-total_ms']
+        constraints = [
+            models.UniqueConstraint(fields=['database', 'fingerprint'], name='unique_slow_query_fingerprint'),
+        ]
+
+
+class ChangeEvent(models.Model):
+    """
+    One create, update or delete of a Patient, MedicalRecord, Medication,
+    VitalSign or Appointment, written in the transaction that made it (see
+    outbox.py). The position, given by the first feed read after the event
+    committed, is its offset in the change feed.
+    """
+    OPERATION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    occurred_at = models.DateTimeField()
+    resource = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    operation = models.CharField(max_length=6, choices=OPERATION_CHOICES)
+    changes = models.JSONField(
+        null=True, blank=True, encoder=DjangoJSONEncoder,
+        help_text='New values of the changed fields; every field on create, none on delete',
+    )
+    position = models.BigIntegerField(
+        null=True, blank=True, unique=True,
+        help_text='Offset in the change feed, in commit order; empty until the event is first read',
+    )
+
+    def __str__(self):
+        return f"#{self.pk} {self.operation} {self.resource} {self.object_id}"
+
+    class Meta:
+        ordering = ['id']
+
+
+class ChangeFeedHead(models.Model):
+    """The last position handed out in the change feed (a single row)."""
+    position = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"change feed at {self.position}"
+
+
+class ChangeConsumer(models.Model):
+    """A change-feed reader and the position of the last event it has processed."""
+    name = models.CharField(max_length=100, primary_key=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.offset}"
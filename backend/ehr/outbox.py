@@ -0,0 +1,223 @@
+# Change feed (transactional outbox)
+# Every create, update and delete of a Patient, MedicalRecord, Medication,
+# VitalSign or Appointment appends a ChangeEvent in the transaction that made
+# it, so an event exists exactly when its change committed. An event holds
+# the resource, object and patient IDs, the operation and, for creates and
+# updates, the new values of the fields that changed (all fields on create).
+#
+# Saves and deletes of single rows are recorded by the signal handlers below
+# (TrackedModel.save() runs in a transaction for this). Code that changes
+# rows in bulk (the bulk actions, expire_records, the patient purge) calls
+# record_changes() with the rows before changing them, which writes one event
+# per row with an INSERT ... SELECT. Archive moves and bulk_create() loads
+# (seed_db) are not recorded.
+#
+# Consumers read in position order from a checkpoint: GET /api/changes/?
+# consumer= then POST /api/changes/ack/, or `python manage.py
+# consume_changes`. IDs are assigned when an event is inserted, not when it
+# commits, so a transaction still open can commit a lower ID after a reader
+# has passed it. Reads therefore go by position instead: each read first
+# gives every event committed since the last read the next positions, under
+# a lock on the ChangeFeedHead row (see sequence_changes()). An event that
+# commits late is numbered after everything already read, never behind a
+# checkpoint.
+# `python manage.py compact_changes` deletes events every consumer has
+# acknowledged once they are CHANGE_FEED_RETENTION_HOURS old, and any event
+# older than CHANGE_FEED_MAX_RETENTION_HOURS.
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import CharField, DateTimeField, F, JSONField, Max, Min, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .archive import insert_select
+from .models import (
+    Appointment, ChangeConsumer, ChangeEvent, ChangeFeedHead, MedicalRecord, Medication, Patient,
+    VitalSign,
+)
+
+TRACKED_MODELS = (Patient, MedicalRecord, Medication, VitalSign, Appointment)
+EVENT_FIELDS = ['occurred_at', 'resource', 'object_id', 'patient_id', 'operation', 'changes']
+
+
+def resource_name(model):
+    return model._meta.model_name
+
+
+def tracked_fields(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def event_patient_id(instance):
+    return instance.pk if isinstance(instance, Patient) else instance.patient_id
+
+
+def record_changes(queryset, operation, values=None):
+    """
+    Write one event per row of ``queryset`` for a bulk update (with the
+    update's ``values``) or delete. Call inside the transaction, before the
+    change.
+    """
+    model = queryset.model
+    if model not in TRACKED_MODELS:
+        return
+    rows = queryset.order_by().annotate(
+        occurred_at=Value(timezone.now(), output_field=DateTimeField()),
+        resource=Value(resource_name(model), output_field=CharField()),
+        object_id=F('pk'),
+        operation=Value(operation, output_field=CharField()),
+    )
+    if model is Patient:
+        rows = rows.annotate(patient_id=F('pk'))
+    fields = list(EVENT_FIELDS)
+    if values is None:
+        fields.remove('changes')  # NULL
+    else:
+        changes = {
+            model._meta.get_field(name).attname: value.pk if isinstance(value, models.Model) else value
+            for name, value in values.items()
+        }
+        rows = rows.annotate(changes=Value(changes, output_field=JSONField(encoder=DjangoJSONEncoder)))
+    insert_select(ChangeEvent, rows, fields)
+
+
+def sequence_changes(limit):
+    """
+    Give up to ``limit`` committed events that have no position yet the next
+    positions in the feed, in ID order.
+    """
+    with transaction.atomic():
+        # Held until commit, so sequencing never interleaves: whatever this
+        # transaction sees is numbered after everything numbered before
+        head, _ = ChangeFeedHead.objects.select_for_update().get_or_create(pk=1)
+        ids = list(
+            ChangeEvent.objects.filter(position__isnull=True)
+            .order_by('pk').values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return
+        # IDs map onto the positions after the head, keeping their order
+        ChangeEvent.objects.filter(pk__in=ids).update(position=F('pk') - ids[0] + head.position + 1)
+        head.position += ids[-1] - ids[0] + 1
+        head.save(update_fields=['position'])
+
+
+def read_changes(after, limit):
+    """Up to ``limit`` events after position ``after``, in order."""
+    sequence_changes(limit)
+    return list(ChangeEvent.objects.filter(position__gt=after).order_by('position')[:limit])
+
+
+def consumer_offset(name):
+    consumer = ChangeConsumer.objects.filter(name=name).first()
+    return consumer.offset if consumer is not None else 0
+
+
+def acknowledge(name, offset):
+    """Move consumer ``name``'s checkpoint forward to ``offset`` (never back)."""
+    consumer = ChangeConsumer.objects.filter(name=name)
+    values = {'offset': Greatest(F('offset'), Value(offset)), 'updated_at': timezone.now()}
+    if consumer.update(**values):
+        return
+    _, created = ChangeConsumer.objects.get_or_create(name=name, defaults={'offset': offset})
+    if not created:
+        # Another acknowledge created it between the two statements
+        consumer.update(**values)
+
+
+def compact(batch_size=5000, pause=0.0):
+    """
+    Delete events that every consumer has acknowledged and that are past the
+    retention period, plus every event past the maximum retention. Yields
+    batch sizes.
+    """
+    now = timezone.now()
+    retention = timedelta(hours=getattr(settings, 'CHANGE_FEED_RETENTION_HOURS', 24))
+    max_retention = timedelta(hours=getattr(settings, 'CHANGE_FEED_MAX_RETENTION_HOURS', 24 * 14))
+    consumed = ChangeConsumer.objects.aggregate(offset=Min('offset'))['offset'] or 0
+    expired = ChangeEvent.objects.filter(
+        occurred_at__lt=now - max_retention
+    ).aggregate(last=Max('position'))['last'] or 0
+    # Events are deleted from the front of the feed only, so offsets stay valid
+    up_to = max(
+        ChangeEvent.objects.filter(position__lte=consumed, occurred_at__lt=now - retention)
+        .aggregate(last=Max('position'))['last'] or 0,
+        expired,
+    )
+    queries = [
+        ChangeEvent.objects.filter(position__lte=up_to).order_by('position'),
+        # Expired before any read gave them a position, so no offset refers to them
+        ChangeEvent.objects.filter(position__isnull=True, occurred_at__lt=now - max_retention).order_by('pk'),
+    ]
+    for queryset in queries:
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                batch = ChangeEvent.objects.filter(pk__in=ids)
+                batch._raw_delete(batch.db)
+            yield len(ids)
+            if pause:
+                time.sleep(pause)
+
+
+# Signal handlers, connected in EhrConfig.ready()
+
+def instance_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    # The fields this save changes, worked out before any post_save handler
+    # updates _loaded_values
+    instance._outbox_fields = None
+    if raw or instance._state.adding:
+        return
+    fields = tracked_fields(sender)
+    if update_fields is not None:
+        fields = [field for field in fields if field.name in update_fields]
+    loaded = getattr(instance, '_loaded_values', {})
+    instance._outbox_fields = [
+        field for field in fields
+        if field.attname not in loaded or loaded[field.attname] != field.value_from_object(instance)
+    ]
+
+
+def instance_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    fields = None if created else getattr(instance, '_outbox_fields', None)
+    if fields is None:
+        fields = tracked_fields(sender)
+    elif not fields:
+        return  # a save that changed nothing
+    else:
+        # auto_now timestamps are only set after the pre_save handlers run
+        fields += [
+            field for field in tracked_fields(sender)
+            if getattr(field, 'auto_now', False) and field not in fields
+        ]
+    ChangeEvent.objects.create(
+        occurred_at=timezone.now(),
+        resource=resource_name(sender),
+        object_id=instance.pk,
+        patient_id=event_patient_id(instance),
+        operation='create' if created else 'update',
+        changes={field.attname: field.value_from_object(instance) for field in fields},
+    )
+    # Connected after the other post_save handlers, which read _loaded_values
+    instance._loaded_values = {
+        field.attname: field.value_from_object(instance) for field in sender._meta.concrete_fields
+    }
+
+
+def instance_deleted(sender, instance, **kwargs):
+    ChangeEvent.objects.create(
+        occurred_at=timezone.now(),
+        resource=resource_name(sender),
+        object_id=instance.pk,
+        patient_id=event_patient_id(instance),
+        operation='delete',
+    )
@@ -0,0 +1,141 @@
+# Patient purge
+# Deleting a Patient through the ORM makes Django's deletion collector load
+# every related vital sign, visit, medication, dose and appointment into
+# memory before the first DELETE, and holds the locks for the whole cascade.
+# purge_patient() instead deletes each child table in batches of
+# PATIENT_PURGE_BATCH_SIZE IDs taken by patient_id, one short transaction per
+# batch, so memory is bounded by one batch and other writers get in between.
+# Each batch writes its change-feed events; appointment batches also apply
+# their rollup deltas and drop the cached calendars.
+# The patient row goes last through the ORM, so its own signal handlers still
+# run and any relation not in CHILDREN is still cascaded.
+#
+# Access log entries are kept: they are the audit trail, and
+# AccessLog.patient_id is not a foreign key.
+#
+# DELETE /api/patients/<id>/?background=true hands the purge to a
+# per-process worker thread and returns 202. A queued purge is lost if the
+# process exits; the patient is then still there, perhaps with part of its
+# chart gone, and `python manage.py purge_patients <id>` finishes the job.
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .calendars import invalidate_all as invalidate_calendars
+from .models import (
+    Appointment, MedicalRecord, MedicalRecordArchive, Medication, Patient, PatientBlockingKey,
+    PatientLatestVitals, ScheduledDose, VitalSign, VitalSignArchive, VitalSignBlock,
+)
+from .outbox import record_changes
+from .rollups import apply_rollup_deltas, rollup_delete_deltas
+
+logger = logging.getLogger(__name__)
+
+# Deletion order: ScheduledDose references Medication, so it goes first
+CHILDREN = (
+    ScheduledDose, Medication, VitalSign, VitalSignBlock, VitalSignArchive, PatientLatestVitals,
+    MedicalRecord, MedicalRecordArchive, Appointment, PatientBlockingKey,
+)
+
+
+def default_batch_size():
+    return getattr(settings, 'PATIENT_PURGE_BATCH_SIZE', 2000)
+
+
+def delete_children(model, patient_id, batch_size, pause=0.0):
+    """Delete one patient's ``model`` rows in batches. Yields batch sizes."""
+    rows = model.objects.filter(patient_id=patient_id)
+    while True:
+        with transaction.atomic():
+            ids = list(rows.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            batch = model.objects.filter(pk__in=ids)
+            record_changes(batch, 'delete')
+            if model is Appointment:
+                deltas = rollup_delete_deltas(batch)
+                batch._raw_delete(batch.db)
+                apply_rollup_deltas(deltas)
+                invalidate_calendars()
+            else:
+                batch._raw_delete(batch.db)
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_patient(patient_id, batch_size=None, pause=0.0):
+    """
+    Delete a patient and everything that refers to it. Returns
+    {model label: rows deleted}; the patient's own count is 0 if it was
+    already gone.
+    """
+    batch_size = batch_size or default_batch_size()
+    deleted = {
+        model._meta.label: sum(delete_children(model, patient_id, batch_size, pause))
+        for model in CHILDREN
+    }
+    with transaction.atomic():
+        # Only rows added since their table was purged are left to cascade
+        patient = Patient.objects.filter(pk=patient_id).first()
+        cascaded = patient.delete()[1] if patient is not None else {}
+    for label, count in cascaded.items():
+        deleted[label] = deleted.get(label, 0) + count
+    deleted.setdefault(Patient._meta.label, 0)
+    return deleted
+
+
+class PurgeQueue:
+    """Purges queued patients one at a time on a per-process thread."""
+
+    def __init__(self):
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, patient_id):
+        # After commit, so a rolled-back request never purges anything
+        transaction.on_commit(lambda: self._put(patient_id))
+
+    def _put(self, patient_id):
+        if self._pid != os.getpid():
+            self._start()
+        self._pending.append(patient_id)
+        self._wakeup.set()
+
+    def _start(self):
+        # Also runs in forked workers, where the parent's thread is gone.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='patient-purge', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                patient_id = self._pending.popleft()
+                try:
+                    deleted = purge_patient(patient_id)
+                    logger.info('Purged patient %s: %d rows', patient_id, sum(deleted.values()))
+                except Exception:
+                    logger.exception('Failed to purge patient %s', patient_id)
+                finally:
+                    connection.close()
+
+
+purge_queue = PurgeQueue()
@@ -0,0 +1,159 @@
+# Appointment rollups
+# Keeps AppointmentRollup counts in step with the Appointment table so the
+# operations dashboard never has to GROUP BY over every appointment.
+#
+# Saves and deletes through the ORM are applied incrementally by the signal
+# handlers below. Queryset .update()/.delete() bypass signals, so bulk code
+# paths must call apply_rollup_delta() or rebuild_rollups() themselves.
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentRollup
+
+ROLLUP_FIELDS = ('appointment_date', 'department', 'doctor_name', 'status')
+
+
+def rollup_key(appointment_date, department, doctor_name, status):
+    appointment_date = Appointment._meta.get_field('appointment_date').to_python(appointment_date)
+    if timezone.is_aware(appointment_date):
+        appointment_date = timezone.localtime(appointment_date)
+    return (appointment_date.date(), department, doctor_name, status)
+
+
+def apply_rollup_delta(key, delta):
+    """Add ``delta`` to the rollup row for ``key``, creating it if needed."""
+    day, department, doctor_name, status = key
+    rows = AppointmentRollup.objects.filter(
+        day=day, department=department, doctor_name=doctor_name, status=status
+    )
+    if rows.update(count=F('count') + delta) or delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            AppointmentRollup.objects.create(
+                day=day, department=department, doctor_name=doctor_name,
+                status=status, count=delta,
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(count=F('count') + delta)
+
+
+def rollup_counts(queryset):
+    """Count the appointments in ``queryset`` per rollup key."""
+    groups = (
+        queryset.annotate(day=TruncDate('appointment_date'))
+        .values_list('day', 'department', 'doctor_name', 'status')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    return {tuple(group[:4]): group[4] for group in groups}
+
+
+def rollup_update_deltas(queryset, values):
+    """
+    Work out the rollup changes for ``queryset.update(**values)``.
+
+    Call before the update and pass the result to apply_rollup_deltas()
+    afterwards. Every row gets the same new values, so each rollup row before
+    the update maps to exactly one rollup row after it.
+    """
+    if not set(values) & set(ROLLUP_FIELDS):
+        return {}
+    deltas = {}
+    for key, count in rollup_counts(queryset).items():
+        day, department, doctor_name, status = key
+        if 'appointment_date' in values:
+            day = rollup_key(values['appointment_date'], department, doctor_name, status)[0]
+        new_key = (
+            day,
+            values.get('department', department),
+            values.get('doctor_name', doctor_name),
+            values.get('status', status),
+        )
+        if new_key != key:
+            deltas[key] = deltas.get(key, 0) - count
+            deltas[new_key] = deltas.get(new_key, 0) + count
+    return deltas
+
+
+def rollup_delete_deltas(queryset):
+    """Work out the rollup changes for deleting ``queryset``. Call before the delete."""
+    return {key: -count for key, count in rollup_counts(queryset).items()}
+
+
+def apply_rollup_deltas(deltas):
+    for key, delta in deltas.items():
+        if delta:
+            apply_rollup_delta(key, delta)
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recompute rollups from the Appointment table, optionally for the days
+    between ``start`` and ``end`` (inclusive dates). Returns the number of
+    rollup rows written.
+    """
+    appointments = Appointment.objects.annotate(day=TruncDate('appointment_date'))
+    rollups = AppointmentRollup.objects.all()
+    if start is not None:
+        appointments = appointments.filter(day__gte=start)
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        appointments = appointments.filter(day__lte=end)
+        rollups = rollups.filter(day__lte=end)
+
+    groups = (
+        appointments.values('day', 'department', 'doctor_name', 'status')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = AppointmentRollup.objects.bulk_create(
+            (AppointmentRollup(**group) for group in groups.iterator()),
+            batch_size=1000,
+        )
+    return len(created)
+
+
+# Signal handlers, connected in EhrConfig.ready()
+
+def current_rollup_key(instance):
+    return rollup_key(*(getattr(instance, field) for field in ROLLUP_FIELDS))
+
+
+def appointment_pre_save(sender, instance, raw=False, **kwargs):
+    """Remember which rollup row the appointment counted towards before the save."""
+    instance._rollup_old_key = None
+    if raw or instance._state.adding:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded for field in ROLLUP_FIELDS):
+        instance._rollup_old_key = rollup_key(*(loaded[field] for field in ROLLUP_FIELDS))
+        return
+    # Deferred fields or an instance built by hand: ask the database
+    old = Appointment.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS).first()
+    if old is not None:
+        instance._rollup_old_key = rollup_key(*old)
+
+
+def appointment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_key = getattr(instance, '_rollup_old_key', None)
+    new_key = current_rollup_key(instance)
+    if old_key != new_key:
+        if old_key is not None:
+            apply_rollup_delta(old_key, -1)
+        apply_rollup_delta(new_key, 1)
+    loaded = getattr(instance, '_loaded_values', {})
+    loaded.update({field: getattr(instance, field) for field in ROLLUP_FIELDS})
+    instance._loaded_values = loaded
+
+
+def appointment_deleted(sender, instance, **kwargs):
+    apply_rollup_delta(current_rollup_key(instance), -1)
@@ -0,0 +1,224 @@
+# Medication administration schedules
+# Turns Medication.frequency free text ("Twice daily", "Once daily at
+# bedtime", "Every 6 hours", "q8h", "Weekly", "PRN") into a Schedule, and
+# materializes the doses of every active medication into ScheduledDose for
+# the next MEDICATION_SCHEDULE_HORIZON_HOURS so the ward's due list is one
+# indexed range scan.
+#
+# Saving a medication regenerates its future doses when the patient,
+# frequency, dates or active flag changed; bulk code paths call refresh_doses()
+# themselves. `python manage.py materialize_doses`, run hourly, extends the
+# horizon, drops doses older than MEDICATION_DOSE_RETENTION_HOURS and drops
+# those of medications that ended or were deactivated without a save.
+#
+# As-needed and unrecognised frequencies have no schedule and no doses.
+
+import re
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Medication, ScheduledDose
+
+# times: administration times of day; every_days: 1 for daily, 2 for every
+# other day, 7 for weekly (counted from start_date); every_hours: a fixed
+# interval from midnight on start_date instead of set times
+Schedule = namedtuple('Schedule', 'times every_days every_hours')
+
+SCHEDULE_FIELDS = ('patient_id', 'frequency', 'start_date', 'end_date', 'is_active')
+
+# Standard ward administration times by doses per day
+STANDARD_TIMES = {
+    1: (time(9),),
+    2: (time(9), time(21)),
+    3: (time(8), time(14), time(20)),
+    4: (time(8), time(12), time(16), time(20)),
+    5: (time(6), time(10), time(14), time(18), time(22)),
+    6: (time(2), time(6), time(10), time(14), time(18), time(22)),
+}
+TIMING_WORDS = [
+    (re.compile(r'\b(?:bed ?time|nightly|at night|qhs|hs)\b'), time(22)),
+    (re.compile(r'\b(?:before breakfast|on waking|qam|every morning|in the morning|mornings?)\b'), time(7)),
+    (re.compile(r'\b(?:with breakfast|after breakfast)\b'), time(8)),
+    (re.compile(r'\b(?:with lunch|at noon|midday)\b'), time(12)),
+    (re.compile(r'\b(?:with dinner|with supper|in the evening|every evening|qpm|evenings?)\b'), time(18)),
+]
+PER_DAY_WORDS = [
+    (re.compile(r'\b(?:qid|qds|four times)\b'), 4),
+    (re.compile(r'\b(?:tid|tds|three times|thrice)\b'), 3),
+    (re.compile(r'\b(?:bid|bd|twice|two times)\b'), 2),
+    (re.compile(r'\b(?:once|one time|daily|qd|od|a day|every day|each day)\b'), 1),
+]
+AS_NEEDED_RE = re.compile(r'\b(?:prn|as needed|as required|when required|if needed|on demand)\b')
+TIMES_PER_DAY_RE = re.compile(r'\b(\d) ?(?:x|times)(?: (?:a|per))? ?day\b|\b(\d) ?(?:x|times) daily\b')
+EVERY_HOURS_RE = re.compile(r'\b(?:every (\d{1,3}) ?(?:hours?|hrs?|h)|q ?(\d{1,3}) ?h(?:rs?)?)\b')
+EVERY_DAYS_RE = re.compile(r'\bevery (\d{1,2}) days?\b')
+CLOCK_RE = re.compile(r'\b(\d{1,2})(?::(\d{2}))? ?(am|pm)\b|\b(\d{1,2}):(\d{2})\b')
+
+
+def parse_frequency(text):
+    """Return the Schedule for free-text ``text``, or None if it has none."""
+    text = ' '.join((text or '').lower().replace('-', ' ').replace('.', '').split())
+    if not text or AS_NEEDED_RE.search(text):
+        return None
+
+    match = EVERY_HOURS_RE.search(text)
+    if match:
+        hours = int(match.group(1) or match.group(2))
+        return Schedule((), 1, hours) if 1 <= hours <= 24 * 7 else None
+
+    every_days = 1
+    match = EVERY_DAYS_RE.search(text)
+    if match:
+        every_days = int(match.group(1))
+    elif re.search(r'\b(?:every other day|alternate days|qod)\b', text):
+        every_days = 2
+    elif re.search(r'\b(?:weekly|once a week|every week)\b', text):
+        every_days = 7
+    if every_days < 1:
+        return None
+
+    clock_times = set()
+    for hour, minute, meridiem, hour24, minute24 in CLOCK_RE.findall(text):
+        if meridiem:
+            hour = int(hour) % 12 + (12 if meridiem == 'pm' else 0)
+            minute = int(minute or 0)
+        else:
+            hour, minute = int(hour24), int(minute24)
+        if hour < 24 and minute < 60:
+            clock_times.add(time(hour, minute))
+    if clock_times:
+        return Schedule(tuple(sorted(clock_times)), every_days, None)
+
+    match = TIMES_PER_DAY_RE.search(text)
+    per_day = int(match.group(1) or match.group(2)) if match else None
+    if per_day is None:
+        per_day = next((count for pattern, count in PER_DAY_WORDS if pattern.search(text)), None)
+    timing = next((at for pattern, at in TIMING_WORDS if pattern.search(text)), None)
+    if per_day is None and (every_days > 1 or timing is not None):
+        per_day = 1
+    if per_day not in STANDARD_TIMES:
+        return None
+    if per_day == 1 and timing is not None:
+        return Schedule((timing,), every_days, None)
+    return Schedule(STANDARD_TIMES[per_day], every_days, None)
+
+
+def dose_times(schedule, start_date, end_date, window_start, window_end):
+    """Aware due times of ``schedule`` in [window_start, window_end)."""
+    first = timezone.make_aware(datetime.combine(start_date, time.min))
+    if end_date is not None:
+        window_end = min(window_end, timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)))
+    window_start = max(window_start, first)
+    if window_start >= window_end:
+        return
+
+    if schedule.every_hours:
+        step = timedelta(hours=schedule.every_hours)
+        due = first + step * -(-(window_start - first) // step)  # first dose at or after window_start
+        while due < window_end:
+            yield due
+            due += step
+        return
+
+    day = timezone.localtime(window_start).date()
+    last_day = timezone.localtime(window_end).date()
+    while day <= last_day:
+        if (day - start_date).days % schedule.every_days == 0:
+            for at in schedule.times:
+                due = timezone.make_aware(datetime.combine(day, at))
+                if window_start <= due < window_end:
+                    yield due
+        day += timedelta(days=1)
+
+
+def horizon():
+    return timezone.now() + timedelta(hours=getattr(settings, 'MEDICATION_SCHEDULE_HORIZON_HOURS', 48))
+
+
+def scheduled_doses(medications, window_start, window_end):
+    """Unsaved ScheduledDose rows for ``medications`` in the window."""
+    cache = {}  # most medications share a handful of frequency strings
+    for medication in medications:
+        if not medication.is_active:
+            continue
+        if medication.frequency not in cache:
+            cache[medication.frequency] = parse_frequency(medication.frequency)
+        schedule = cache[medication.frequency]
+        if schedule is None:
+            continue
+        for due in dose_times(schedule, medication.start_date, medication.end_date, window_start, window_end):
+            yield ScheduledDose(medication_id=medication.pk, patient_id=medication.patient_id, due_at=due)
+
+
+def refresh_doses(medications, existing=True):
+    """
+    Replace the future doses of ``medications`` (instances or IDs). Pass
+    existing=False for medications just created, which have none to delete.
+    """
+    medications = list(medications)
+    if medications and not isinstance(medications[0], Medication):
+        medications = list(
+            Medication.objects.filter(pk__in=medications)
+            .only(*SCHEDULE_FIELDS).order_by()
+        )
+    if not medications:
+        return 0
+    now = timezone.now()
+    doses = list(scheduled_doses(medications, now, horizon()))
+    if not existing:
+        return len(ScheduledDose.objects.bulk_create(doses))
+    with transaction.atomic():
+        old = ScheduledDose.objects.filter(
+            medication_id__in=[medication.pk for medication in medications], due_at__gte=now
+        )
+        old._raw_delete(old.db)
+        return len(ScheduledDose.objects.bulk_create(doses))
+
+
+def materialize_doses(chunk_size=2000):
+    """
+    Extend every active medication's doses to the horizon and prune the
+    table. Only missing doses are inserted. Returns (created, deleted).
+    """
+    before = ScheduledDose.objects.count()
+    now = timezone.now()
+    today = timezone.localdate()
+    retention = timedelta(hours=getattr(settings, 'MEDICATION_DOSE_RETENTION_HOURS', 24))
+    stale = ScheduledDose.objects.filter(
+        Q(due_at__lt=now - retention)
+        | Q(due_at__gte=now) & (Q(medication__is_active=False) | Q(medication__end_date__lt=today))
+    )
+    deleted, _ = stale.delete()
+
+    medications = (
+        Medication.objects.filter(is_active=True, start_date__lte=horizon().date())
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=today))
+        .only(*SCHEDULE_FIELDS).order_by()
+    )
+    batch = []
+    for dose in scheduled_doses(medications.iterator(chunk_size=chunk_size), now, horizon()):
+        batch.append(dose)
+        if len(batch) >= chunk_size:
+            ScheduledDose.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ScheduledDose.objects.bulk_create(batch, ignore_conflicts=True)
+    return ScheduledDose.objects.count() - before + deleted, deleted
+
+
+# Signal handlers, connected in EhrConfig.ready()
+
+def medication_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or any(
+        field not in loaded or loaded[field] != getattr(instance, field) for field in SCHEDULE_FIELDS
+    ):
+        refresh_doses([instance], existing=not created)
+    loaded.update({field: getattr(instance, field) for field in SCHEDULE_FIELDS})
+    instance._loaded_values = loaded
@@ -0,0 +1,140 @@
+# Early-warning scoring
+# Computes NEWS2-style scores from VitalSign series. Readings are loaded as
+# columns with values_list() and scored with NumPy so a whole ward is scored
+# in a handful of array operations instead of a Python loop per reading.
+#
+# NEWS2 also scores respiration rate, supplemental oxygen and level of
+# consciousness. Those are not recorded in VitalSign, so the total here is
+# the partial score over heart rate, systolic blood pressure, SpO2 (scale 1)
+# and temperature.
+
+import numpy as np
+
+from .models import VitalSign
+
+VITAL_COLUMNS = (
+    'patient_id', 'recorded_at', 'heart_rate', 'blood_pressure_systolic',
+    'oxygen_saturation', 'temperature',
+)
+
+# (upper bound inclusive, points) bands, checked in order. The last band has
+# no upper bound.
+HEART_RATE_BANDS = [(40, 3), (50, 1), (90, 0), (110, 1), (130, 2), (None, 3)]
+SYSTOLIC_BANDS = [(90, 3), (100, 2), (110, 1), (219, 0), (None, 3)]
+OXYGEN_SATURATION_BANDS = [(91, 3), (93, 2), (95, 1), (None, 0)]
+TEMPERATURE_C_BANDS = [(35.0, 3), (36.0, 1), (38.0, 0), (39.0, 1), (None, 2)]
+
+
+def score_bands(values, bands):
+    """
+    Score an array of readings against NEWS2 bands.
+
+    Missing readings (NaN) score 0.
+    """
+    conditions = [values <= upper for upper, _ in bands[:-1]]
+    choices = [points for _, points in bands[:-1]]
+    scores = np.select(conditions, choices, default=bands[-1][1])
+    return np.where(np.isnan(values), 0, scores).astype(np.int8)
+
+
+def fahrenheit_to_celsius(values):
+    return np.round((values - 32.0) * 5.0 / 9.0, 1)
+
+
+def score_readings(heart_rate, systolic, oxygen_saturation, temperature_f):
+    """
+    Score parallel arrays of readings.
+
+    Returns (total, has_red_score) arrays, where ``has_red_score`` marks
+    readings with 3 points on any single parameter.
+    """
+    components = np.vstack([
+        score_bands(heart_rate, HEART_RATE_BANDS),
+        score_bands(systolic, SYSTOLIC_BANDS),
+        score_bands(oxygen_saturation, OXYGEN_SATURATION_BANDS),
+        score_bands(fahrenheit_to_celsius(temperature_f), TEMPERATURE_C_BANDS),
+    ])
+    return components.sum(axis=0), (components == 3).any(axis=0)
+
+
+def risk_level(total, has_red_score):
+    if total >= 7:
+        return 'high'
+    if total >= 5:
+        return 'medium'
+    if has_red_score:
+        return 'low-medium'
+    return 'low'
+
+
+def load_vital_columns(queryset):
+    """
+    Load the scored columns of a VitalSign queryset as NumPy arrays, sorted
+    by patient and time.
+    """
+    rows = list(
+        queryset.order_by('patient_id', 'recorded_at').values_list(*VITAL_COLUMNS)
+    )
+    if not rows:
+        return None
+    patient_ids, recorded_at, heart_rate, systolic, spo2, temperature = zip(*rows)
+    return {
+        'patient_id': np.array(patient_ids, dtype=np.int64),
+        'recorded_at': recorded_at,
+        'heart_rate': np.array(heart_rate, dtype=np.float64),
+        'systolic': np.array(systolic, dtype=np.float64),
+        'oxygen_saturation': np.array(spo2, dtype=np.float64),
+        'temperature': np.array(temperature, dtype=np.float64),
+    }
+
+
+def compute_early_warning_scores(queryset=None, history=False):
+    """
+    Score every reading in ``queryset`` and summarise per patient.
+
+    Returns a dict keyed by patient ID with the latest score, its risk level,
+    the change since the previous reading and the maximum over the series.
+    With ``history=True`` each summary also carries the full scored series.
+    """
+    if queryset is None:
+        queryset = VitalSign.objects.all()
+
+    columns = load_vital_columns(queryset)
+    if columns is None:
+        return {}
+
+    totals, red = score_readings(
+        columns['heart_rate'], columns['systolic'],
+        columns['oxygen_saturation'], columns['temperature'],
+    )
+
+    # Rows are sorted by patient, so each patient is one contiguous slice.
+    patient_ids = columns['patient_id']
+    starts = np.flatnonzero(np.r_[True, patient_ids[1:] != patient_ids[:-1]])
+    ends = np.r_[starts[1:], len(patient_ids)] - 1
+    previous = np.where(ends > starts, totals[ends - 1], totals[ends])
+    maxima = np.maximum.reduceat(totals, starts)
+    counts = ends - starts + 1
+
+    results = {}
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        latest = int(totals[end])
+        summary = {
+            'patient': int(patient_ids[end]),
+            'recorded_at': columns['recorded_at'][end],
+            'score': latest,
+            'risk': risk_level(latest, bool(red[end])),
+            'trend': latest - int(previous[i]),
+            'max_score': int(maxima[i]),
+            'readings': int(counts[i]),
+        }
+        if history:
+            summary['history'] = [
+                {'recorded_at': recorded_at, 'score': int(score)}
+                for recorded_at, score in zip(
+                    columns['recorded_at'][start:end + 1],
+                    totals[start:end + 1].tolist(),
+                )
+            ]
+        results[summary['patient']] = summary
+    return results
@@ -0,0 +1,185 @@
+# Clinical note search
+# MedicalRecord chief complaints, diagnoses, treatment plans and notes,
+# Medication notes and Appointment reasons live in one SQLite FTS5 table,
+# ehr_clinical_search (migration 0009). Database triggers keep it in step with
+# every INSERT, UPDATE and DELETE on the source tables, including bulk,
+# raw and archive moves, so application code never writes to it. Archived
+# visits drop out of the index and come back when restored.
+#
+# Index rows use rowid = source id * 4 + source code. The indexed
+# patient_key column holds 'p<patient_id>', so a patient-scoped search
+# intersects two posting lists instead of filtering every match. Search
+# terms are matched against the text columns only.
+#
+# Ranking is BM25 with column weights chief_complaint 4, diagnosis 3,
+# treatment_plan 2, reason 2, notes 1. Snippets are built for one page of
+# results only.
+#
+# Latency targets for a 10M-note corpus (index ~40% of the note text):
+#     patient-scoped query                        p95 < 20ms
+#     practice-wide, selective terms (<10k hits)  p95 < 50ms
+#     practice-wide, common terms (~1M hits)      p95 < 1s; every hit is
+#         scored, so narrow with more terms, a patient or a source
+# Run `python manage.py rebuild_search_index` after bulk loads that bypass
+# SQL (e.g. restoring a database dump without triggers), and to optimize.
+
+import html
+import re
+import time
+
+from django.db import connection, transaction
+
+from .models import Appointment, MedicalRecord, Medication
+
+TABLE = 'ehr_clinical_search'
+TEXT_COLUMNS = ('chief_complaint', 'diagnosis', 'treatment_plan', 'notes', 'reason')
+
+# source -> (model, rowid code, indexed fields, date field)
+SOURCES = {
+    'medical_record': (
+        MedicalRecord, 1, ('chief_complaint', 'diagnosis', 'treatment_plan', 'notes'), 'visit_date'
+    ),
+    'medication': (Medication, 2, ('notes',), 'start_date'),
+    'appointment': (Appointment, 3, ('reason',), 'appointment_date'),
+}
+
+# Private-use markers survive escaping and are turned into <mark> afterwards
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class InvalidSearchQuery(ValueError):
+    pass
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match(query):
+    """
+    Turn user input into an FTS5 MATCH expression over the text columns.
+    Every word or "quoted phrase" must appear; a trailing * makes a word a
+    prefix. FTS5 operators in the input are treated as plain words.
+    """
+    terms = []
+    for phrase, word in TERM_RE.findall(query or ''):
+        text = phrase or word
+        prefix = bool(word) and text.endswith('*')
+        text = text.rstrip('*').replace('"', '')
+        if text.strip():
+            terms.append(f'"{text}"' + ('*' if prefix else ''))
+    if not terms:
+        raise InvalidSearchQuery('Enter at least one search term.')
+    # A column filter, so a term like "p42" cannot match patient_key
+    return f'{{{" ".join(TEXT_COLUMNS)}}} : ({" ".join(terms)})'
+
+
+def render_snippet(snippet):
+    escaped = html.escape(snippet)
+    return escaped.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def search(query, patient_id=None, source=None, limit=20, offset=0):
+    """
+    Run a ranked search. Returns (results, has_more); each result has the
+    source, object id, patient, date, best matching field, score and an
+    HTML-escaped snippet with matches wrapped in <mark>.
+    """
+    if not is_available():
+        raise SearchUnavailable('Full-text search requires SQLite with FTS5.')
+    if source is not None and source not in SOURCES:
+        raise InvalidSearchQuery(f'"source" must be one of: {", ".join(SOURCES)}.')
+
+    match = build_match(query)
+    if patient_id is not None:
+        match = f'patient_key:"p{int(patient_id)}" AND ({match})'
+    where = f'{TABLE} MATCH %s'
+    params = [match]
+    if source is not None:
+        where += ' AND source = %s'
+        params.append(source)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, source, object_id, patient_id, rank FROM {TABLE} '
+            f'WHERE {where} ORDER BY rank LIMIT %s OFFSET %s',
+            params + [limit + 1, offset],
+        )
+        hits = cursor.fetchall()
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        snippets = {}
+        if hits:
+            # Second pass: snippets for this page only, one per text column
+            columns = ', '.join(
+                f"snippet({TABLE}, {index}, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16)"
+                for index, _ in enumerate(TEXT_COLUMNS, start=4)
+            )
+            rowids = [hit[0] for hit in hits]
+            cursor.execute(
+                f'SELECT rowid, {columns} FROM {TABLE} WHERE {TABLE} MATCH %s '
+                f'AND rowid IN ({", ".join(["%s"] * len(rowids))})',
+                [match] + rowids,
+            )
+            snippets = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    dates = {}
+    for name, (model, _, _, date_field) in SOURCES.items():
+        ids = [hit[2] for hit in hits if hit[1] == name]
+        if ids:
+            dates[name] = dict(model.objects.filter(pk__in=ids).values_list('pk', date_field))
+
+    results = []
+    for rowid, hit_source, object_id, hit_patient_id, rank in hits:
+        fields = SOURCES[hit_source][2]
+        field, snippet = next(
+            (
+                (column, text) for column, text in zip(TEXT_COLUMNS, snippets.get(rowid, ()))
+                if column in fields and HIGHLIGHT_START in text
+            ),
+            (fields[0], ''),
+        )
+        results.append({
+            'source': hit_source,
+            'id': object_id,
+            'patient': hit_patient_id,
+            'date': dates.get(hit_source, {}).get(object_id),
+            'field': field,
+            'score': round(-rank, 4),
+            'snippet': render_snippet(snippet),
+        })
+    return results, has_more
+
+
+def rebuild_search_index():
+    """
+    Repopulate the index from the source tables and merge its segments.
+    Returns {source: rows indexed} plus 'seconds'.
+    """
+    if not is_available():
+        raise SearchUnavailable('Full-text search requires SQLite with FTS5.')
+    quote = connection.ops.quote_name
+    insert_columns = ', '.join(('rowid', 'source', 'object_id', 'patient_id', 'patient_key') + TEXT_COLUMNS)
+    started = time.perf_counter()
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for name, (model, code, fields, _) in SOURCES.items():
+            values = [
+                f'id * 4 + {code}', '%s', 'id', 'patient_id', "'p' || patient_id",
+            ] + [quote(column) if column in fields else "''" for column in TEXT_COLUMNS]
+            cursor.execute(
+                f'INSERT INTO {TABLE}({insert_columns}) '
+                f'SELECT {", ".join(values)} FROM {quote(model._meta.db_table)}',
+                [name],
+            )
+            counts[name] = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
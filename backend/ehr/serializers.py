@@ -1,17 +1,49 @@
 from rest_framework import serializers
-from .models import Patient, MedicalRecord, Medication, VitalSign, Appointment
+from .models import (
+    Patient, PatientLatestVitals, MedicalRecord, Medication, VitalSign, Appointment, SlowQuery,
+    ScheduledDose, ChangeEvent
+)
+
+class LatestVitalsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PatientLatestVitals
+        fields = [
+            'patient', 'vital_sign_id', 'recorded_at', 'blood_pressure_systolic',
+            'blood_pressure_diastolic', 'heart_rate', 'temperature', 'weight',
+            'height', 'oxygen_saturation'
+        ]
+        read_only_fields = fields
 
 class PatientSerializer(serializers.ModelSerializer):
+    latest_vitals = LatestVitalsSerializer(read_only=True)
+
     class Meta:
         model = Patient
         fields = [
             'id', 'medical_record_number', 'first_name', 'last_name', 
             'date_of_birth', 'gender', 'blood_type', 'phone', 'email', 
             'address', 'emergency_contact_name', 'emergency_contact_phone', 
-            'created_at', 'updated_at'
+            'latest_vitals', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+class PatientSummarySerializer(PatientSerializer):
+    """
+    Patient with chart summary statistics.
+
+    Expects a queryset annotated by ``Patient.objects.with_chart_summary()``.
+    """
+    last_visit_date = serializers.DateTimeField(read_only=True)
+    next_appointment_date = serializers.DateTimeField(read_only=True)
+    next_appointment_department = serializers.CharField(read_only=True)
+    active_medication_count = serializers.IntegerField(read_only=True)
+
+    class Meta(PatientSerializer.Meta):
+        fields = PatientSerializer.Meta.fields + [
+            'last_visit_date', 'next_appointment_date', 'next_appointment_department',
+            'active_medication_count'
+        ]
+
 class MedicalRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
@@ -31,6 +63,14 @@ class MedicationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+class ScheduledDoseSerializer(serializers.ModelSerializer):
+    medication_name = serializers.CharField(source='medication.medication_name', read_only=True)
+    dosage = serializers.CharField(source='medication.dosage', read_only=True)
+
+    class Meta:
+        model = ScheduledDose
+        fields = ['id', 'due_at', 'patient', 'medication', 'medication_name', 'dosage']
+
 class VitalSignSerializer(serializers.ModelSerializer):
     class Meta:
         model = VitalSign
@@ -49,3 +89,36 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'reason', 'status', 'notes', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+
+class VitalReadingSerializer(serializers.Serializer):
+    """One monitor reading for the compact vital stream store."""
+    recorded_at = serializers.DateTimeField()
+    blood_pressure_systolic = serializers.IntegerField(min_value=0, max_value=300)
+    blood_pressure_diastolic = serializers.IntegerField(min_value=0, max_value=200)
+    heart_rate = serializers.IntegerField(min_value=0, max_value=300)
+    temperature = serializers.DecimalField(
+        max_digits=4, decimal_places=1, min_value=90, max_value=110, required=False, allow_null=True
+    )
+    oxygen_saturation = serializers.IntegerField(
+        min_value=0, max_value=100, required=False, allow_null=True
+    )
+
+class VitalStreamSerializer(serializers.Serializer):
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    readings = VitalReadingSerializer(many=True, allow_empty=False)
+
+class SlowQuerySerializer(serializers.ModelSerializer):
+    mean_ms = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SlowQuery
+        fields = [
+            'fingerprint', 'database', 'sql', 'count', 'total_ms', 'mean_ms', 'max_ms',
+            'sample_sql', 'sample_params', 'sample_path', 'plan', 'plan_captured_at',
+            'first_seen', 'last_seen'
+        ]
+
+class ChangeEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChangeEvent
+        fields = ['id', 'position', 'occurred_at', 'resource', 'object_id', 'patient_id', 'operation', 'changes']
@@ -0,0 +1,71 @@
+# Signal wiring
+# Connected from EhrConfig.ready() so handlers are registered exactly once.
+
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import Appointment, Medication, Patient, VitalSign
+from . import calendars, dedup, live, metrics, outbox, rollups, schedules, slowqueries, snapshots
+from .autocomplete import autocomplete_index
+
+
+def connect_signals():
+    pre_save.connect(rollups.appointment_pre_save, sender=Appointment,
+                     dispatch_uid='ehr.rollups.pre_save')
+    post_save.connect(rollups.appointment_saved, sender=Appointment,
+                      dispatch_uid='ehr.rollups.post_save')
+    post_delete.connect(rollups.appointment_deleted, sender=Appointment,
+                        dispatch_uid='ehr.rollups.post_delete')
+
+    post_save.connect(snapshots.vital_sign_saved, sender=VitalSign,
+                      dispatch_uid='ehr.snapshots.post_save')
+    post_delete.connect(snapshots.vital_sign_deleted, sender=VitalSign,
+                        dispatch_uid='ehr.snapshots.post_delete')
+
+    post_save.connect(schedules.medication_saved, sender=Medication,
+                      dispatch_uid='ehr.schedules.post_save')
+
+    post_save.connect(dedup.patient_saved, sender=Patient,
+                      dispatch_uid='ehr.dedup.post_save')
+    post_save.connect(autocomplete_index.patient_saved, sender=Patient,
+                      dispatch_uid='ehr.autocomplete.post_save')
+    post_delete.connect(autocomplete_index.patient_deleted, sender=Patient,
+                        dispatch_uid='ehr.autocomplete.post_delete')
+
+    post_save.connect(live.vital_sign_saved, sender=VitalSign,
+                      dispatch_uid='ehr.live.vital_sign_post_save')
+    pre_save.connect(live.appointment_pre_save, sender=Appointment,
+                     dispatch_uid='ehr.live.appointment_pre_save')
+    post_save.connect(live.appointment_saved, sender=Appointment,
+                      dispatch_uid='ehr.live.appointment_post_save')
+
+    pre_save.connect(calendars.appointment_pre_save, sender=Appointment,
+                     dispatch_uid='ehr.calendars.pre_save')
+    post_save.connect(calendars.appointment_saved, sender=Appointment,
+                      dispatch_uid='ehr.calendars.post_save')
+    post_delete.connect(calendars.appointment_deleted, sender=Appointment,
+                        dispatch_uid='ehr.calendars.post_delete')
+    post_save.connect(calendars.patient_saved, sender=Patient,
+                      dispatch_uid='ehr.calendars.patient_post_save')
+
+    connection_created.connect(slowqueries.slow_query_log.install,
+                               dispatch_uid='ehr.slowqueries.connection_created')
+    request_started.connect(slowqueries.request_started,
+                            dispatch_uid='ehr.slowqueries.request_started')
+    request_finished.connect(slowqueries.request_finished,
+                             dispatch_uid='ehr.slowqueries.request_finished')
+
+    connection_created.connect(metrics.install, dispatch_uid='ehr.metrics.connection_created')
+    request_finished.connect(metrics.request_finished, dispatch_uid='ehr.metrics.request_finished')
+
+    # Last: the change-feed post_save handler resets _loaded_values, which
+    # the handlers above compare against
+    for model in outbox.TRACKED_MODELS:
+        label = model._meta.model_name
+        pre_save.connect(outbox.instance_pre_save, sender=model,
+                         dispatch_uid=f'ehr.outbox.{label}.pre_save')
+        post_save.connect(outbox.instance_saved, sender=model,
+                          dispatch_uid=f'ehr.outbox.{label}.post_save')
+        post_delete.connect(outbox.instance_deleted, sender=model,
+                            dispatch_uid=f'ehr.outbox.{label}.post_delete')
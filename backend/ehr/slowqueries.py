@@ -0,0 +1,299 @@
+# Slow-query log
+# Every database connection gets an execute wrapper that times each query.
+# Queries slower than SLOW_QUERY_THRESHOLD_MS are queued, with their
+# parameters and the request path that ran them, for a background thread;
+# the request itself never waits on more than a perf_counter() call.
+#
+# The thread groups queued queries by fingerprint (the SQL with literals,
+# placeholders and IN lists normalized away, so `?ordering=` and filter
+# combinations get separate entries but different IDs do not) and adds them
+# to one SlowQuery row per fingerprint. It runs EXPLAIN (EXPLAIN QUERY PLAN
+# on SQLite) on its own connection for the slowest execution when a
+# fingerprint is new, slower than ever before, or its plan is older than
+# SLOW_QUERY_PLAN_TTL seconds.
+#
+# Parameters and query-string values carry patient identifiers (MRNs, names,
+# dates of birth), so they are used for EXPLAIN and then dropped: SlowQuery
+# rows keep an empty sample_params and the path with values replaced by ?.
+# Set SLOW_QUERY_CAPTURE_PARAMS = True to keep them, e.g. on a test system.
+#
+# Report: `python manage.py slow_queries` or GET /api/slow-queries/ (staff).
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import timedelta
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+ORDERINGS = {
+    'total': '-total_ms',
+    'mean': '-mean_ms',
+    'max': '-max_ms',
+    'count': '-count',
+}
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+VALUES_RE = re.compile(r'(VALUES \(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+', re.IGNORECASE)
+SPACE_RE = re.compile(r'\s+')
+
+# Path and query string of the request being served, set from the
+# request_started signal
+current_path = ContextVar('slow_query_path', default='')
+
+
+def normalize_sql(sql):
+    """SQL with literals and placeholders as ?, and lists of them as (...)."""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    sql = VALUES_RE.sub(r'\1', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    def __init__(self):
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'SLOW_QUERY_LOG_ENABLED', True)
+
+    @property
+    def threshold_ms(self):
+        return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'SLOW_QUERY_QUEUE_SIZE', 1000)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'SLOW_QUERY_FLUSH_INTERVAL', 1.0)
+
+    @property
+    def plan_ttl(self):
+        return getattr(settings, 'SLOW_QUERY_PLAN_TTL', 3600)
+
+    @property
+    def capture_params(self):
+        return getattr(settings, 'SLOW_QUERY_CAPTURE_PARAMS', False)
+
+    # Timing (any thread, via connection.execute_wrappers)
+
+    def install(self, sender, connection, **kwargs):
+        """connection_created receiver: wrap every query on the connection."""
+        if self.execute not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.execute)
+
+    def execute(self, execute, sql, params, many, context):
+        if getattr(self._local, 'suppressed', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms and self.enabled:
+                self.record(sql, params, many, elapsed_ms, context['connection'].alias)
+
+    def record(self, sql, params, many, elapsed_ms, alias):
+        if self._pid != os.getpid():
+            self._start()
+        if len(self._entries) >= self.max_size:
+            self.dropped += 1
+            return
+        # executemany() has one parameter list per row; there is no single
+        # statement to explain
+        self._entries.append(
+            (sql, None if many else params, elapsed_ms, alias, current_path.get(), timezone.now())
+        )
+        self._wakeup.set()
+
+    # Aggregation (background thread)
+
+    def _start(self):
+        # Also runs in forked workers, where the parent's thread is gone.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._entries.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Queries made here (upserts, EXPLAIN) must not be logged themselves
+        self._local.suppressed = True
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            time.sleep(self.flush_interval)  # let a burst of slow queries collect
+            self.flush()
+
+    def flush(self):
+        """Aggregate every queued query into SlowQuery rows."""
+        if self._pid != os.getpid():
+            return 0
+        entries = []
+        while self._entries:
+            entries.append(self._entries.popleft())
+        groups = {}
+        for sql, params, elapsed_ms, alias, path, seen_at in entries:
+            normalized = normalize_sql(sql)
+            key = (alias, fingerprint(normalized))
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': -1.0,
+                    'first_seen': seen_at,
+                }
+            group['count'] += 1
+            group['total_ms'] += elapsed_ms
+            group['last_seen'] = seen_at
+            if elapsed_ms > group['max_ms']:
+                group.update(max_ms=elapsed_ms, sample=(sql, params, path))
+        try:
+            for (alias, key), group in groups.items():
+                try:
+                    self.save(alias, key, group)
+                except Exception:
+                    logger.exception('Failed to record slow query %s', key)
+        finally:
+            if threading.current_thread() is self._thread:
+                connections.close_all()
+        if self.dropped:
+            logger.warning('Slow-query queue full: %d queries not recorded', self.dropped)
+            self.dropped = 0
+        return len(entries)
+
+    def save(self, alias, key, group):
+        sql, params, path = group['sample']
+        capture = self.capture_params
+        sample = {
+            'max_ms': group['max_ms'],
+            'sample_sql': sql,
+            'sample_params': json.dumps(params, default=str) if capture and params is not None else '',
+            'sample_path': (path if capture else redact_path(path))[:500],
+        }
+        existing = SlowQuery.objects.filter(database=alias, fingerprint=key).values(
+            'max_ms', 'plan_captured_at'
+        ).first()
+        if existing is None:
+            try:
+                SlowQuery.objects.create(
+                    fingerprint=key, database=alias, sql=group['sql'],
+                    count=group['count'], total_ms=group['total_ms'],
+                    first_seen=group['first_seen'], last_seen=group['last_seen'],
+                    plan=self.explain(alias, sql, params), plan_captured_at=timezone.now(),
+                    **sample,
+                )
+                return
+            except IntegrityError:  # another worker created it first
+                existing = SlowQuery.objects.filter(database=alias, fingerprint=key).values(
+                    'max_ms', 'plan_captured_at'
+                ).get()
+
+        updates = {
+            'count': F('count') + group['count'],
+            'total_ms': F('total_ms') + group['total_ms'],
+            'last_seen': group['last_seen'],
+        }
+        slower = group['max_ms'] > existing['max_ms']
+        if slower:
+            updates.update(sample)
+        captured_at = existing['plan_captured_at']
+        if slower or captured_at is None or captured_at < timezone.now() - timedelta(seconds=self.plan_ttl):
+            updates.update(plan=self.explain(alias, sql, params), plan_captured_at=timezone.now())
+        SlowQuery.objects.filter(database=alias, fingerprint=key).update(**updates)
+
+    def explain(self, alias, sql, params):
+        """The database's plan for one statement, as text ('' if unavailable)."""
+        if params is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return ''
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                rows = cursor.fetchall()
+        except Exception as exc:
+            # e.g. a temporary table that only existed on the original connection
+            return f'EXPLAIN failed: {exc}'
+        if connection.vendor == 'sqlite':
+            return format_sqlite_plan(rows)
+        return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def redact_path(path):
+    """``path`` with every query-string value replaced by ?."""
+    path, _, query = path.partition('?')
+    if not query:
+        return path
+    return path + '?' + '&'.join(f'{key}=?' for key, _ in parse_qsl(query, keep_blank_values=True))
+
+
+def format_sqlite_plan(rows):
+    """Indent EXPLAIN QUERY PLAN (id, parent, notused, detail) rows as a tree."""
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth = depths[node_id] = depths.get(parent, -1) + 1
+        lines.append(f"{'  ' * depth}{detail}")
+    return '\n'.join(lines)
+
+
+def top_slow_queries(order='total', limit=20):
+    """SlowQuery rows (with mean_ms) ordered by one of ORDERINGS."""
+    return SlowQuery.objects.annotate(
+        mean_ms=F('total_ms') / F('count')
+    ).order_by(ORDERINGS[order])[:limit]
+
+
+slow_query_log = SlowQueryLog()
+
+
+# Signal handlers
+
+def request_started(sender, environ=None, scope=None, **kwargs):
+    if environ is not None:
+        path, query = environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', '')
+    elif scope is not None:
+        path, query = scope.get('path', ''), scope.get('query_string', b'')
+        if isinstance(query, bytes):
+            query = query.decode('latin-1')
+    else:
+        return
+    current_path.set(f'{path}?{query}' if query else path)
+
+
+def request_finished(sender, **kwargs):
+    current_path.set('')
@@ -0,0 +1,103 @@
+# Latest-vitals snapshot
+# Keeps PatientLatestVitals pointing at each patient's newest VitalSign.
+#
+# A save only touches the snapshot when the reading is at least as new as the
+# current one, or when it *is* the current one (it may have been edited or
+# back-dated). Deletes only matter when they remove the current reading; the
+# next newest reading is then found through the (patient, -recorded_at) index.
+# Queryset .update()/.delete() bypass signals, so bulk code paths call
+# rebuild_latest_vitals() for the patients they touched.
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import PatientLatestVitals, VitalSign
+
+SNAPSHOT_FIELDS = PatientLatestVitals.SNAPSHOT_FIELDS
+
+
+def snapshot_values(vital):
+    values = {field: getattr(vital, field) for field in SNAPSHOT_FIELDS}
+    values['vital_sign_id'] = vital.pk
+    return values
+
+
+def refresh_latest_vitals(patient_id):
+    """Recompute one patient's snapshot from VitalSign."""
+    latest = (
+        VitalSign.objects.filter(patient_id=patient_id)
+        .order_by('-recorded_at', '-pk')
+        .first()
+    )
+    if latest is None:
+        PatientLatestVitals.objects.filter(patient_id=patient_id).delete()
+    else:
+        PatientLatestVitals.objects.update_or_create(
+            patient_id=patient_id, defaults=snapshot_values(latest)
+        )
+
+
+def rebuild_latest_vitals(patient_ids=None):
+    """
+    Recompute snapshots for ``patient_ids`` (or every patient) with one
+    greatest-per-group query. Returns the number of snapshots written.
+    """
+    newest = VitalSign.objects.filter(
+        patient_id=OuterRef('patient_id')
+    ).order_by('-recorded_at', '-pk').values('pk')[:1]
+    latest = VitalSign.objects.filter(pk=Subquery(newest)).order_by()
+    snapshots = PatientLatestVitals.objects.all()
+    if patient_ids is not None:
+        patient_ids = list(patient_ids)
+        latest = latest.filter(patient_id__in=patient_ids)
+        snapshots = snapshots.filter(patient_id__in=patient_ids)
+
+    with transaction.atomic():
+        snapshots.delete()
+        created = PatientLatestVitals.objects.bulk_create(
+            (
+                PatientLatestVitals(patient_id=vital.patient_id, **snapshot_values(vital))
+                for vital in latest.iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(created)
+
+
+# Signal handlers, connected in EhrConfig.ready()
+
+def vital_sign_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    recorded_at = VitalSign._meta.get_field('recorded_at').to_python(instance.recorded_at)
+    with transaction.atomic():
+        snapshot = (
+            PatientLatestVitals.objects.select_for_update()
+            .filter(patient_id=instance.patient_id)
+            .first()
+        )
+        if snapshot is None or (
+            (recorded_at, instance.pk) >= (snapshot.recorded_at, snapshot.vital_sign_id)
+        ):
+            PatientLatestVitals.objects.update_or_create(
+                patient_id=instance.patient_id, defaults=snapshot_values(instance)
+            )
+        elif snapshot.vital_sign_id == instance.pk:
+            # The current reading was back-dated; another one may now be newer
+            refresh_latest_vitals(instance.patient_id)
+
+        if not created:
+            # The reading may have moved to another patient
+            for patient_id in (
+                PatientLatestVitals.objects.filter(vital_sign_id=instance.pk)
+                .exclude(patient_id=instance.patient_id)
+                .values_list('patient_id', flat=True)
+            ):
+                refresh_latest_vitals(patient_id)
+
+
+def vital_sign_deleted(sender, instance, **kwargs):
+    if PatientLatestVitals.objects.filter(
+        patient_id=instance.patient_id, vital_sign_id=instance.pk
+    ).exists():
+        refresh_latest_vitals(instance.patient_id)
@@ -0,0 +1,105 @@
+# Admin template tags
+# calendar_hierarchy replaces the admin's date_hierarchy tag for this app's
+# changelists (templates/admin/ehr/change_list.html). The stock tag lists the
+# years, months or days that have rows with a SELECT DISTINCT over every
+# filtered row, a scan of the whole table at the top level. This one reads
+# only the first and last date, two probes of the field's index, and lists
+# every period of the calendar between them, including empty ones.
+
+import calendar
+from datetime import date
+
+from django import template
+from django.contrib.admin.utils import get_fields_from_path
+from django.db import models
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = template.Library()
+
+
+def date_bounds(cl, field_name):
+    """First and last value of the field among the filtered rows, as dates."""
+    values = cl.queryset.order_by(field_name).values_list(field_name, flat=True)
+    bounds = [values.first(), values.last()]
+    if None in bounds:
+        return None
+    field = get_fields_from_path(cl.model, field_name)[-1]
+    if isinstance(field, models.DateTimeField):
+        bounds = [timezone.localtime(value) if timezone.is_aware(value) else value for value in bounds]
+        bounds = [value.date() for value in bounds]
+    return bounds
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def calendar_hierarchy(cl):
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year = cl.params.get(year_field)
+    month = cl.params.get(month_field)
+    day = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if year and month and day:
+        day = date(int(year), int(month), int(day))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year, month_field: month}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+
+    bounds = date_bounds(cl, field_name)
+    if bounds is None and not year:
+        return {'show': False}
+    # No rows in the selected period: keep the way back, list no choices
+    first, last = bounds or (date.max, date.min)
+    if not year and first.year == last.year:
+        # Start at the first level with a choice, as the stock tag does
+        year = first.year
+        if first.month == last.month:
+            month = first.month
+
+    if year and month:
+        year, month = int(year), int(month)
+        days = [date(year, month, number) for number in range(1, calendar.monthrange(year, month)[1] + 1)]
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year}), 'title': str(year)},
+            'choices': [
+                {
+                    'link': link({year_field: year, month_field: month, day_field: day.day}),
+                    'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT')),
+                }
+                for day in days if first <= day <= last
+            ],
+        }
+    if year:
+        year = int(year)
+        months = [date(year, month, 1) for month in range(1, 13)]
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year, month_field: month.month}),
+                    'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT')),
+                }
+                for month in months if first.replace(day=1) <= month <= last
+            ],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(year)}), 'title': str(year)}
+            for year in range(first.year, last.year + 1)
+        ],
+    }
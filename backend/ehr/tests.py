@@ -1,3 +1,1917 @@
-from django.test import TestCase
+"""
+Query-count and latency regression tests for every API endpoint.
 
-# Create your tests here.
+Each endpoint below is called against one fixture that grows from 1 to 100
+to 10,000 related rows (patients, and visits, medications, vitals and
+appointments on one chart). At every size:
+
+    * the number of SQL queries must equal the endpoint's budget exactly,
+      so a new query (an N+1 in a serializer, an extra lookup in a mixin)
+      fails even when it is cheap, and a removed one prompts a lower budget;
+    * the number must not change with the size of the data, so O(n)
+      query growth fails even if someone raises a budget to match;
+    * with EHR_PERF_LATENCY=1, the median latency must stay within
+      EHR_PERF_TOLERANCE (default 0.5, i.e. +50%, plus a few milliseconds of
+      slack) of perf_baselines.json.
+
+Latency is opt-in because wall-clock baselines only hold on the machine that
+recorded them; perf_baselines.json is not committed. Every call runs inside
+a rolled-back savepoint, so writes do not change the fixture. Run with:
+    python manage.py test backend.ehr
+Record latency baselines (on the machine that runs the latency check, and
+again after an intended change) with:
+    EHR_PERF_RECORD=1 python manage.py test backend.ehr
+then compare against them with:
+    EHR_PERF_LATENCY=1 python manage.py test backend.ehr
+
+The test cases after the performance suite cover the behaviour of the
+subsystems behind the endpoints.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .archive import archive_horizon, archive_rows
+from .audit import AuditBuffer, audit_log
+from .autocomplete import RECORD_FIELDS, PrefixIndex, autocomplete_index
+from .cohorts import bitmap_to_ids, ids_to_bitmap, resolve_cohort
+from .dedup import block_memberships, block_pairs, possible_duplicates, rebuild_blocking_keys, soundex
+from .dispatch import dispatch_subrequest
+from .expiry import AUDIT_ACTOR, TRANSITIONS, ended_medications, run_transition
+from .live import MAX_DATAGRAM, ChangeBroadcaster, broadcaster
+from .models import (
+    AccessLog, Appointment, AppointmentRollup, ChangeConsumer, ChangeEvent, MedicalRecord, Medication,
+    Patient, PatientLatestVitals, ScheduledDose, SlowQuery, VitalSign, VitalSignBlock,
+)
+from .outbox import acknowledge, compact, consumer_offset, read_changes
+from .purge import CHILDREN, purge_patient
+from .rollups import rebuild_rollups
+from .schedules import Schedule, dose_times, materialize_doses, parse_frequency
+from .snapshots import rebuild_latest_vitals
+from .serializers import VitalSignSerializer
+from .slowqueries import SlowQueryLog, current_path, fingerprint, format_sqlite_plan, normalize_sql, redact_path
+from .views import MedicationViewSet, stream_events
+from .vitalstore import (
+    BYTES_PER_READING, COLUMNS as BLOCK_COLUMNS, MISSING_OXYGEN_SATURATION, MISSING_TEMPERATURE, append_readings,
+    decode_block, encode_readings, read_readings, readings_to_json,
+)
+
+SIZES = (1, 100, 10000)
+BASELINE_FILE = Path(__file__).with_name('perf_baselines.json')
+TOLERANCE = float(os.environ.get('EHR_PERF_TOLERANCE', 0.5))
+SLACK_MS = float(os.environ.get('EHR_PERF_SLACK_MS', 5))
+RECORD = os.environ.get('EHR_PERF_RECORD') == '1'
+LATENCY = RECORD or os.environ.get('EHR_PERF_LATENCY') == '1'
+TIMED_RUNS = 5
+
+NEW_PATIENT = {
+    'medical_record_number': 'MRN-NEW', 'first_name': 'Nora', 'last_name': 'Quinn',
+    'date_of_birth': '1975-06-01', 'gender': 'F', 'phone': '555-0199', 'email': 'nora@example.com',
+    'address': '1 Main St', 'emergency_contact_name': 'Sam Quinn', 'emergency_contact_phone': '555-0198',
+}
+
+
+def create_patient(number=1, **fields):
+    """A patient for the behaviour tests below."""
+    values = {
+        'medical_record_number': f'MRN-T{number:04d}', 'first_name': 'Ada', 'last_name': f'Test{number}',
+        'date_of_birth': '1980-01-01', 'gender': 'F', 'phone': '555-0100', 'address': '3 Main St',
+        'emergency_contact_name': 'Contact', 'emergency_contact_phone': '555-0000',
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+def create_vital(patient, recorded_at, **fields):
+    values = {
+        'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80, 'heart_rate': 70,
+        'temperature': Decimal('98.6'), 'weight': Decimal('160.00'), 'oxygen_saturation': 98,
+    }
+    values.update(fields)
+    return VitalSign.objects.create(patient=patient, recorded_at=recorded_at, **values)
+
+
+def create_record(patient, visit_date=None, **fields):
+    values = {
+        'chief_complaint': 'Headache', 'diagnosis': 'Migraine', 'treatment_plan': 'Rest',
+        'doctor_name': 'Dr. Lee',
+    }
+    values.update(fields)
+    return MedicalRecord.objects.create(patient=patient, visit_date=visit_date or timezone.now(), **values)
+
+
+def create_medication(patient, **fields):
+    values = {
+        'medication_name': 'Aspirin', 'dosage': '10mg', 'frequency': 'Daily',
+        'start_date': timezone.localdate() - timedelta(days=30), 'prescribing_doctor': 'Dr. Lee',
+    }
+    values.update(fields)
+    return Medication.objects.create(patient=patient, **values)
+
+
+def create_appointment(patient, appointment_date, **fields):
+    values = {'doctor_name': 'Dr. Lee', 'department': 'Cardiology', 'reason': 'Check-up'}
+    values.update(fields)
+    return Appointment.objects.create(patient=patient, appointment_date=appointment_date, **values)
+
+
+def endpoints(ids):
+    """
+    (name, method, path, body, budget) for every endpoint and action.
+    ``budget`` is a query count, or {size: count} where a one-row chart takes
+    a different path. Savepoints count as queries.
+    """
+    patient, record, medication, vital, appointment = (
+        ids['patient'], ids['record'], ids['medication'], ids['vital'], ids['appointment']
+    )
+    now = timezone.now()
+    return [
+        # Patients
+        ('patients.list', 'GET', '/api/patients/', None, 2),
+        ('patients.list.summary', 'GET', '/api/patients/?summary=true', None, 2),
+        ('patients.list.search', 'GET', '/api/patients/?search=Pat', None, 2),
+        ('patients.retrieve', 'GET', f'/api/patients/{patient}/', None, 1),
+        ('patients.create', 'POST', '/api/patients/', NEW_PATIENT, 9),
+        ('patients.partial_update', 'PATCH', f'/api/patients/{patient}/', {'phone': '555-0111'}, 7),
+        ('patients.possible_duplicates', 'POST', '/api/patients/possible-duplicates/',
+         {'first_name': 'Pat', 'last_name': 'Target', 'date_of_birth': '1960-01-01'}, 2),
+        ('patients.autocomplete', 'GET', '/api/patients/autocomplete/?q=pat%20tar', None, 0),
+        ('patients.latest_vitals', 'GET', f'/api/patients/latest-vitals/?ids={patient}', None, 1),
+        ('patients.early_warning', 'GET', f'/api/patients/{patient}/early-warning/', None, 2),
+        ('patients.ward_early_warning', 'GET', '/api/patients/early-warning/?days=1', None, 1),
+        ('patients.destroy.background', 'DELETE', f'/api/patients/{patient}/?background=true', None, 1),
+        ('patients.bulk_update', 'POST', '/api/patients/bulk-update/',
+         {'ids': [patient], 'values': {'blood_type': 'B+'}}, 4),
+        # Medical records
+        ('medical_records.list', 'GET', f'/api/medical-records/?patient={patient}', None, 2),
+        ('medical_records.list.archive', 'GET',
+         f'/api/medical-records/?patient={patient}&start=2000-01-01', None, 2),
+        ('medical_records.retrieve', 'GET', f'/api/medical-records/{record}/', None, 1),
+        ('medical_records.create', 'POST', '/api/medical-records/', {
+            'patient': patient, 'visit_date': now.isoformat(), 'chief_complaint': 'Cough',
+            'diagnosis': 'Bronchitis', 'treatment_plan': 'Rest', 'doctor_name': 'Dr. Lee',
+        }, 3),
+        ('medical_records.partial_update', 'PATCH', f'/api/medical-records/{record}/',
+         {'notes': 'Reviewed'}, 3),
+        ('medical_records.destroy', 'DELETE', f'/api/medical-records/{record}/', None, 3),
+        ('medical_records.bulk_update', 'POST', '/api/medical-records/bulk-update/',
+         {'filter': {'patient': patient}, 'values': {'doctor_name': 'Dr. Park'}}, 4),
+        # Medications
+        ('medications.list', 'GET', f'/api/medications/?patient={patient}&is_active=true', None, 2),
+        ('medications.create', 'POST', '/api/medications/', {
+            'patient': patient, 'medication_name': 'Metformin', 'dosage': '500mg',
+            'frequency': 'Twice daily', 'start_date': now.date().isoformat(), 'prescribing_doctor': 'Dr. Lee',
+        }, 4),
+        ('medications.due', 'GET', '/api/medications/due/?hours=24', None, 2),
+        ('medications.due.patient', 'GET', f'/api/medications/due/?hours=24&patient={patient}', None, 2),
+        ('medications.bulk_delete', 'POST', '/api/medications/bulk-delete/',
+         {'filter': {'patient': patient, 'is_active': False}}, 5),
+        # Vital signs
+        ('vital_signs.list', 'GET', f'/api/vital-signs/?patient={patient}', None, 2),
+        ('vital_signs.create', 'POST', '/api/vital-signs/', {
+            'patient': patient, 'recorded_at': now.isoformat(), 'blood_pressure_systolic': 120,
+            'blood_pressure_diastolic': 80, 'heart_rate': 72, 'temperature': '98.6', 'weight': '160.00',
+        }, 10),
+        ('vital_signs.destroy', 'DELETE', f'/api/vital-signs/{vital}/', None, {1: 6, 100: 9, 10000: 9}),
+        ('vital_signs.bulk_delete', 'POST', '/api/vital-signs/bulk-delete/',
+         {'filter': {'patient': patient, 'recorded_at__lt': '2000-01-01T00:00:00Z'}}, 7),
+        # Appointments
+        ('appointments.list', 'GET', f'/api/appointments/?patient={patient}&status=scheduled', None, 2),
+        ('appointments.create', 'POST', '/api/appointments/', {
+            'patient': patient, 'appointment_date': (now + timedelta(days=3)).isoformat(),
+            'doctor_name': 'Dr. Lee', 'department': 'Triage', 'reason': 'Follow-up',
+        }, 7),
+        ('appointments.partial_update', 'PATCH', f'/api/appointments/{appointment}/',
+         {'status': 'completed'}, 8),
+        ('appointments.bulk_update', 'POST', '/api/appointments/bulk-update/',
+         {'ids': [appointment], 'values': {'status': 'cancelled'}}, 11),
+        ('appointments.calendar', 'GET', '/api/appointments/calendar/?days=7&refresh=true', None, 1),
+        ('appointments.calendar.department', 'GET',
+         '/api/appointments/calendar/?days=7&department=Cardiology&refresh=true', None, 1),
+        # Reporting and other endpoints
+        ('cohorts.create', 'POST', '/api/cohorts/?refresh=true',
+         {'filter': {'medication': {'name': 'Lisinopril', 'active': True}}}, 2),
+        ('appointment_stats.list', 'GET', '/api/appointment-stats/?group_by=department', None, 1),
+        ('vital_streams.list', 'GET', f'/api/vital-streams/?patient={patient}', None, 1),
+        ('vital_streams.create', 'POST', '/api/vital-streams/', {'patient': patient, 'readings': [{
+            'recorded_at': now.isoformat(), 'heart_rate': 80,
+            'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+        }]}, 8),
+        ('search.list', 'GET', f'/api/search/?q=hypertension&patient={patient}', None, 3),
+        ('batch.create', 'POST', '/api/batch/', {'operations': [
+            {'method': 'GET', 'path': f'/api/patients/{patient}/'},
+            {'method': 'PATCH', 'path': f'/api/medications/{medication}/', 'body': {'notes': 'Checked'}},
+        ]}, 10),
+        ('batch_get.create', 'POST', '/api/batch-get/', {'urls': [
+            f'/api/patients/{patient}/',
+            f'/api/medications/?patient={patient}&is_active=true',
+            f'/api/appointments/?patient={patient}',
+        ]}, 5),
+    ]
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class EndpointPerformanceTests(TestCase):
+    """Query budgets, query growth and latency for every endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        api = APIClient()
+        cls.results = {}  # size -> {endpoint name: (queries, median ms, status, SQL, body)}
+        cls.budgets = {}
+        cls.ids = cls.create_chart()
+        for size in SIZES:
+            cls.grow_to(size)
+            for name, method, path, body, budget in endpoints(cls.ids):
+                cls.budgets[name] = budget
+                cls.results.setdefault(size, {})[name] = cls.measure(api, method, path, body)
+
+    @classmethod
+    def tearDownClass(cls):
+        autocomplete_index.index = None
+        autocomplete_index.built_at = 0.0
+        super().tearDownClass()
+
+    # Fixture
+
+    @classmethod
+    def create_chart(cls):
+        """One patient whose chart grows with every size, plus one row of each kind."""
+        patient = Patient.objects.create(
+            medical_record_number='MRN-TARGET', first_name='Pat', last_name='Target',
+            date_of_birth='1960-01-01', gender='M', phone='555-0100', email='pat@example.com',
+            address='2 Main St', emergency_contact_name='Kim Target', emergency_contact_phone='555-0101',
+        )
+        cls.row_count = 0
+        cls.add_rows(patient, 1)
+        return {
+            'patient': patient.pk,
+            'record': MedicalRecord.objects.get(patient=patient).pk,
+            'medication': Medication.objects.get(patient=patient).pk,
+            'vital': VitalSign.objects.get(patient=patient).pk,
+            'appointment': Appointment.objects.get(patient=patient).pk,
+        }
+
+    @classmethod
+    def grow_to(cls, size):
+        """Bring the patient count and the target chart up to ``size`` rows."""
+        patient = Patient.objects.get(pk=cls.ids['patient'])
+        existing = Patient.objects.count()
+        Patient.objects.bulk_create([
+            Patient(
+                medical_record_number=f'MRN{n:06d}', first_name=f'Pat{n % 97}', last_name=f'Other{n}',
+                date_of_birth='1970-01-01', gender='F', phone=f'555-{n:06d}', address='Elsewhere',
+                emergency_contact_name='Contact', emergency_contact_phone='555-0000',
+            )
+            for n in range(existing, size)
+        ], batch_size=2000)
+        cls.add_rows(patient, size - cls.row_count)
+        # Bulk inserts bypass the signal handlers that maintain derived data
+        rebuild_latest_vitals()
+        rebuild_rollups()
+        rebuild_blocking_keys()
+        materialize_doses()
+        autocomplete_index.index = PrefixIndex.build(
+            Patient.objects.order_by().values_list('pk', *RECORD_FIELDS)
+        )
+        autocomplete_index.built_at = time.monotonic() + 3600
+
+    @classmethod
+    def add_rows(cls, patient, count):
+        now = timezone.now()
+        start = cls.row_count
+        offsets = range(start, start + count)
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(
+                patient=patient, visit_date=now - timedelta(days=n), chief_complaint='Headache',
+                diagnosis='Hypertension' if n % 10 == 0 else 'Migraine', treatment_plan='Monitor',
+                doctor_name='Dr. Lee',
+            )
+            for n in offsets
+        ], batch_size=2000)
+        Medication.objects.bulk_create([
+            Medication(
+                patient=patient, medication_name='Aspirin' if n % 2 else 'Lisinopril', dosage='10mg',
+                frequency='Daily', start_date=(now - timedelta(days=n)).date(),
+                prescribing_doctor='Dr. Lee', is_active=n % 3 != 1,
+            )
+            for n in offsets
+        ], batch_size=2000)
+        VitalSign.objects.bulk_create([
+            VitalSign(
+                patient=patient, recorded_at=now - timedelta(minutes=15 * n),
+                blood_pressure_systolic=110 + n % 40, blood_pressure_diastolic=70 + n % 20,
+                heart_rate=60 + n % 50, temperature=Decimal('98.6'), weight=Decimal('160.00'),
+                oxygen_saturation=95 + n % 5,
+            )
+            for n in offsets
+        ], batch_size=2000)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, appointment_date=now + timedelta(days=(n % 60) - 30),
+                doctor_name='Dr. Lee', department=('Cardiology', 'Neurology', 'Oncology')[n % 3],
+                reason='Check-up', status=('scheduled', 'completed', 'no_show')[n % 3],
+            )
+            for n in offsets
+        ], batch_size=2000)
+        cls.row_count = start + count
+
+    # Measurement
+
+    @classmethod
+    def call(cls, api, method, path, body):
+        return api.generic(method, path, json.dumps(body) if body is not None else '',
+                           content_type='application/json')
+
+    @classmethod
+    def measure(cls, api, method, path, body):
+        """
+        (queries, median ms, status, SQL, body) for one endpoint; changes are
+        rolled back. The median is None unless latency is measured (EHR_PERF_LATENCY).
+        """
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = cls.call(api, method, path, body)
+            transaction.set_rollback(True)
+        sql = [query['sql'] for query in queries.captured_queries]
+        timings = []
+        for _ in range(TIMED_RUNS if LATENCY else 0):
+            with transaction.atomic():
+                started = time.perf_counter()
+                cls.call(api, method, path, body)
+                timings.append((time.perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+        median = statistics.median(timings) if timings else None
+        return len(sql), median, response.status_code, sql, getattr(response, 'data', None)
+
+    # Tests
+
+    def test_endpoints_succeed(self):
+        for size, results in self.results.items():
+            for name, (_, _, status, _, body) in results.items():
+                with self.subTest(endpoint=name, size=size):
+                    self.assertLess(status, 400)
+                    if name.startswith('batch'):
+                        # Answered with 200 even when an operation fails
+                        self.assertEqual([r['status'] for r in body['results'] if r['status'] >= 400], [])
+                    if name == 'batch.create':
+                        self.assertIs(body['committed'], True)
+
+    def test_query_budgets(self):
+        for size, results in self.results.items():
+            for name, (queries, _, _, sql, _) in results.items():
+                budget = self.budgets[name]
+                expected = budget[size] if isinstance(budget, dict) else budget
+                with self.subTest(endpoint=name, size=size):
+                    self.assertEqual(
+                        queries, expected,
+                        f'{name} ran {queries} queries at size {size} (budget {expected}):\n'
+                        + '\n'.join(sql),
+                    )
+
+    def test_query_count_does_not_grow_with_data(self):
+        for name, budget in self.budgets.items():
+            # Per-size budgets cover edge cases of a one-row chart (deleting
+            # the only reading, say); from 100 rows up nothing may grow
+            sizes = SIZES[1:] if isinstance(budget, dict) else SIZES
+            counts = {size: self.results[size][name][0] for size in sizes}
+            with self.subTest(endpoint=name):
+                self.assertEqual(
+                    counts[sizes[-1]], counts[sizes[0]],
+                    f'{name} query count grows with the data: {counts}',
+                )
+
+    def test_latency_baselines(self):
+        if not LATENCY:
+            self.skipTest('Latency is checked with EHR_PERF_LATENCY=1')
+        measured = {
+            f'{name}@{size}': round(timing, 2)
+            for size, results in self.results.items()
+            for name, (_, timing, _, _, _) in results.items()
+        }
+        if RECORD:
+            BASELINE_FILE.write_text(json.dumps(measured, indent=2, sort_keys=True) + '\n')
+            return
+        if not BASELINE_FILE.exists():
+            self.skipTest(f'No {BASELINE_FILE.name}; record one with EHR_PERF_RECORD=1')
+        baselines = json.loads(BASELINE_FILE.read_text())
+        for key, timing in sorted(measured.items()):
+            if key not in baselines:
+                continue
+            limit = baselines[key] * (1 + TOLERANCE) + SLACK_MS
+            with self.subTest(endpoint=key):
+                self.assertLessEqual(
+                    timing, limit,
+                    f'{key} took {timing:.1f}ms; baseline {baselines[key]:.1f}ms, limit {limit:.1f}ms',
+                )
+
+
+@override_settings(
+    AUDIT_LOG_ENABLED=True, AUDIT_LOG_BUFFER_SIZE=3, AUDIT_LOG_BATCH_SIZE=2,
+    AUDIT_LOG_FLUSH_INTERVAL=0.25, SLOW_QUERY_LOG_ENABLED=False,
+)
+class AuditBufferTests(TestCase):
+    """The buffered access audit log (audit.py)."""
+
+    def setUp(self):
+        self.buffer = AuditBuffer()
+        self.buffer._pid = os.getpid()  # as if started; tests drive flush() themselves
+
+    def record(self, *numbers):
+        for number in numbers:
+            self.buffer.record('nurse.lee', number, 'patient', 'retrieve', str(number), 'GET', 200)
+
+    def buffered(self):
+        return [entry[2] for entry in self.buffer._entries]
+
+    def test_flush_writes_buffered_entries_in_batches(self):
+        self.record(1, 2, 3)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(
+            list(AccessLog.objects.order_by('patient_id').values_list('actor', 'patient_id', 'status_code')),
+            [('nurse.lee', 1, 200), ('nurse.lee', 2, 200), ('nurse.lee', 3, 200)],
+        )
+        self.assertEqual(self.buffer.flushed, 3)
+
+    def test_reaching_the_batch_size_wakes_the_flusher(self):
+        self.record(1)
+        self.assertFalse(self.buffer._wakeup.is_set())
+        self.record(2)
+        self.assertTrue(self.buffer._wakeup.is_set())
+
+    def test_flusher_runs_every_interval(self):
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(self.buffer._wakeup, 'wait', side_effect=[False, False, Stop]) as wait, \
+                mock.patch.object(self.buffer, 'flush') as flush:
+            with self.assertRaises(Stop):
+                self.buffer._run()
+        self.assertEqual(wait.call_args_list, [mock.call(0.25)] * 3)
+        self.assertEqual(flush.call_count, 2)
+
+    def test_full_buffer_drops_oldest_by_default(self):
+        self.record(1, 2, 3, 4, 5)
+        self.assertEqual(self.buffered(), [3, 4, 5])
+        self.assertEqual(self.buffer.dropped, 2)
+
+    @override_settings(AUDIT_LOG_BACKPRESSURE='drop_newest')
+    def test_full_buffer_can_drop_newest(self):
+        self.record(1, 2, 3, 4, 5)
+        self.assertEqual(self.buffered(), [1, 2, 3])
+        self.assertEqual(self.buffer.dropped, 2)
+
+    @override_settings(AUDIT_LOG_BACKPRESSURE='block', AUDIT_LOG_BLOCK_TIMEOUT=0.01)
+    def test_block_waits_for_room_then_drops(self):
+        self.record(1, 2, 3, 4)
+        self.assertEqual(self.buffered(), [1, 2, 3])
+        self.assertEqual(self.buffer.dropped, 1)
+
+        def make_room():
+            with self.buffer._lock:
+                self.buffer._entries.popleft()
+                self.buffer._not_full.notify_all()
+
+        with override_settings(AUDIT_LOG_BLOCK_TIMEOUT=5):
+            timer = threading.Timer(0.05, make_room)
+            timer.start()
+            self.record(5)
+            timer.join()
+        self.assertEqual(self.buffered(), [2, 3, 5])
+        self.assertEqual(self.buffer.dropped, 1)
+
+    def test_disabled_log_records_nothing(self):
+        with override_settings(AUDIT_LOG_ENABLED=False):
+            self.record(1)
+        self.assertEqual(self.buffered(), [])
+
+    def test_interpreter_exit_flushes_the_buffer(self):
+        script = (
+            'import django; django.setup(); '
+            'from unittest import mock; '
+            'from backend.ehr.audit import audit_log; '
+            'audit_log._start = lambda: setattr(audit_log, "_pid", __import__("os").getpid()); '
+            'audit_log.record("nurse.lee", 1, "patient", "retrieve", "1", "GET", 200); '
+            'patcher = mock.patch("backend.ehr.audit.AccessLog.objects.bulk_create", '
+            'side_effect=lambda rows: print(len(list(rows)), "written at exit")); '
+            'patcher.start()'
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings', AUDIT_LOG_ENABLED='True')
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '1 written at exit')
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class BulkActionsTests(TestCase):
+    """Set-based bulk update and delete (mixins.BulkActionsMixin)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patient = create_patient()
+
+    def test_invalid_filter_values_are_rejected(self):
+        create_record(self.patient)
+        create_medication(self.patient)
+        for path, lookup in (
+            ('/api/medical-records/bulk-delete/', 'visit_date__gte'),
+            ('/api/medications/bulk-delete/', 'end_date__lt'),
+        ):
+            with self.subTest(path=path):
+                response = self.api.post(path, {'filter': {lookup: 'garbage'}}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('filter', response.data)
+        self.assertEqual(MedicalRecord.objects.count(), 1)
+        self.assertEqual(Medication.objects.count(), 1)
+
+    def test_body_must_be_an_object(self):
+        response = self.api.post('/api/medications/bulk-delete/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_valid_filter_deletes_matching_rows(self):
+        create_medication(self.patient, end_date=timezone.localdate() - timedelta(days=1))
+        create_medication(self.patient)
+        response = self.api.post('/api/medications/bulk-delete/', {
+            'filter': {'patient': self.patient.pk, 'end_date__lt': timezone.localdate().isoformat()},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'deleted': 1})
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class BatchTests(TestCase):
+    """The batch endpoints (dispatch.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def test_async_views_are_refused(self):
+        response = self.api.post('/api/batch/', {'operations': [
+            {'method': 'GET', 'path': '/api/live/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['committed'])
+        self.assertEqual(response.data['results'][0]['status'], 400)
+
+        response = self.api.post('/api/batch-get/', {'urls': ['/api/live/', '/api/patients/']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], [400, 200])
+
+    def test_body_must_be_an_object(self):
+        response = self.api.post('/api/batch/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.api.post('/api/batch-get/', [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failing_get_fails_only_its_own_result(self):
+        with mock.patch.object(MedicationViewSet, 'list', side_effect=RuntimeError('boom')), \
+                self.assertLogs('backend.ehr.dispatch', 'ERROR'):
+            response = self.api.post('/api/batch-get/', {
+                'urls': ['/api/medications/', '/api/patients/'],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']], [500, 200])
+
+    def test_batch_endpoints_cannot_nest(self):
+        response = self.api.post('/api/batch-get/', {'urls': ['/api/batch-get/']}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 400)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False, BATCH_GET_WORKERS=3)
+class ConcurrentBatchGetTests(TransactionTestCase):
+    """
+    /api/batch-get/ on worker threads (dispatch.dispatch_gets), which only
+    run off SQLite and outside a transaction: committed rows, with the
+    database check patched.
+    """
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patients = [create_patient(number) for number in range(1, 6)]
+        create_medication(self.patients[0])
+        concurrent = mock.patch('backend.ehr.dispatch.can_run_concurrently', return_value=True)
+        concurrent.start()
+        self.addCleanup(concurrent.stop)
+
+    def batch_get(self, urls):
+        threads = {}
+
+        def record_thread(parent, method, path, **kwargs):
+            threads[path] = threading.current_thread().name
+            return dispatch_subrequest(parent, method, path, **kwargs)
+
+        with mock.patch('backend.ehr.dispatch.dispatch_subrequest', side_effect=record_thread):
+            response = self.api.post('/api/batch-get/', {'urls': urls}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], threads
+
+    def test_gets_run_on_worker_threads_in_request_order(self):
+        urls = [f'/api/patients/{patient.pk}/' for patient in self.patients]
+        urls.append(f'/api/medications/?patient={self.patients[0].pk}')
+        results, threads = self.batch_get(urls)
+        self.assertEqual([result['status'] for result in results], [200] * 6)
+        self.assertEqual(
+            [result['body']['medical_record_number'] for result in results[:5]],
+            [patient.medical_record_number for patient in self.patients],
+        )
+        self.assertEqual(results[5]['body']['count'], 1)
+        self.assertEqual(set(threads), set(urls))
+        self.assertTrue(all(name.startswith('batch-get') for name in threads.values()), threads)
+
+    def test_failing_get_fails_only_its_own_result(self):
+        urls = ['/api/medications/', f'/api/patients/{self.patients[0].pk}/', '/api/patients/']
+        with mock.patch.object(MedicationViewSet, 'list', side_effect=RuntimeError('boom')), \
+                self.assertLogs('backend.ehr.dispatch', 'ERROR'):
+            results, threads = self.batch_get(urls)
+        self.assertEqual([result['status'] for result in results], [500, 200, 200])
+        self.assertTrue(all(name.startswith('batch-get') for name in threads.values()), threads)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class ArchiveFallbackTests(TestCase):
+    """Date-ranged lists read archived rows (mixins.ArchiveFallbackMixin)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patient = create_patient()
+        horizon = archive_horizon()
+        self.old = create_vital(self.patient, horizon - timedelta(days=30))
+        self.recent = create_vital(self.patient, horizon + timedelta(days=30))
+        self.assertEqual(sum(archive_rows(VitalSign)), 1)
+        self.before = (horizon - timedelta(days=1)).date().isoformat()
+
+    def list_ids(self, query):
+        response = self.api.get(f'/api/vital-signs/?patient={self.patient.pk}{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_end_without_start_reads_archive(self):
+        self.assertEqual(self.list_ids(f'&end={self.before}'), [self.old.pk])
+
+    def test_start_before_horizon_reads_archive(self):
+        self.assertEqual(self.list_ids('&start=2000-01-01'), [self.recent.pk, self.old.pk])
+        self.assertEqual(self.list_ids(f'&start=2000-01-01&end={self.before}'), [self.old.pk])
+
+    def test_unranged_list_reads_hot_table_only(self):
+        self.assertEqual(self.list_ids(''), [self.recent.pk])
+        self.assertEqual(self.list_ids('&include_archived=true'), [self.recent.pk, self.old.pk])
+
+    def test_archived_row_can_be_retrieved(self):
+        response = self.api.get(f'/api/vital-signs/{self.old.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_commands_reject_unknown_models(self):
+        for command in ('archive_records', 'restore_archive'):
+            with self.subTest(command=command), self.assertRaisesMessage(CommandError, 'bogus'):
+                call_command(command, models='vitals,bogus')
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class ExpiryTests(TestCase):
+    """Scheduled status changes (expiry.py)."""
+
+    def setUp(self):
+        self.patient = create_patient()
+        today = timezone.localdate()
+        self.ended = create_medication(self.patient, end_date=today - timedelta(days=1))
+        self.current = create_medication(self.patient, end_date=today + timedelta(days=1))
+        now = timezone.now()
+        self.missed = create_appointment(self.patient, now - timedelta(days=2))
+        self.completed = create_appointment(self.patient, now - timedelta(days=2), status='completed')
+        self.upcoming = create_appointment(self.patient, now + timedelta(days=2))
+        self.events = ChangeEvent.objects.count()
+
+    def test_due_rows_change(self):
+        self.assertEqual(sum(run_transition(TRANSITIONS['medications'])), 1)
+        self.assertEqual(sum(run_transition(TRANSITIONS['appointments'])), 1)
+        self.assertEqual(
+            list(Medication.objects.filter(is_active=True).values_list('pk', flat=True)), [self.current.pk]
+        )
+        statuses = dict(Appointment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            self.missed.pk: 'no_show', self.completed.pk: 'completed', self.upcoming.pk: 'scheduled',
+        })
+
+    def test_changes_are_audited_and_recorded(self):
+        list(run_transition(TRANSITIONS['medications']))
+        log = AccessLog.objects.get(actor=AUDIT_ACTOR)
+        self.assertEqual(
+            (log.action, log.resource, log.object_id, log.patient_id),
+            ('expire', 'medication', str(self.ended.pk), self.patient.pk),
+        )
+        event = ChangeEvent.objects.get(pk__gt=self.events)
+        self.assertEqual((event.operation, event.object_id), ('update', self.ended.pk))
+        self.assertIs(event.changes['is_active'], False)
+
+    def test_no_shows_reach_live_streams_on_commit(self):
+        with mock.patch.object(broadcaster, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                list(run_transition(TRANSITIONS['appointments']))
+                publish.assert_not_called()
+        [(kind, patient_id, data)] = [call.args for call in publish.call_args_list]
+        self.assertEqual((kind, patient_id, data['id'], data['status']),
+                         ('appointment', self.patient.pk, self.missed.pk, 'no_show'))
+
+    def test_row_changed_after_selection_is_left_alone(self):
+        calls = []
+
+        def queryset():
+            if calls:
+                # Someone extends the prescription between the ID read and the batch
+                Medication.objects.filter(pk=self.ended.pk).update(end_date=timezone.localdate())
+            calls.append(1)
+            return ended_medications()
+
+        transition = TRANSITIONS['medications']._replace(queryset=queryset)
+        self.assertEqual(sum(run_transition(transition)), 0)
+        self.ended.refresh_from_db()
+        self.assertTrue(self.ended.is_active)
+        self.assertFalse(AccessLog.objects.filter(actor=AUDIT_ACTOR).exists())
+        self.assertFalse(ChangeEvent.objects.filter(pk__gt=self.events).exists())
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False, LIVE_EVENTS_SOCKET_DIR=None)
+class LiveEventsTests(TestCase):
+    """Live chart events: signals, the broadcaster and the SSE stream (live.py)."""
+
+    def setUp(self):
+        self.patient = create_patient(1)
+        self.other = create_patient(2)
+
+    def committed(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            return change()
+
+    async def next_event(self, queue):
+        return await asyncio.wait_for(queue.get(), 1)
+
+    async def test_saved_vital_sign_reaches_its_patients_subscribers(self):
+        subscription = broadcaster.subscribe({self.patient.pk})
+        bystander = broadcaster.subscribe({self.other.pk})
+        try:
+            vital = await sync_to_async(self.committed)(
+                lambda: create_vital(self.patient, timezone.now(), heart_rate=88)
+            )
+            message = await self.next_event(subscription.queue)
+        finally:
+            broadcaster.unsubscribe(subscription)
+            broadcaster.unsubscribe(bystander)
+        self.assertIn('event: vital_sign\n', message)
+        event = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual((event['patient'], event['data']['id'], event['data']['heart_rate']),
+                         (self.patient.pk, vital.pk, 88))
+        self.assertTrue(bystander.queue.empty())
+
+    async def test_appointment_events_follow_status_changes(self):
+        subscription = broadcaster.subscribe({self.patient.pk})
+        try:
+            appointment = await sync_to_async(self.committed)(
+                lambda: create_appointment(self.patient, timezone.now() + timedelta(days=1))
+            )
+            created = await self.next_event(subscription.queue)
+
+            def update(**fields):
+                for name, value in fields.items():
+                    setattr(appointment, name, value)
+                appointment.save()
+
+            await sync_to_async(self.committed)(lambda: update(reason='Follow-up'))
+            await sync_to_async(self.committed)(lambda: update(status='completed'))
+            completed = await self.next_event(subscription.queue)
+        finally:
+            broadcaster.unsubscribe(subscription)
+        self.assertEqual(json.loads(created.split('data: ', 1)[1])['data']['status'], 'scheduled')
+        self.assertEqual(json.loads(completed.split('data: ', 1)[1])['data']['status'], 'completed')
+        self.assertTrue(subscription.queue.empty())
+
+    @override_settings(LIVE_EVENTS_QUEUE_SIZE=2)
+    async def test_slow_subscriber_gets_a_resync(self):
+        stream = stream_events({self.patient.pk})
+        try:
+            self.assertEqual(await stream.__anext__(), 'retry: 5000\n\n')
+            for number in range(3):
+                broadcaster.publish('vital_sign', self.patient.pk, {'id': number})
+            await asyncio.sleep(0)
+            first = await stream.__anext__()
+            self.assertEqual(json.loads(first.split('data: ', 1)[1])['data'], {'id': 1})
+            self.assertEqual(await stream.__anext__(), 'event: resync\ndata: {}\n\n')
+        finally:
+            await stream.aclose()
+        self.assertNotIn(self.patient.pk, broadcaster._subscriptions)
+
+    @override_settings(LIVE_EVENTS_HEARTBEAT=0.01)
+    async def test_stream_sends_only_its_patients_and_keeps_alive(self):
+        stream = stream_events({self.patient.pk})
+        try:
+            await stream.__anext__()
+            self.assertEqual(await stream.__anext__(), ': keep-alive\n\n')
+            broadcaster.publish('vital_sign', self.other.pk, {'id': 1})
+            broadcaster.publish('vital_sign', self.patient.pk, {'id': 2})
+            message = await stream.__anext__()
+        finally:
+            await stream.aclose()
+        event = json.loads(message.split('data: ', 1)[1])
+        self.assertEqual((event['patient'], event['data']), (self.patient.pk, {'id': 2}))
+
+    @override_settings(LIVE_EVENTS_MAX_PATIENTS=2)
+    async def test_patients_parameter_is_validated(self):
+        for query in ('', '?patients=', '?patients=1,x', '?patients=1,2,3'):
+            with self.subTest(query=query):
+                response = await self.async_client.get(f'/api/live/{query}')
+                self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get('/api/live/?patients=1,2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        await response.streaming_content.aclose()
+
+    async def test_events_cross_workers_through_the_socket_directory(self):
+        with tempfile.TemporaryDirectory() as socket_dir, override_settings(LIVE_EVENTS_SOCKET_DIR=socket_dir):
+            worker = ChangeBroadcaster()
+            subscription = worker.subscribe({self.patient.pk})
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as peer:
+                    peer.bind(os.path.join(socket_dir, 'live-peer.sock'))
+                    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                    dead.bind(os.path.join(socket_dir, 'live-dead.sock'))
+                    dead.close()
+
+                    # Another worker publishes: every live socket gets the event and
+                    # the dead worker's socket is removed
+                    ChangeBroadcaster().publish('vital_sign', self.patient.pk, {'id': 1})
+                    self.assertEqual(json.loads(peer.recv(MAX_DATAGRAM))['data'], {'id': 1})
+                    message = await self.next_event(subscription.queue)
+                    self.assertEqual(
+                        set(os.listdir(socket_dir)), {'live-peer.sock', os.path.basename(worker._socket_path)}
+                    )
+            finally:
+                worker.unsubscribe(subscription)
+        self.assertEqual(json.loads(message.split('data: ', 1)[1])['data'], {'id': 1})
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class VitalStoreTests(TestCase):
+    """Packed hourly blocks of monitor readings (vitalstore.py)."""
+
+    HOUR = datetime(2025, 1, 1, 8, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.patient = create_patient()
+
+    def reading(self, seconds, heart_rate=80, **fields):
+        values = {
+            'recorded_at': self.HOUR + timedelta(seconds=seconds), 'heart_rate': heart_rate,
+            'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+            'oxygen_saturation': 97, 'temperature': 98.6,
+        }
+        values.update(fields)
+        return values
+
+    def read(self, start=None, end=None):
+        return read_readings(self.patient.pk, start or self.HOUR, end or self.HOUR + timedelta(hours=3))
+
+    def test_records_round_trip_through_eleven_bytes(self):
+        readings = [
+            self.reading(0, heart_rate=0, oxygen_saturation=0, temperature=0.1),
+            self.reading(3599, heart_rate=65535, blood_pressure_systolic=65535, oxygen_saturation=254),
+            self.reading(60, oxygen_saturation=None, temperature=None),
+        ]
+        columns = encode_readings(self.HOUR, readings)
+        self.assertEqual(BYTES_PER_READING, 11)
+        self.assertEqual(sum(len(values.tobytes()) for values in columns.values()), 11 * len(readings))
+        decoded = decode_block({name: values.tobytes() for name, values in columns.items()})
+        self.assertEqual(decoded['offsets'].tolist(), [0, 3599, 60])
+        self.assertEqual(decoded['heart_rate'].tolist(), [0, 65535, 80])
+        self.assertEqual(decoded['oxygen_saturation'].tolist(), [0, 254, MISSING_OXYGEN_SATURATION])
+        self.assertEqual(decoded['temperature'].tolist(), [1, 986, MISSING_TEMPERATURE])
+
+    def test_appends_split_by_hour_and_keep_blocks_sorted(self):
+        append_readings(self.patient.pk, [self.reading(10), self.reading(3599), self.reading(3600)])
+        append_readings(self.patient.pk, [self.reading(20, heart_rate=81)])
+        append_readings(self.patient.pk, [self.reading(5, heart_rate=79)])  # out of order
+        blocks = VitalSignBlock.objects.filter(patient=self.patient).order_by('hour_start')
+        self.assertEqual([(block.hour_start, block.count) for block in blocks],
+                         [(self.HOUR, 4), (self.HOUR + timedelta(hours=1), 1)])
+        first = decode_block({name: getattr(blocks[0], name) for name in BLOCK_COLUMNS})
+        self.assertEqual(first['offsets'].tolist(), [5, 10, 20, 3599])
+        self.assertEqual(first['heart_rate'].tolist(), [79, 80, 81, 80])
+
+    def test_range_reads_are_start_inclusive_and_end_exclusive(self):
+        append_readings(self.patient.pk, [self.reading(seconds) for seconds in (0, 1800, 3599, 3600, 7200)])
+        result = self.read(self.HOUR + timedelta(seconds=1800), self.HOUR + timedelta(seconds=7200))
+        self.assertEqual(
+            [str(moment) for moment in result['recorded_at']],
+            ['2025-01-01T08:30:00', '2025-01-01T08:59:59', '2025-01-01T09:00:00'],
+        )
+        self.assertEqual(len(self.read(self.HOUR + timedelta(hours=5))['heart_rate']), 0)
+
+    def test_json_matches_the_vital_sign_fields(self):
+        append_readings(self.patient.pk, [self.reading(0), self.reading(1, oxygen_saturation=None, temperature=None)])
+        rows = readings_to_json(self.patient.pk, self.read())
+        self.assertEqual(set(rows[0]), set(VitalSignSerializer.Meta.fields))
+        self.assertEqual(
+            [(row['recorded_at'], row['temperature'], row['oxygen_saturation']) for row in rows],
+            [('2025-01-01T08:00:00Z', '98.6', 97), ('2025-01-01T08:00:01Z', None, None)],
+        )
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class SlowQueryLogTests(TestCase):
+    """Fingerprinting, aggregation and storage of slow queries (slowqueries.py)."""
+
+    LOOKUP = 'SELECT "ehr_patient"."id" FROM "ehr_patient" WHERE "ehr_patient"."medical_record_number" = %s'
+
+    def setUp(self):
+        self.log = SlowQueryLog()
+        self.log._pid = os.getpid()  # as if started; tests drive flush() themselves
+
+    def record(self, sql, params, elapsed_ms, path='/api/patients/?search=MRN-T0001&page=2'):
+        token = current_path.set(path)
+        try:
+            self.log.record(sql, params, False, elapsed_ms, 'default')
+        finally:
+            current_path.reset(token)
+
+    def test_normalize_sql_removes_literals_and_lists(self):
+        self.assertEqual(
+            normalize_sql(
+                'SELECT "t1"."id"  FROM "t1" WHERE "t1"."name" = \'O\'\'Brien\' AND "t1"."age" > -4.5\n'
+                'AND "t1"."id" IN (%s, %s, %s) AND "t1"."mrn" = ?'
+            ),
+            'SELECT "t1"."id" FROM "t1" WHERE "t1"."name" = ? AND "t1"."age" > ? AND "t1"."id" IN (...) AND "t1"."mrn" = ?',
+        )
+        self.assertEqual(
+            normalize_sql('INSERT INTO "t" ("a", "b") VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            'INSERT INTO "t" ("a", "b") VALUES (...)',
+        )
+
+    def test_fingerprint_ignores_values_but_not_shape(self):
+        def of(sql):
+            return fingerprint(normalize_sql(sql))
+
+        self.assertEqual(of('SELECT * FROM t WHERE id = 1'), of('SELECT * FROM t WHERE id = 22'))
+        self.assertEqual(of('SELECT * FROM t WHERE id IN (%s, %s)'), of('SELECT * FROM t WHERE id IN (%s, %s, %s)'))
+        self.assertNotEqual(of('SELECT * FROM t ORDER BY a'), of('SELECT * FROM t ORDER BY b'))
+        self.assertEqual(len(of('SELECT 1')), 16)
+
+    def test_flush_aggregates_by_fingerprint_and_keeps_the_slowest_sample(self):
+        self.record(self.LOOKUP, ('MRN-T0001',), 150)
+        self.record(self.LOOKUP, ('MRN-T0002',), 400)
+        self.record('SELECT COUNT(*) FROM "ehr_patient"', (), 120)
+        self.assertEqual(self.log.flush(), 3)
+        self.record(self.LOOKUP, ('MRN-T0003',), 200)
+        self.log.flush()
+
+        query = SlowQuery.objects.get(sql=normalize_sql(self.LOOKUP))
+        self.assertEqual((query.count, query.total_ms, query.max_ms), (3, 750, 400))
+        self.assertEqual(query.sample_sql, self.LOOKUP)
+        self.assertIn('medical_record_number', query.plan)
+        self.assertEqual(SlowQuery.objects.count(), 2)
+
+    def test_samples_leave_out_patient_identifiers(self):
+        self.record(self.LOOKUP, ('MRN-T0001',), 150)
+        self.log.flush()
+        query = SlowQuery.objects.get()
+        self.assertEqual((query.sample_params, query.sample_path), ('', '/api/patients/?search=?&page=?'))
+        self.assertNotEqual(query.plan, '')  # parameters were still used for EXPLAIN
+
+        with override_settings(SLOW_QUERY_CAPTURE_PARAMS=True):
+            self.record(self.LOOKUP, ('MRN-T0001',), 300)
+            self.log.flush()
+        query.refresh_from_db()
+        self.assertEqual(
+            (query.sample_params, query.sample_path), ('["MRN-T0001"]', '/api/patients/?search=MRN-T0001&page=2')
+        )
+
+    def test_format_sqlite_plan_indents_the_tree(self):
+        rows = [
+            (2, 0, 0, 'SEARCH p USING INDEX mrn (mrn=?)'),
+            (7, 0, 0, 'CORRELATED SCALAR SUBQUERY 1'),
+            (11, 7, 0, 'SCAN v'),
+            (20, 0, 0, 'USE TEMP B-TREE FOR ORDER BY'),
+        ]
+        self.assertEqual(format_sqlite_plan(rows), '\n'.join([
+            'SEARCH p USING INDEX mrn (mrn=?)',
+            'CORRELATED SCALAR SUBQUERY 1',
+            '  SCAN v',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]))
+        self.assertEqual(redact_path('/api/patients/1/'), '/api/patients/1/')
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False, METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    """Request and query metrics and the /metrics endpoint (metrics.py)."""
+
+    def setUp(self):
+        self.patient = create_patient()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def requests(self, view, action, status='200'):
+        return self.sample(
+            'ehr_http_request_duration_seconds_count', view=view, action=action, method='GET', status=status,
+        )
+
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.client.get('/api/patients/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        for name in ('ehr_http_request_duration_seconds_bucket', 'ehr_http_request_db_queries_count',
+                     'ehr_db_query_duration_seconds_count', 'ehr_http_requests_in_progress'):
+            self.assertIn(name, body)
+        self.assertIn(
+            'ehr_http_request_duration_seconds_count{action="list",method="GET",status="200",view="PatientViewSet"}',
+            body,
+        )
+
+    def test_requests_are_labelled_with_view_and_action(self):
+        before = {
+            'list': self.requests('PatientViewSet', 'list'),
+            'retrieve': self.requests('PatientViewSet', 'retrieve'),
+            'unresolved': self.requests('unresolved', '', '404'),
+        }
+        self.client.get('/api/patients/')
+        self.client.get(f'/api/patients/{self.patient.pk}/')
+        self.client.get(f'/api/patients/{self.patient.pk}/')
+        self.client.get('/no-such-page/')
+        self.assertEqual(self.requests('PatientViewSet', 'list') - before['list'], 1)
+        self.assertEqual(self.requests('PatientViewSet', 'retrieve') - before['retrieve'], 2)
+        self.assertEqual(self.requests('unresolved', '', '404') - before['unresolved'], 1)
+
+    def test_query_count_per_request_is_recorded(self):
+        labels = {'view': 'PatientViewSet', 'action': 'retrieve'}
+        count = self.sample('ehr_http_request_db_queries_count', **labels)
+        total = self.sample('ehr_http_request_db_queries_sum', **labels)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/patients/{self.patient.pk}/')
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(self.sample('ehr_http_request_db_queries_count', **labels) - count, 1)
+        self.assertEqual(self.sample('ehr_http_request_db_queries_sum', **labels) - total, len(queries))
+
+    def test_disabled_metrics_record_nothing(self):
+        before = self.requests('PatientViewSet', 'list')
+        with override_settings(METRICS_ENABLED=False):
+            self.client.get('/api/patients/')
+        self.assertEqual(self.requests('PatientViewSet', 'list'), before)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class ChangeFeedTests(TestCase):
+    """The transactional outbox and its readers (outbox.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('feed', is_staff=True))
+
+    def test_changes_are_recorded_in_order(self):
+        patient = create_patient()
+        patient.phone = '555-0111'
+        patient.save()
+        events = read_changes(0, 10)
+        self.assertEqual([event.operation for event in events], ['create', 'update'])
+        self.assertEqual(events[1].changes['phone'], '555-0111')
+        self.assertNotIn('first_name', events[1].changes)
+        self.assertEqual(len({event.position for event in events}), 2)
+
+    def test_late_commit_is_read_after_checkpoint(self):
+        first, second = create_patient(1), create_patient(2)
+        late = ChangeEvent.objects.get(object_id=first.pk, resource='patient')
+        # The first event is still uncommitted when the second one is read
+        ChangeEvent.objects.filter(pk=late.pk).delete()
+        events = read_changes(0, 10)
+        self.assertEqual([event.object_id for event in events], [second.pk])
+        checkpoint = events[-1].position
+        late.save(force_insert=True)
+        events = read_changes(checkpoint, 10)
+        self.assertEqual([(event.pk, event.object_id) for event in events], [(late.pk, first.pk)])
+        self.assertGreater(events[0].position, checkpoint)
+
+    def test_reads_repeat_until_acknowledged(self):
+        create_patient()
+        response = self.api.get('/api/changes/?consumer=billing')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['events']), 1)
+        self.assertEqual(self.api.get('/api/changes/?consumer=billing').data['events'], response.data['events'])
+        last = response.data['last']
+        self.api.post('/api/changes/ack/', {'consumer': 'billing', 'offset': last}, format='json')
+        self.assertEqual(self.api.get('/api/changes/?consumer=billing').data['events'], [])
+
+    def test_acknowledge_never_moves_back(self):
+        acknowledge('billing', 5)
+        acknowledge('billing', 3)
+        self.assertEqual(consumer_offset('billing'), 5)
+        self.assertEqual(consumer_offset('nobody'), 0)
+
+    def test_compaction_keeps_unacknowledged_events(self):
+        create_patient(1)
+        create_patient(2)
+        events = read_changes(0, 10)
+        ChangeEvent.objects.update(occurred_at=timezone.now() - timedelta(days=2))
+        acknowledge('billing', events[0].position)
+        acknowledge('warehouse', events[-1].position)
+        sum(compact())
+        self.assertEqual(
+            list(ChangeEvent.objects.values_list('position', flat=True)), [events[-1].position]
+        )
+        self.assertEqual(ChangeConsumer.objects.count(), 2)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class SearchTests(TestCase):
+    """Clinical note search (search.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patient, self.other = create_patient(1), create_patient(2)
+        self.record = create_record(self.patient, chief_complaint='Crushing chest pain', diagnosis='Angina')
+        self.other_record = create_record(self.other, notes='Mild chest discomfort after exercise')
+        self.appointment = create_appointment(self.patient, timezone.now(), reason='Chest pain follow-up')
+
+    def search(self, query):
+        response = self.api.get(f'/api/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(result['source'], result['id']) for result in response.data['results']]
+
+    def test_results_are_ranked_with_snippets(self):
+        response = self.api.get('/api/search/?q="chest pain"')
+        results = response.data['results']
+        self.assertEqual(
+            [(result['source'], result['id']) for result in results],
+            [('medical_record', self.record.pk), ('appointment', self.appointment.pk)],
+        )
+        self.assertEqual(results[0]['field'], 'chief_complaint')
+        self.assertEqual(results[0]['snippet'], 'Crushing <mark>chest pain</mark>')
+
+    def test_prefix_source_and_patient_filters(self):
+        self.assertEqual(len(self.search('q=chest')), 3)
+        self.assertEqual(self.search('q=chest&source=appointment'), [('appointment', self.appointment.pk)])
+        self.assertEqual(self.search(f'q=chest&patient={self.other.pk}'), [('medical_record', self.other_record.pk)])
+        self.assertEqual(self.search('q=exer*'), [('medical_record', self.other_record.pk)])
+
+    def test_terms_do_not_match_patient_key(self):
+        self.assertEqual(self.search(f'q=p{self.patient.pk}'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        MedicalRecord.objects.filter(pk=self.record.pk).update(chief_complaint='Palpitations')
+        self.assertEqual(self.search('q=palpitations'), [('medical_record', self.record.pk)])
+        self.appointment.delete()
+        self.assertEqual(self.search(f'q=chest&patient={self.patient.pk}'), [])
+
+    def test_empty_query_is_rejected(self):
+        self.assertEqual(self.api.get('/api/search/?q=%22%22').status_code, 400)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class CohortTests(TestCase):
+    """Cohort filter trees and their cached bitmaps (cohorts.py)."""
+
+    ON_METFORMIN = {'medication': {'name': 'metformin', 'active': True}}
+    HYPERTENSIVE = {'vital': {'field': 'blood_pressure_systolic', 'gt': 140, 'within_days': 90}}
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        now = timezone.now()
+        self.both = create_patient(1, gender='F')
+        create_medication(self.both, medication_name='Metformin')
+        create_vital(self.both, now - timedelta(days=3), blood_pressure_systolic=155)
+        self.stopped = create_patient(2, gender='M')
+        create_medication(self.stopped, medication_name='Metformin', is_active=False)
+        create_vital(self.stopped, now - timedelta(days=3), blood_pressure_systolic=150)
+        self.old_reading = create_patient(3, gender='F')
+        create_medication(self.old_reading, medication_name='Metformin')
+        create_vital(self.old_reading, now - timedelta(days=200), blood_pressure_systolic=160)
+
+    def cohort(self, tree):
+        bitmap, _ = resolve_cohort(tree)
+        return bitmap_to_ids(bitmap)
+
+    def test_filter_tree_compiles_to_patient_query(self):
+        self.assertEqual(self.cohort(self.ON_METFORMIN), [self.both.pk, self.old_reading.pk])
+        self.assertEqual(self.cohort(self.HYPERTENSIVE), [self.both.pk, self.stopped.pk])
+        self.assertEqual(self.cohort({'and': [self.ON_METFORMIN, self.HYPERTENSIVE]}), [self.both.pk])
+        self.assertEqual(
+            self.cohort({'or': [{'patient': {'gender': 'M'}}, {'diagnosis': {'contains': 'flu'}}]}),
+            [self.stopped.pk],
+        )
+        self.assertEqual(self.cohort({'not': {'patient': {'gender': 'F'}}}), [self.stopped.pk])
+
+    def test_bitmaps_round_trip(self):
+        for ids in ([], [0], [1, 2, 9], [5, 64, 65, 1000]):
+            with self.subTest(ids=ids):
+                self.assertEqual(bitmap_to_ids(ids_to_bitmap(ids)), ids)
+
+    def test_repeats_and_combinations_of_cached_cohorts_skip_the_query(self):
+        resolve_cohort(self.ON_METFORMIN)
+        resolve_cohort(self.HYPERTENSIVE)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_cohort(self.ON_METFORMIN)[1], True)
+            bitmap, cached = resolve_cohort({'and': [self.HYPERTENSIVE, self.ON_METFORMIN]})
+        self.assertTrue(cached)
+        self.assertEqual(bitmap_to_ids(bitmap), [self.both.pk])
+
+    def test_refresh_requeries_a_cached_cohort(self):
+        response = self.api.post('/api/cohorts/', {'filter': self.ON_METFORMIN}, format='json')
+        self.assertEqual((response.data['count'], response.data['cached']), (2, False))
+        create_medication(self.stopped, medication_name='Metformin')
+        response = self.api.post('/api/cohorts/', {'filter': self.ON_METFORMIN}, format='json')
+        self.assertEqual((response.data['count'], response.data['cached']), (2, True))
+        response = self.api.post('/api/cohorts/?refresh=true', {'filter': self.ON_METFORMIN}, format='json')
+        self.assertEqual((response.data['count'], response.data['cached']), (3, False))
+        self.assertEqual([patient['id'] for patient in response.data['results']],
+                         [self.both.pk, self.stopped.pk, self.old_reading.pk])
+
+    def test_invalid_requests_are_rejected(self):
+        for body in (
+            [self.ON_METFORMIN],
+            {},
+            {'filter': {'and': []}},
+            {'filter': {'medication': {}, 'vital': {}}},
+            {'filter': {'vital': {'field': 'height', 'gt': 'tall'}}},
+            {'filter': {'patient': {'age_gte': -1}}},
+            {'filter': {'allergy': {'name': 'penicillin'}}},
+        ):
+            with self.subTest(body=body):
+                response = self.api.post('/api/cohorts/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class DuplicatePatientTests(TestCase):
+    """Duplicate-patient detection with blocking keys (dedup.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.john = create_patient(1, first_name='John', last_name='Smith', date_of_birth='1980-04-02')
+
+    def test_soundex(self):
+        self.assertEqual([soundex(name) for name in ('Robert', 'Rupert', 'Ashcraft', 'Tymczak')],
+                         ['R163', 'R163', 'A261', 'T522'])
+
+    def test_similar_patient_is_reported(self):
+        response = self.api.post('/api/patients/possible-duplicates/', {
+            'first_name': 'Jon', 'last_name': 'Smyth', 'date_of_birth': '1980-04-02',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['id'] for match in response.data], [self.john.pk])
+        self.assertIn('date_of_birth', response.data[0]['matched_fields'])
+
+    def test_created_patient_is_not_its_own_duplicate(self):
+        response = self.api.post('/api/patients/', dict(
+            NEW_PATIENT, first_name='John', last_name='Smith', date_of_birth='1980-04-02',
+        ), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([match['id'] for match in response.data['possible_duplicates']], [self.john.pk])
+
+    @override_settings(DEDUP_MAX_BLOCK_SIZE=2, DEDUP_MATCH_THRESHOLD=0)
+    def test_oversized_blocks_are_skipped(self):
+        # A shared clinic number: a block of three, over the limit
+        for number in range(2, 5):
+            create_patient(number, first_name='Other', last_name=f'Person{number}', phone='555-123-4567')
+        Patient.objects.filter(pk=self.john.pk).update(phone='555-123-4567')
+        rebuild_blocking_keys([self.john.pk])
+        matches = possible_duplicates({
+            'first_name': 'John', 'last_name': 'Smith', 'date_of_birth': '1980-04-02', 'phone': '5551234567',
+        })
+        self.assertEqual([match['patient'].pk for match in matches], [self.john.pk])
+
+    def test_pairs_sharing_several_blocks_are_compared_once(self):
+        blocks = [[3, 1, 2], [2, 3], [3, 4], [1, 2, 3]]
+        memberships = block_memberships(blocks)
+        pairs = [pair for number, members in enumerate(blocks) for pair in block_pairs(number, members, memberships)]
+        self.assertEqual(pairs, [(1, 2), (1, 3), (2, 3), (3, 4)])
+
+    def test_find_duplicates_scores_each_candidate_pair_once(self):
+        # Jon shares three blocks with John (both names and the phone);
+        # the Browns share two (both names)
+        jon = create_patient(2, first_name='Jon', last_name='Smith', date_of_birth='1980-04-02')
+        mary = create_patient(3, first_name='Mary', last_name='Brown', date_of_birth='1955-09-30', phone='555-0300')
+        marie = create_patient(4, first_name='Marie', last_name='Brown', date_of_birth='1955-09-30', phone='555-0400')
+        rebuild_blocking_keys()
+
+        def run(**options):
+            out = StringIO()
+            call_command('find_duplicates', threshold=0.85, stdout=out, **options)
+            output = out.getvalue()
+            self.assertIn('Compared 2 candidate pairs', output)
+            self.assertIn('Found 2 likely duplicate pairs', output)
+            return [line for line in output.splitlines() if ' ~ ' in line]
+
+        matches = run(workers=1)
+        self.assertEqual(
+            sorted(line.split(':')[0].strip() for line in matches),
+            sorted([f'{self.john.pk} ~ {jon.pk}', f'{mary.pk} ~ {marie.pk}']),
+        )
+        self.assertEqual(run(workers=2, chunk_size=1), matches)  # one block per worker task
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class AutocompleteTests(TestCase):
+    """Patient typeahead over the in-process prefix index (autocomplete.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.jane = create_patient(1, first_name='Jane', last_name='Smith', date_of_birth='1980-04-02')
+        self.janet = create_patient(2, first_name='Janet', last_name='Smithers')
+        self.john = create_patient(3, first_name='John', last_name='Jansen')
+        self.build()
+
+    def tearDown(self):
+        autocomplete_index.index = None
+        autocomplete_index.overlay = {}
+        autocomplete_index.built_at = 0.0
+
+    def build(self):
+        autocomplete_index.swap(PrefixIndex.build(
+            Patient.objects.order_by().values_list('pk', *RECORD_FIELDS)
+        ), sequence=next(autocomplete_index._sequence))
+
+    def lookup_ids(self, query, limit=10):
+        return [pk for pk, _ in autocomplete_index.lookup(query, limit)]
+
+    def test_every_word_must_prefix_a_name_or_mrn(self):
+        self.assertEqual(self.lookup_ids('JAN'), [self.jane.pk, self.janet.pk, self.john.pk])
+        self.assertEqual(self.lookup_ids('jane sm'), [self.jane.pk, self.janet.pk])
+        self.assertEqual(self.lookup_ids('smith jan'), [self.jane.pk, self.janet.pk])
+        self.assertEqual(self.lookup_ids('mrn-t0003'), [self.john.pk])
+        self.assertEqual(self.lookup_ids('jane jo'), [])
+        self.assertEqual(self.lookup_ids('  '), [])
+
+    def test_patient_matching_twice_is_listed_once(self):
+        create_patient(4, first_name='Jan', last_name='Janssen')
+        self.build()
+        ids = self.lookup_ids('jan', limit=4)
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_endpoint_returns_records_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.api.get('/api/patients/autocomplete/?q=jane%20mrn-t0001')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{
+            'id': self.jane.pk, 'first_name': 'Jane', 'last_name': 'Smith',
+            'medical_record_number': 'MRN-T0001', 'date_of_birth': '1980-04-02',
+        }])
+        self.assertEqual(self.api.get('/api/patients/autocomplete/?q=j&limit=0').status_code, 400)
+
+    def test_overlay_follows_saves_bulk_updates_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jane.last_name = 'Jones'
+            self.jane.save()
+            smart = create_patient(4, first_name='Jane', last_name='Smart')
+        self.assertEqual(self.lookup_ids('jane sm'), [smart.pk, self.janet.pk])
+        self.assertEqual(self.lookup_ids('jane jon'), [self.jane.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post('/api/patients/bulk-update/', {
+                'ids': [self.janet.pk], 'values': {'last_name': 'Doe'},
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lookup_ids('doe'), [self.janet.pk])
+        self.assertEqual(self.lookup_ids('smithers'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            purge_patient(self.john.pk)
+        self.assertEqual(self.lookup_ids('john'), [])
+
+    def test_rebuild_keeps_only_newer_overlay_entries(self):
+        sequence = next(autocomplete_index._sequence)
+        autocomplete_index.apply(self.jane.pk, ('Jane', 'Jones', 'MRN-T0001', None))
+        autocomplete_index.swap(autocomplete_index.index, sequence)
+        self.assertEqual(self.lookup_ids('jones'), [self.jane.pk])
+        self.build()
+        self.assertEqual(autocomplete_index.overlay, {})
+        self.assertEqual(self.lookup_ids('jones'), [])
+
+    def test_database_fallback_before_first_build(self):
+        autocomplete_index.index = None
+        autocomplete_index._building.acquire()  # keep the background build from starting
+        try:
+            self.assertEqual(self.lookup_ids('jane sm'), [self.jane.pk, self.janet.pk])
+        finally:
+            autocomplete_index._building.release()
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class AppointmentRollupTests(TestCase):
+    """Appointment rollups kept in step with the table (rollups.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patient = create_patient()
+        self.today = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.first = create_appointment(self.patient, self.today - timedelta(days=2))
+        self.second = create_appointment(self.patient, self.today - timedelta(days=2), department='Neurology')
+        self.third = create_appointment(self.patient, self.today - timedelta(days=1), status='completed')
+
+    def rollups(self):
+        return {
+            (row.day, row.department, row.doctor_name, row.status): row.count
+            for row in AppointmentRollup.objects.filter(count__gt=0)
+        }
+
+    def assert_rollups_match_table(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_saves_and_deletes(self):
+        self.assertEqual(sum(self.rollups().values()), 3)
+        self.first.status = 'no_show'
+        self.first.save()
+        self.second.appointment_date = self.today
+        self.second.save()
+        self.third.delete()
+        self.assert_rollups_match_table()
+
+    def test_bulk_actions(self):
+        response = self.api.post('/api/appointments/bulk-update/', {
+            'filter': {'patient': self.patient.pk, 'status': 'scheduled'}, 'values': {'status': 'cancelled'},
+        }, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assert_rollups_match_table()
+        response = self.api.post('/api/appointments/bulk-delete/', {
+            'filter': {'department': 'Neurology'},
+        }, format='json')
+        self.assertEqual(response.data['deleted'], 1)
+        self.assert_rollups_match_table()
+
+    def test_stats_read_from_rollups(self):
+        self.first.status = 'no_show'
+        self.first.save()
+        start = (self.today - timedelta(days=7)).date()
+        response = self.api.get(f'/api/appointment-stats/?start={start}&group_by=department')
+        self.assertEqual(response.status_code, 200)
+        groups = {group['department']: group for group in response.data['results']}
+        self.assertEqual(groups['Cardiology']['total'], 2)
+        self.assertEqual(groups['Cardiology']['by_status']['no_show'], 1)
+        self.assertEqual(groups['Cardiology']['no_show_rate'], 0.5)
+        self.assertIsNone(groups['Neurology']['no_show_rate'])
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class LatestVitalsTests(TestCase):
+    """The latest-vitals snapshot (snapshots.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.patient = create_patient()
+        self.now = timezone.now()
+        self.older = create_vital(self.patient, self.now - timedelta(hours=2), heart_rate=80)
+        self.newer = create_vital(self.patient, self.now - timedelta(hours=1), heart_rate=90)
+
+    def latest(self, patient=None):
+        snapshot = PatientLatestVitals.objects.filter(patient=patient or self.patient).first()
+        return snapshot and snapshot.vital_sign_id
+
+    def test_newest_reading_wins(self):
+        self.assertEqual(self.latest(), self.newer.pk)
+        # A late-entered reading from before the current one changes nothing
+        create_vital(self.patient, self.now - timedelta(hours=3))
+        self.assertEqual(self.latest(), self.newer.pk)
+        response = self.api.get(f'/api/patients/latest-vitals/?ids={self.patient.pk}')
+        self.assertEqual(response.data[0]['heart_rate'], 90)
+
+    def test_back_dating_and_deleting_the_current_reading(self):
+        self.newer.recorded_at = self.now - timedelta(hours=5)
+        self.newer.save()
+        self.assertEqual(self.latest(), self.older.pk)
+        self.older.delete()
+        self.assertEqual(self.latest(), self.newer.pk)
+        self.newer.delete()
+        self.assertIsNone(self.latest())
+
+    def test_moving_a_reading_to_another_patient(self):
+        other = create_patient(2)
+        self.newer.patient = other
+        self.newer.save()
+        self.assertEqual((self.latest(), self.latest(other)), (self.older.pk, self.newer.pk))
+
+    def test_bulk_delete_rebuilds_snapshots(self):
+        self.api.post('/api/vital-signs/bulk-delete/', {'ids': [self.newer.pk]}, format='json')
+        self.assertEqual(self.latest(), self.older.pk)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class EarlyWarningTests(TestCase):
+    """Ward early-warning scores (scoring.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        now = timezone.now()
+        self.stable = create_patient(1)
+        self.unwell = create_patient(2)
+        create_vital(self.stable, now - timedelta(hours=1))
+        create_vital(self.unwell, now - timedelta(hours=1), heart_rate=135, blood_pressure_systolic=85,
+                     oxygen_saturation=90)
+
+    def test_ward_scores_highest_first(self):
+        response = self.api.get('/api/patients/early-warning/?days=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([score['patient'] for score in response.data], [self.unwell.pk, self.stable.pk])
+        self.assertEqual(response.data[0]['risk'], 'high')
+
+    def test_min_score_filters_the_ward(self):
+        response = self.api.get('/api/patients/early-warning/?min_score=5')
+        self.assertEqual([score['patient'] for score in response.data], [self.unwell.pk])
+
+    def test_invalid_min_score_is_rejected(self):
+        for value in ('high', '-1', '2.5', ''):
+            with self.subTest(min_score=value):
+                response = self.api.get(f'/api/patients/early-warning/?min_score={value}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('min_score', response.data)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class DoseScheduleTests(TestCase):
+    """Frequency parsing and dose materialization (schedules.py)."""
+
+    def test_parse_frequency(self):
+        def at(*hours):
+            return tuple(datetime(2000, 1, 1, hour).time() for hour in hours)
+
+        cases = {
+            'Twice daily': Schedule(at(9, 21), 1, None),
+            'Once daily at bedtime': Schedule(at(22), 1, None),
+            'TID with meals': Schedule(at(8, 14, 20), 1, None),
+            '3x a day': Schedule(at(8, 14, 20), 1, None),
+            'Every 6 hours': Schedule((), 1, 6),
+            'q8h': Schedule((), 1, 8),
+            'Weekly': Schedule(at(9), 7, None),
+            'Every other day in the morning': Schedule(at(7), 2, None),
+            '8am and 8pm': Schedule(at(8, 20), 1, None),
+            'PRN': None,
+            'Twice daily as needed': None,
+            'See instructions': None,
+        }
+        for text, schedule in cases.items():
+            with self.subTest(frequency=text):
+                self.assertEqual(parse_frequency(text), schedule)
+
+    def test_dose_times(self):
+        start = datetime(2025, 3, 1).date()
+        window = (timezone.make_aware(datetime(2025, 3, 1, 10)), timezone.make_aware(datetime(2025, 3, 4)))
+        twice = [due.strftime('%d %H') for due in dose_times(parse_frequency('bid'), start, None, *window)]
+        self.assertEqual(twice, ['01 21', '02 09', '02 21', '03 09', '03 21'])
+        ended = list(dose_times(parse_frequency('bid'), start, start + timedelta(days=1), *window))
+        self.assertEqual(len(ended), 3)
+        every_ten = [due.strftime('%d %H') for due in dose_times(parse_frequency('q10h'), start, None, *window)]
+        self.assertEqual(every_ten, ['01 10', '01 20', '02 06', '02 16', '03 02', '03 12', '03 22'])
+
+    def test_medication_changes_refresh_doses(self):
+        patient = create_patient()
+        medication = create_medication(patient, frequency='Twice daily', start_date=timezone.localdate())
+        doses = ScheduledDose.objects.filter(medication=medication)
+        self.assertEqual(doses.count(), 4)  # MEDICATION_SCHEDULE_HORIZON_HOURS of 48
+        self.assertEqual({dose.due_at.hour for dose in doses.all()}, {9, 21})
+        medication.frequency = 'Every 12 hours'
+        medication.save()
+        self.assertEqual({dose.due_at.hour for dose in doses.all()}, {0, 12})
+        medication.is_active = False
+        medication.save()
+        self.assertFalse(doses.exists())
+
+        response = APIClient().post('/api/medications/bulk-update/', {
+            'ids': [medication.pk], 'values': {'is_active': True, 'frequency': 'Daily'},
+        }, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(doses.count(), 2)
+        due = APIClient().get(f'/api/medications/due/?hours=24&patient={patient.pk}')
+        self.assertEqual(len(due.data['results']), 1)
+
+    def test_materialize_doses_prunes_and_extends(self):
+        patient = create_patient()
+        medication = create_medication(patient, frequency='Twice daily', start_date=timezone.localdate())
+        Medication.objects.filter(pk=medication.pk).update(is_active=False)
+        # (created, deleted): the deactivated medication's doses go
+        self.assertEqual(materialize_doses(), (0, 4))
+        Medication.objects.filter(pk=medication.pk).update(is_active=True)
+        self.assertEqual(materialize_doses(), (4, 0))
+        self.assertEqual(materialize_doses(), (0, 0))
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class AppointmentCalendarTests(TestCase):
+    """The cached appointment calendar and its invalidation (calendars.py)."""
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.patient = create_patient(first_name='Ada', last_name='Lovelace')
+        self.start = timezone.localdate() + timedelta(days=1)
+        self.day = timezone.make_aware(datetime.combine(self.start, datetime.min.time())) + timedelta(hours=10)
+        self.appointment = create_appointment(self.patient, self.day)
+
+    def calendar(self, days=7):
+        response = self.api.get(f'/api/appointments/calendar/?start={self.start}&days={days}')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['days']
+
+    def names(self):
+        return [item['patient_name'] for day in self.calendar() for item in day['appointments']]
+
+    def test_window_lists_every_day(self):
+        days = self.calendar()
+        self.assertEqual(len(days), 7)
+        self.assertEqual([item['id'] for item in days[0]['appointments']], [self.appointment.pk])
+        self.assertEqual(days[1]['appointments'], [])
+
+    def test_bookings_invalidate_their_days(self):
+        self.assertEqual(len(self.names()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_appointment(self.patient, self.day + timedelta(days=2))
+        self.assertEqual(len(self.names()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        self.assertEqual(len(self.names()), 1)
+
+    def test_renaming_a_patient_invalidates(self):
+        self.assertEqual(self.names(), ['Ada Lovelace'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.last_name = 'Byron'
+            self.patient.save()
+        self.assertEqual(self.names(), ['Ada Byron'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post('/api/patients/bulk-update/', {
+                'ids': [self.patient.pk], 'values': {'first_name': 'Augusta'},
+            }, format='json')
+        self.assertEqual(self.names(), ['Augusta Byron'])
+
+    def test_days_must_be_a_whole_number(self):
+        for days in ('abc', '0', '365'):
+            with self.subTest(days=days):
+                response = self.api.get(f'/api/appointments/calendar/?start={self.start}&days={days}')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class PatientPurgeTests(TestCase):
+    """Batched patient deletion (purge.py)."""
+
+    def setUp(self):
+        self.api = APIClient()
+        now = timezone.now()
+        self.patient, self.other = create_patient(1), create_patient(2)
+        for patient in (self.patient, self.other):
+            for n in range(3):
+                create_record(patient, now - timedelta(days=n))
+                create_vital(patient, now - timedelta(hours=n))
+                create_appointment(patient, now + timedelta(days=n))
+            create_medication(patient, frequency='Twice daily', start_date=timezone.localdate())
+        create_vital(self.patient, archive_horizon() - timedelta(days=1))
+        self.assertEqual(sum(archive_rows(VitalSign)), 1)
+        self.other_rows = self.chart_rows(self.other)
+
+    def chart_rows(self, patient):
+        return {model._meta.label: model.objects.filter(patient_id=patient.pk).count() for model in CHILDREN}
+
+    def test_purge_deletes_the_whole_chart(self):
+        events = ChangeEvent.objects.count()
+        deleted = purge_patient(self.patient.pk, batch_size=2)
+        self.assertEqual(deleted['ehr.Patient'], 1)
+        self.assertEqual(deleted['ehr.VitalSign'], 3)
+        self.assertEqual(deleted['ehr.VitalSignArchive'], 1)
+        self.assertEqual(deleted['ehr.ScheduledDose'], 4)
+        self.assertFalse(Patient.objects.filter(pk=self.patient.pk).exists())
+        self.assertFalse(any(self.chart_rows(self.patient).values()))
+        self.assertEqual(self.chart_rows(self.other), self.other_rows)
+        # One delete event per tracked row: 3 visits, vitals, appointments, 1 medication, the patient
+        self.assertEqual(
+            ChangeEvent.objects.filter(pk__gt=events, operation='delete').count(), 3 * 3 + 1 + 1
+        )
+        self.assertEqual(purge_patient(self.patient.pk)['ehr.Patient'], 0)
+
+    def test_rollups_lose_the_purged_appointments(self):
+        purge_patient(self.patient.pk)
+        counts = dict(AppointmentRollup.objects.values_list('day', 'count'))
+        self.assertEqual(sum(counts.values()), 3)
+        rebuild_rollups()
+        self.assertEqual(dict(AppointmentRollup.objects.values_list('day', 'count')), counts)
+
+    def test_delete_endpoint_and_command(self):
+        response = self.api.delete(f'/api/patients/{self.patient.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(any(self.chart_rows(self.patient).values()))
+        call_command('purge_patients', str(self.other.pk), stdout=StringIO())
+        self.assertFalse(Patient.objects.exists())
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class AdminTests(TestCase):
+    """Changelists that do not scan large tables (admin.py)."""
+
+    # (URL, queries) for each changelist; the count includes the session and
+    # user lookups and must not change with the number of rows
+    CHANGELISTS = (
+        ('/admin/ehr/patient/', 5),
+        ('/admin/ehr/vitalsign/', 3),
+        ('/admin/ehr/appointment/', 5),
+        ('/admin/ehr/accesslog/', 5),
+    )
+
+    def setUp(self):
+        # Imported here: this module also loads under EHR_PROFILE=api, which has no admin
+        from django.contrib.admin import site
+        self.site = site
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.user
+        self.patients = [create_patient(number) for number in range(1, 4)]
+
+    def add_rows(self, count):
+        patient = self.patients[0]
+        now = timezone.now()
+        VitalSign.objects.bulk_create([
+            VitalSign(
+                patient=patient, recorded_at=now - timedelta(minutes=n), blood_pressure_systolic=120,
+                blood_pressure_diastolic=80, heart_rate=70, temperature=Decimal('98.6'), weight=Decimal('160.00'),
+            )
+            for n in range(count)
+        ])
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, appointment_date=now + timedelta(days=n % 400), doctor_name='Dr. Lee',
+                department='Cardiology', reason='Check-up',
+            )
+            for n in range(count)
+        ])
+        AccessLog.objects.bulk_create([
+            AccessLog(
+                timestamp=now - timedelta(days=n % 400), actor='nurse', patient_id=patient.pk,
+                resource='patient', action='retrieve', method='GET', status_code=200,
+            )
+            for n in range(count)
+        ])
+
+    def test_paginator_reads_one_row_past_the_page_instead_of_counting(self):
+        from .admin import NoCountPaginator
+
+        queryset = Patient.objects.order_by('pk')
+        with CaptureQueriesContext(connection) as queries:
+            paginator = NoCountPaginator(queryset, 2, number=1)
+            page = paginator.page(1)
+            self.assertEqual([patient.pk for patient in page], [p.pk for p in self.patients[:2]])
+            self.assertTrue(paginator.has_more)
+            self.assertEqual(paginator.count, 3)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'])
+        self.assertIn('LIMIT 3', queries[0]['sql'])
+
+        paginator = NoCountPaginator(queryset, 2, number=2)
+        self.assertEqual([patient.pk for patient in paginator.page(2)], [self.patients[2].pk])
+        self.assertFalse(paginator.has_more)
+        self.assertEqual(paginator.count, 3)
+
+    def test_search_matches_exact_values_of_indexed_columns(self):
+        record_admin = self.site._registry[MedicalRecord]
+        target = create_record(self.patients[1])
+        create_record(self.patients[0])
+
+        def search(term):
+            queryset, may_have_duplicates = record_admin.get_search_results(
+                self.request, MedicalRecord.objects.all(), term
+            )
+            self.assertFalse(may_have_duplicates)
+            with CaptureQueriesContext(connection) as queries:
+                rows = list(queryset)
+            self.assertFalse([query for query in queries.captured_queries if 'LIKE' in query['sql']])
+            return rows
+
+        self.assertEqual(search('MRN-T0002'), [target])
+        self.assertIn(target, search(str(target.pk)))  # as a record ID, or a patient ID
+        self.assertEqual(search(f'{target.pk} "MRN-T0002"'), [target])
+        self.assertEqual(search('MRN-T00'), [])  # no prefix or substring matches
+        self.assertEqual(search('Migraine'), [])  # unindexed columns are not searched
+
+        # Patients also match by name, from the typeahead index
+        autocomplete_index.swap(PrefixIndex.build(
+            Patient.objects.order_by().values_list('pk', *RECORD_FIELDS)
+        ), sequence=next(autocomplete_index._sequence))
+        self.addCleanup(setattr, autocomplete_index, 'index', None)
+        patient_admin = self.site._registry[Patient]
+        for term in ('MRN-T0003', 'ada test3'):
+            queryset, _ = patient_admin.get_search_results(self.request, Patient.objects.all(), term)
+            self.assertEqual(list(queryset), [self.patients[2]], term)
+
+    def test_maintained_tables_are_read_only(self):
+        log_admin = self.site._registry[AccessLog]
+        self.assertTrue(log_admin.has_view_permission(self.request))
+        self.assertFalse(log_admin.has_add_permission(self.request))
+        self.assertFalse(log_admin.has_change_permission(self.request))
+        self.assertFalse(log_admin.has_delete_permission(self.request))
+        entry = AccessLog.objects.create(
+            timestamp=timezone.now(), actor='nurse', patient_id=self.patients[0].pk, resource='patient', action='retrieve',
+            method='GET', status_code=200,
+        )
+        self.assertEqual(self.client.get('/admin/ehr/accesslog/add/').status_code, 403)
+        self.assertEqual(self.client.post(f'/admin/ehr/accesslog/{entry.pk}/delete/', {'post': 'yes'}).status_code, 403)
+        self.assertTrue(AccessLog.objects.filter(pk=entry.pk).exists())
+
+    def test_changelist_query_budgets(self):
+        def measure():
+            counts = {}
+            for url, _ in self.CHANGELISTS:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                sql = [query['sql'] for query in queries.captured_queries]
+                for statement in sql:
+                    self.assertNotIn('COUNT(', statement, url)
+                    self.assertNotIn('DISTINCT', statement, url)
+                counts[url] = len(sql)
+            return counts
+
+        self.add_rows(1)
+        small = measure()
+        self.add_rows(500)
+        large = measure()
+        for url, budget in self.CHANGELISTS:
+            with self.subTest(changelist=url):
+                self.assertEqual(small[url], budget, f'{url} ran {small[url]} queries (budget {budget})')
+                self.assertEqual(large[url], small[url], f'{url} query count grows with the data')
+
+
+@override_settings(AUDIT_LOG_ENABLED=False, SLOW_QUERY_LOG_ENABLED=False)
+class ApiProfileAuthTests(TestCase):
+    """
+    Token authentication (settings.py). StartupTests runs this class again
+    with EHR_PROFILE=api, where tokens are the only authentication.
+    """
+
+    def setUp(self):
+        self.api = APIClient()
+        self.staff = User.objects.create_user('nurse.lee', password='unused', is_staff=True)
+        self.api.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.staff).key}')
+
+    def test_token_resolves_the_user_and_audits_the_actor(self):
+        create_patient()
+        with mock.patch.object(audit_log, 'record') as record:
+            self.assertEqual(self.api.get('/api/patients/').status_code, 200)
+            self.assertEqual(APIClient().get('/api/patients/').status_code, 200)
+        self.assertEqual([call.kwargs['actor'] for call in record.call_args_list], ['nurse.lee', 'anonymous'])
+
+    def test_staff_endpoints_admit_staff_only(self):
+        for path in ('/api/slow-queries/', '/api/changes/?after=0'):
+            with self.subTest(path=path):
+                self.assertEqual(self.api.get(path).status_code, 200)
+                self.assertIn(APIClient().get(path).status_code, (401, 403))
+
+
+class StartupTests(SimpleTestCase):
+    """Modules a worker loads before its first request (views.py, signals.py)."""
+
+    def test_numpy_modules_load_on_first_use(self):
+        deferred = ['numpy', 'backend.ehr.cohorts', 'backend.ehr.scoring', 'backend.ehr.vitalstore']
+        script = (
+            'import sys, django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            f'print([name for name in {deferred!r} if name in sys.modules])'
+        )
+        for profile in ('full', 'api'):
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings', EHR_PROFILE=profile)
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True, check=True,
+            )
+            with self.subTest(profile=profile):
+                self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_api_profile_authenticates_with_tokens(self):
+        env = dict(os.environ, EHR_PROFILE='api')
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'test', 'backend.ehr.tests.ApiProfileAuthTests'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
@@ -2,7 +2,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     PatientViewSet, MedicalRecordViewSet, MedicationViewSet,
-    VitalSignViewSet, AppointmentViewSet
+    VitalSignViewSet, AppointmentViewSet, CohortViewSet, AppointmentStatsViewSet,
+    BatchViewSet, BatchGetViewSet, VitalStreamViewSet, SearchViewSet, SlowQueryViewSet, ChangeFeedViewSet,
+    live_events
 )
 
 router = DefaultRouter()
@@ -11,7 +13,16 @@ router.register(r'medical-records', MedicalRecordViewSet)
 router.register(r'medications', MedicationViewSet)
 router.register(r'vital-signs', VitalSignViewSet)
 router.register(r'appointments', AppointmentViewSet)
+router.register(r'cohorts', CohortViewSet, basename='cohort')
+router.register(r'appointment-stats', AppointmentStatsViewSet, basename='appointment-stats')
+router.register(r'vital-streams', VitalStreamViewSet, basename='vital-stream')
+router.register(r'search', SearchViewSet, basename='search')
+router.register(r'batch', BatchViewSet, basename='batch')
+router.register(r'batch-get', BatchGetViewSet, basename='batch-get')
+router.register(r'slow-queries', SlowQueryViewSet, basename='slow-query')
+router.register(r'changes', ChangeFeedViewSet, basename='change')
 
 urlpatterns = [
+    path('live/', live_events, name='live-events'),
     path('', include(router.urls)),
 ]
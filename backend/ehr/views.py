@@ -1,29 +1,250 @@
+import asyncio
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, filters
-from .models import Patient, MedicalRecord, Medication, VitalSign, Appointment
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .models import (
+    Patient, PatientLatestVitals, MedicalRecord, Medication, VitalSign, Appointment,
+    AppointmentRollup, MedicalRecordArchive, VitalSignArchive, ScheduledDose
+)
 from .serializers import (
-    PatientSerializer, MedicalRecordSerializer, MedicationSerializer,
-    VitalSignSerializer, AppointmentSerializer
+    PatientSerializer, PatientSummarySerializer, LatestVitalsSerializer, MedicalRecordSerializer, MedicationSerializer,
+    ScheduledDoseSerializer,
+    VitalSignSerializer, AppointmentSerializer, VitalStreamSerializer, SlowQuerySerializer,
+    ChangeEventSerializer
 )
-from .mixins import PatientFilterMixin
+from .mixins import ArchiveFallbackMixin, AuditMixin, BulkActionsMixin, PatientFilterMixin
+from .dispatch import SubrequestError, dispatch_gets, dispatch_subrequest
+from .rollups import apply_rollup_deltas, rollup_delete_deltas, rollup_update_deltas
+from .snapshots import rebuild_latest_vitals
+from .schedules import refresh_doses
+from .purge import purge_patient, purge_queue
+from .calendars import calendar_json, invalidate_all as invalidate_calendars
+from .dedup import KEY_FIELDS, possible_duplicates, rebuild_blocking_keys
+from .autocomplete import RECORD_FIELDS, autocomplete_index
+from .audit import audit_log
+from .live import broadcaster, publish_appointments
+from .search import InvalidSearchQuery, SearchUnavailable, search
+from .slowqueries import ORDERINGS, top_slow_queries
+from .outbox import acknowledge, consumer_offset, read_changes
+# scoring, cohorts and vitalstore are imported on first use: they pull in
+# NumPy, about 200ms of imports, for a few endpoints. autocomplete imports
+# NumPy itself when it first builds or reads its index. That is all that is
+# deferred. Every other module of this app, metrics (prometheus_client)
+# included, which cohorts also uses, is loaded at start-up by the signal
+# wiring in EhrConfig.ready() (signals.py).
+
+class PatientViewSet(AuditMixin, BulkActionsMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for Patient CRUD operations.
+
+    The list endpoint supports an optional summary mode that adds the last
+    visit, next appointment, active medication count and latest vitals to
+    each row in a single query.
+    Example: GET /api/patients/?summary=true
 
-class PatientViewSet(viewsets.ModelViewSet):
-    queryset = Patient.objects.all()
+    Creating a patient returns "possible_duplicates": existing patients that
+    look like the same person (see dedup.py). The patient is still created;
+    the list is for the registration clerk to review.
+    """
+    queryset = Patient.objects.select_related('latest_vitals')
     serializer_class = PatientSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['first_name', 'last_name', 'medical_record_number', 'email']
     ordering_fields = ['created_at', 'last_name', 'first_name']
+    bulk_filter_fields = ['gender', 'blood_type']
+
+    def is_summary_request(self):
+        summary = self.request.query_params.get('summary', '')
+        return self.action == 'list' and summary.lower() == 'true'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_summary_request():
+            queryset = queryset.with_chart_summary()
+        return queryset
+
+    def get_serializer_class(self):
+        if self.is_summary_request():
+            return PatientSummarySerializer
+        return super().get_serializer_class()
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data['possible_duplicates'] = self.serialize_duplicates(
+            possible_duplicates(response.data, exclude_id=response.data['id'])
+        )
+        return response
+
+    def serialize_duplicates(self, matches):
+        return [
+            {
+                'id': match['patient'].pk,
+                'medical_record_number': match['patient'].medical_record_number,
+                'first_name': match['patient'].first_name,
+                'last_name': match['patient'].last_name,
+                'date_of_birth': match['patient'].date_of_birth,
+                'score': match['score'],
+                'matched_fields': match['matched_fields'],
+            }
+            for match in matches
+        ]
+
+    @action(detail=False, methods=['post'], url_path='possible-duplicates')
+    def check_duplicates(self, request):
+        """
+        Check registration details for likely duplicates before creating.
+        Example: POST /api/patients/possible-duplicates/
+            {"first_name": "Jon", "last_name": "Smyth", "date_of_birth": "1980-04-02", "phone": "555-0100"}
+        """
+        serializer = self.get_serializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return Response(self.serialize_duplicates(possible_duplicates(serializer.validated_data)))
+
+    def perform_bulk_update(self, queryset, values):
+        if not set(values) & (set(KEY_FIELDS) | set(RECORD_FIELDS)):
+            return super().perform_bulk_update(queryset, values)
+        patient_ids = list(queryset.values_list('pk', flat=True))
+        updated = super().perform_bulk_update(queryset, values)
+        rebuild_blocking_keys(patient_ids)
+        autocomplete_index.refresh(patient_ids)
+        if values.keys() & {'first_name', 'last_name'}:
+            invalidate_calendars()  # cached calendars show patient names
+        return updated
 
-class MedicalRecordViewSet(PatientFilterMixin, viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Typeahead over names and MRNs, served from the in-process prefix
+        index. Every word must prefix the first name, last name or MRN.
+        Example: GET /api/patients/autocomplete/?q=jane%20sm&limit=10
+        """
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit() or not 1 <= int(limit) <= 50:
+            raise ValidationError({'limit': 'Must be between 1 and 50.'})
+        matches = autocomplete_index.lookup(request.query_params.get('q', ''), int(limit))
+        return Response([
+            {
+                'id': pk,
+                'first_name': first_name,
+                'last_name': last_name,
+                'medical_record_number': mrn,
+                'date_of_birth': date_of_birth,
+            }
+            for pk, (first_name, last_name, mrn, date_of_birth) in matches
+        ])
+
+    def destroy(self, request, *args, **kwargs):
+        """
+        Delete the patient and its whole chart in bounded batches (see
+        purge.py). With ?background=true the purge runs on a worker thread
+        and the response is 202 Accepted.
+        """
+        if request.query_params.get('background', '').lower() != 'true':
+            return super().destroy(request, *args, **kwargs)
+        patient = self.get_object()
+        purge_queue.enqueue(patient.pk)
+        return Response({'id': patient.pk, 'status': 'queued'}, status=202)
+
+    def perform_destroy(self, instance):
+        purge_patient(instance.pk)
+
+    def perform_bulk_delete(self, queryset):
+        # Patients own every other chart row; the ORM cascade would load them all
+        patient_ids = list(queryset.values_list('pk', flat=True))
+        return sum(purge_patient(pk)[Patient._meta.label] for pk in patient_ids)
+
+    def get_audit_patient_id(self, request, response):
+        if 'pk' in self.kwargs:
+            return int(self.kwargs['pk']) if str(self.kwargs['pk']).isdigit() else None
+        if self.action == 'create' and isinstance(response.data, dict):
+            return response.data.get('id')
+        return None
+
+    def get_scored_vitals(self):
+        """VitalSign rows to score, optionally limited with ?days=N."""
+        queryset = VitalSign.objects.all()
+        days = self.request.query_params.get('days')
+        if days is not None:
+            if not days.isdigit():
+                raise ValidationError({'days': 'Must be a positive integer.'})
+            queryset = queryset.filter(recorded_at__gte=timezone.now() - timedelta(days=int(days)))
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path='latest-vitals')
+    def latest_vitals(self, request):
+        """
+        Latest vitals for a set of patients, e.g. every bed on a ward board,
+        read from the PatientLatestVitals snapshot in one query.
+        Example: GET /api/patients/latest-vitals/?ids=1,2,3
+        """
+        max_ids = getattr(settings, 'LATEST_VITALS_MAX_IDS', 1000)
+        raw_ids = [pk for pk in request.query_params.get('ids', '').split(',') if pk]
+        if not raw_ids or not all(pk.isdigit() for pk in raw_ids):
+            raise ValidationError({'ids': 'Provide a comma-separated list of patient IDs.'})
+        if len(raw_ids) > max_ids:
+            raise ValidationError({'ids': f'At most {max_ids} patients per request.'})
+        snapshots = PatientLatestVitals.objects.filter(patient_id__in=raw_ids).order_by('patient_id')
+        return Response(LatestVitalsSerializer(snapshots, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path='early-warning')
+    def early_warning(self, request, pk=None):
+        """
+        NEWS2-style early-warning score and trend for one patient.
+        Example: GET /api/patients/1/early-warning/?days=7
+        """
+        from .scoring import compute_early_warning_scores
+
+        patient = self.get_object()
+        scores = compute_early_warning_scores(
+            self.get_scored_vitals().filter(patient=patient), history=True
+        )
+        return Response(scores.get(patient.pk, {'patient': patient.pk, 'score': None}))
+
+    @action(detail=False, methods=['get'], url_path='early-warning')
+    def ward_early_warning(self, request):
+        """
+        Latest early-warning score for every patient with vitals, highest first.
+        Example: GET /api/patients/early-warning/?days=1&min_score=5
+        """
+        from .scoring import compute_early_warning_scores
+
+        min_score = request.query_params.get('min_score')
+        if min_score is not None and not min_score.isdigit():
+            raise ValidationError({'min_score': 'Must be a non-negative integer.'})
+        scores = list(compute_early_warning_scores(self.get_scored_vitals()).values())
+        if min_score is not None:
+            scores = [s for s in scores if s['score'] >= int(min_score)]
+        scores.sort(key=lambda s: (-s['score'], s['patient']))
+        return Response(scores)
+
+class MedicalRecordViewSet(AuditMixin, BulkActionsMixin, ArchiveFallbackMixin, PatientFilterMixin,
+                           viewsets.ModelViewSet):
     """
     ViewSet for MedicalRecord CRUD operations.
     
     Uses PatientFilterMixin to filter by patient ID.
-    Example: GET /api/medical-records/?patient=1
+    Uses ArchiveFallbackMixin to filter by visit date and read archived visits.
+    Examples:
+        GET /api/medical-records/?patient=1
+        GET /api/medical-records/?patient=1&start=2019-01-01
     """
     queryset = MedicalRecord.objects.all()
+    archive_model = MedicalRecordArchive
+    archive_date_field = 'visit_date'
     serializer_class = MedicalRecordSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['visit_date', 'created_at']
+    bulk_filter_fields = ['patient', 'doctor_name', 'visit_date__gte', 'visit_date__lt']
     
     # Old implementation (replaced by mixin):
     # def get_queryset(self):
@@ -33,7 +254,7 @@ class MedicalRecordViewSet(PatientFilterMixin, viewsets.ModelViewSet):
     #         queryset = queryset.filter(patient_id=patient_id)
     #     return queryset
 
-class MedicationViewSet(PatientFilterMixin, viewsets.ModelViewSet):
+class MedicationViewSet(AuditMixin, BulkActionsMixin, PatientFilterMixin, viewsets.ModelViewSet):
     """
     ViewSet for Medication CRUD operations.
     
@@ -42,11 +263,15 @@ class MedicationViewSet(PatientFilterMixin, viewsets.ModelViewSet):
     Examples:
         GET /api/medications/?patient=1
         GET /api/medications/?patient=1&is_active=true
+
+    Doses due soon, from the materialized schedule (see schedules.py):
+        GET /api/medications/due/?hours=2&ids=1,2,3
     """
     queryset = Medication.objects.all()
     serializer_class = MedicationSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['start_date', 'created_at']
+    bulk_filter_fields = ['patient', 'is_active', 'medication_name', 'end_date__lt', 'start_date__gte']
     
     def get_queryset(self):
         # Call parent (mixin) to get patient-filtered queryset
@@ -59,17 +284,89 @@ class MedicationViewSet(PatientFilterMixin, viewsets.ModelViewSet):
         
         return queryset
 
-class VitalSignViewSet(PatientFilterMixin, viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def due(self, request):
+        """
+        Scheduled doses due from now, earliest first, for the whole ward or
+        for some patients.
+
+        Query parameters:
+            hours: window length (default 2, at most MEDICATION_DUE_MAX_HOURS)
+            patient: one patient ID, or ids: a comma-separated list (a ward board)
+        Example: GET /api/medications/due/?hours=2&ids=1,2,3
+        """
+        max_hours = getattr(settings, 'MEDICATION_DUE_MAX_HOURS', 24)
+        hours = request.query_params.get('hours', '2')
+        if not hours.isdigit() or not 0 < int(hours) <= max_hours:
+            raise ValidationError({'hours': f'Must be a whole number of hours from 1 to {max_hours}.'})
+        now = timezone.now()
+        doses = ScheduledDose.objects.filter(
+            due_at__gte=now, due_at__lt=now + timedelta(hours=int(hours))
+        ).select_related('medication')
+
+        patient_ids = [pk for pk in request.query_params.get('ids', '').split(',') if pk]
+        if 'patient' in request.query_params:
+            patient_ids.append(request.query_params['patient'])
+        if patient_ids:
+            if not all(pk.isdigit() for pk in patient_ids):
+                raise ValidationError({'ids': 'Provide a comma-separated list of patient IDs.'})
+            doses = doses.filter(patient_id__in=patient_ids)
+
+        page = self.paginate_queryset(doses)
+        if page is not None:
+            return self.get_paginated_response(ScheduledDoseSerializer(page, many=True).data)
+        return Response(ScheduledDoseSerializer(doses, many=True).data)
+
+    # Bulk changes bypass the schedule signal handler, so refresh the doses
+    # of every medication whose schedule may have changed
+    def perform_bulk_update(self, queryset, values):
+        if not values.keys() & {'patient', 'frequency', 'start_date', 'end_date', 'is_active'}:
+            return super().perform_bulk_update(queryset, values)
+        medication_ids = list(queryset.values_list('pk', flat=True))
+        updated = super().perform_bulk_update(queryset, values)
+        refresh_doses(medication_ids)
+        return updated
+
+    def perform_bulk_delete(self, queryset):
+        # A raw DELETE does not cascade to the medications' doses
+        doses = ScheduledDose.objects.filter(medication__in=queryset)
+        doses._raw_delete(doses.db)
+        return super().perform_bulk_delete(queryset)
+
+class VitalSignViewSet(AuditMixin, BulkActionsMixin, ArchiveFallbackMixin, PatientFilterMixin,
+                       viewsets.ModelViewSet):
     """
     ViewSet for VitalSign CRUD operations.
     
     Uses PatientFilterMixin to filter by patient ID.
-    Example: GET /api/vital-signs/?patient=1
+    Uses ArchiveFallbackMixin to filter by recording time and read archived readings.
+    Examples:
+        GET /api/vital-signs/?patient=1
+        GET /api/vital-signs/?patient=1&start=2019-01-01&end=2020-01-01
     """
     queryset = VitalSign.objects.all()
+    archive_model = VitalSignArchive
+    archive_date_field = 'recorded_at'
     serializer_class = VitalSignSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['recorded_at', 'created_at']
+    bulk_filter_fields = ['patient', 'recorded_at__gte', 'recorded_at__lt']
+
+    # Bulk changes bypass the snapshot signal handlers, so rebuild the
+    # latest-vitals snapshots of every patient touched
+    def perform_bulk_update(self, queryset, values):
+        patient_ids = set(queryset.values_list('patient_id', flat=True).distinct())
+        updated = super().perform_bulk_update(queryset, values)
+        if 'patient' in values:
+            patient_ids.add(values['patient'].pk)
+        rebuild_latest_vitals(patient_ids)
+        return updated
+
+    def perform_bulk_delete(self, queryset):
+        patient_ids = set(queryset.values_list('patient_id', flat=True).distinct())
+        deleted = super().perform_bulk_delete(queryset)
+        rebuild_latest_vitals(patient_ids)
+        return deleted
     
     # Old implementation (replaced by mixin):
     # def get_queryset(self):
@@ -79,7 +376,7 @@ class VitalSignViewSet(PatientFilterMixin, viewsets.ModelViewSet):
     #         queryset = queryset.filter(patient_id=patient_id)
     #     return queryset
 
-class AppointmentViewSet(PatientFilterMixin, viewsets.ModelViewSet):
+class AppointmentViewSet(AuditMixin, BulkActionsMixin, PatientFilterMixin, viewsets.ModelViewSet):
     """
     ViewSet for Appointment CRUD operations.
     
@@ -88,11 +385,16 @@ class AppointmentViewSet(PatientFilterMixin, viewsets.ModelViewSet):
     Examples:
         GET /api/appointments/?patient=1
         GET /api/appointments/?patient=1&status=scheduled
+        GET /api/appointments/calendar/?start=2025-03-03&days=7&department=Cardiology
     """
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['appointment_date', 'created_at']
+    bulk_filter_fields = [
+        'patient', 'status', 'status__in', 'department', 'doctor_name',
+        'appointment_date__gte', 'appointment_date__lt',
+    ]
     
     def get_queryset(self):
         # Call parent (mixin) to get patient-filtered queryset
@@ -104,3 +406,487 @@ class AppointmentViewSet(PatientFilterMixin, viewsets.ModelViewSet):
             queryset = queryset.filter(status=status)
         
         return queryset
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Every patient's appointments in a date window, grouped by day, with
+        the patient's name. Cached per window until an appointment on one of
+        its days changes or a patient is renamed.
+
+        Query parameters:
+            start: first day, YYYY-MM-DD (default today)
+            days: window length (default 7, at most APPOINTMENT_CALENDAR_MAX_DAYS)
+            department, doctor: exact department or doctor name
+            refresh: true to bypass the cache
+        Example: GET /api/appointments/calendar/?start=2025-03-03&days=7&doctor=Dr.%20Smith
+        """
+        start = request.query_params.get('start')
+        if start is None:
+            start = timezone.localdate()
+        else:
+            start = parse_date(start)
+            if start is None:
+                raise ValidationError({'start': 'Must be a date in YYYY-MM-DD format.'})
+        max_days = getattr(settings, 'APPOINTMENT_CALENDAR_MAX_DAYS', 31)
+        days = request.query_params.get('days', '7')
+        if not days.isdigit() or not 0 < int(days) <= max_days:
+            raise ValidationError({'days': f'Must be a whole number of days from 1 to {max_days}.'})
+        end = start + timedelta(days=int(days))
+        department = request.query_params.get('department') or None
+        doctor = request.query_params.get('doctor') or None
+        refresh = request.query_params.get('refresh', '').lower() == 'true'
+        body = calendar_json(start, end, department, doctor, refresh=refresh)
+        return HttpResponse(body, content_type='application/json')
+
+    # Bulk changes bypass the rollup and calendar signal handlers, so apply
+    # the deltas and drop the cached calendars here
+    def perform_bulk_update(self, queryset, values):
+        deltas = rollup_update_deltas(queryset, values)
+        changed_ids = (
+            list(queryset.exclude(status=values['status']).values_list('pk', flat=True))
+            if 'status' in values else []
+        )
+        updated = super().perform_bulk_update(queryset, values)
+        apply_rollup_deltas(deltas)
+        invalidate_calendars()
+        if changed_ids:
+            publish_appointments(changed_ids)
+        return updated
+
+    def perform_bulk_delete(self, queryset):
+        deltas = rollup_delete_deltas(queryset)
+        deleted = super().perform_bulk_delete(queryset)
+        apply_rollup_deltas(deltas)
+        invalidate_calendars()
+        return deleted
+
+class CohortViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    Cohort queries over diagnoses, medications, vital ranges and demographics.
+
+    POST a filter tree (see cohorts.py for the grammar) and get back the
+    matching patients, paginated. Membership is cached as a patient-ID bitmap,
+    so repeating a cohort or combining cached cohorts with and/or/not is
+    answered in memory.
+    Example:
+        POST /api/cohorts/
+        {"filter": {"and": [
+            {"medication": {"name": "Metformin", "active": true}},
+            {"vital": {"field": "blood_pressure_systolic", "gt": 140, "within_days": 90}}
+        ]}}
+    """
+    pagination_class = PageNumberPagination
+
+    def create(self, request):
+        from .cohorts import InvalidCohortFilter, bitmap_to_ids, resolve_cohort
+
+        if not isinstance(request.data, dict):
+            raise ValidationError({'detail': 'Request body must be an object.'})
+        tree = request.data.get('filter')
+        refresh = request.query_params.get('refresh', '').lower() == 'true'
+        try:
+            bitmap, cached = resolve_cohort(tree, refresh=refresh)
+        except InvalidCohortFilter as exc:
+            raise ValidationError({'filter': str(exc)})
+
+        paginator = self.pagination_class()
+        page_ids = paginator.paginate_queryset(bitmap_to_ids(bitmap), request, view=self)
+        patients = Patient.objects.select_related('latest_vitals').in_bulk(page_ids)
+        serializer = PatientSerializer(
+            [patients[pk] for pk in page_ids if pk in patients], many=True
+        )
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['cached'] = cached
+        return response
+
+class AppointmentStatsViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    Appointment volume and no-show rates, read only from AppointmentRollup.
+
+    Query parameters:
+        start, end: date range (YYYY-MM-DD, default: the last 30 days)
+        department, doctor: optional filters
+        group_by: comma-separated list of day, department, doctor (default: day)
+    Example: GET /api/appointment-stats/?start=2025-01-01&group_by=department
+    """
+    GROUP_FIELDS = {'day': 'day', 'department': 'department', 'doctor': 'doctor_name'}
+
+    def get_date_param(self, name, default):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValidationError({name: 'Must be a date in YYYY-MM-DD format.'})
+        return parsed
+
+    def list(self, request):
+        today = timezone.localdate()
+        start = self.get_date_param('start', today - timedelta(days=30))
+        end = self.get_date_param('end', today)
+
+        group_by = request.query_params.get('group_by', 'day').split(',')
+        unknown = [name for name in group_by if name not in self.GROUP_FIELDS]
+        if unknown:
+            raise ValidationError({'group_by': f'Unknown grouping: {", ".join(unknown)}.'})
+        group_fields = [self.GROUP_FIELDS[name] for name in group_by]
+
+        rollups = AppointmentRollup.objects.filter(day__gte=start, day__lte=end)
+        department = request.query_params.get('department')
+        if department:
+            rollups = rollups.filter(department=department)
+        doctor = request.query_params.get('doctor')
+        if doctor:
+            rollups = rollups.filter(doctor_name=doctor)
+
+        rows = (
+            rollups.values(*group_fields, 'status')
+            .annotate(total=Sum('count'))
+            .order_by(*group_fields)
+        )
+        groups = {}
+        for row in rows:
+            key = tuple(row[field] for field in group_fields)
+            if key not in groups:
+                groups[key] = dict(zip(group_fields, key))
+                groups[key].update(
+                    total=0, by_status={status: 0 for status, _ in Appointment.STATUS_CHOICES}
+                )
+            groups[key]['by_status'][row['status']] += row['total']
+            groups[key]['total'] += row['total']
+
+        for group in groups.values():
+            attended = group['by_status']['completed'] + group['by_status']['no_show']
+            group['no_show_rate'] = (
+                round(group['by_status']['no_show'] / attended, 4) if attended else None
+            )
+        return Response({'start': start, 'end': end, 'results': list(groups.values())})
+
+class VitalStreamViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    High-frequency monitor readings kept in the compact per-hour store
+    (VitalSignBlock) instead of one VitalSign row per reading.
+
+    GET returns readings in the same shape as /api/vital-signs/, oldest first.
+    Query parameters:
+        patient: patient ID (required)
+        start, end: ISO 8601 datetimes (default: the last hour); the range may
+            span at most VITAL_STREAM_MAX_RANGE_HOURS
+    Example: GET /api/vital-streams/?patient=1&start=2025-01-01T08:00:00Z
+
+    POST appends readings:
+        {"patient": 1, "readings": [
+            {"recorded_at": "2025-01-01T08:00:05Z", "heart_rate": 82,
+             "blood_pressure_systolic": 121, "blood_pressure_diastolic": 79,
+             "oxygen_saturation": 97, "temperature": 98.6}
+        ]}
+    """
+
+    def get_datetime_param(self, name, default):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({name: 'Must be an ISO 8601 datetime.'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def list(self, request):
+        patient_id = request.query_params.get('patient')
+        if not patient_id or not patient_id.isdigit():
+            raise ValidationError({'patient': 'A patient ID is required.'})
+        end = self.get_datetime_param('end', timezone.now())
+        start = self.get_datetime_param('start', end - timedelta(hours=1))
+        max_hours = getattr(settings, 'VITAL_STREAM_MAX_RANGE_HOURS', 24)
+        if end <= start:
+            raise ValidationError({'end': 'Must be after start.'})
+        if end - start > timedelta(hours=max_hours):
+            raise ValidationError({'start': f'The range may span at most {max_hours} hours.'})
+
+        from .vitalstore import read_readings, readings_to_json
+
+        patient_id = int(patient_id)
+        columns = read_readings(patient_id, start, end)
+        return Response({
+            'patient': patient_id,
+            'start': start,
+            'end': end,
+            'count': len(columns['recorded_at']),
+            'results': readings_to_json(patient_id, columns),
+        })
+
+    def create(self, request):
+        serializer = VitalStreamSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        from .vitalstore import append_readings
+
+        patient = serializer.validated_data['patient']
+        stored = append_readings(patient.pk, serializer.validated_data['readings'])
+        return Response({'patient': patient.pk, 'stored': stored}, status=201)
+
+class SearchViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    Ranked full-text search over visit notes, medication notes and
+    appointment reasons (see search.py).
+
+    Query parameters:
+        q: words and "quoted phrases" that must all appear; word* for prefixes
+        patient: optional patient ID to search one chart
+        source: optional medical_record, medication or appointment
+        limit, offset: paging (default 20, 0)
+    Example: GET /api/search/?q="chest pain"&patient=1
+    """
+
+    def get_int_param(self, name, default, maximum=None):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        if not value.isdigit():
+            raise ValidationError({name: 'Must be a non-negative integer.'})
+        return min(int(value), maximum) if maximum else int(value)
+
+    def list(self, request):
+        patient_id = request.query_params.get('patient')
+        if patient_id is not None and not patient_id.isdigit():
+            raise ValidationError({'patient': 'Must be a patient ID.'})
+        limit = self.get_int_param('limit', 20, maximum=100) or 20
+        offset = self.get_int_param('offset', 0)
+        try:
+            results, has_more = search(
+                request.query_params.get('q', ''),
+                patient_id=patient_id,
+                source=request.query_params.get('source') or None,
+                limit=limit,
+                offset=offset,
+            )
+        except InvalidSearchQuery as exc:
+            raise ValidationError({'q': str(exc)})
+        except SearchUnavailable as exc:
+            return Response({'detail': str(exc)}, status=501)
+        return Response({
+            'next_offset': offset + limit if has_more else None,
+            'results': results,
+        })
+
+class BatchViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    Run several API operations in one request and one transaction.
+
+    Operations run in order. If one fails (status 400 or above) the whole
+    batch is rolled back and the remaining operations are not run.
+    Example:
+        POST /api/batch/
+        {"operations": [
+            {"method": "POST", "path": "/api/medications/bulk-update/",
+             "body": {"filter": {"patient": 1, "is_active": true}, "values": {"is_active": false}}},
+            {"method": "POST", "path": "/api/medical-records/", "body": {...}},
+            {"method": "GET", "path": "/api/patients/1/"}
+        ]}
+    """
+    ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+    def create(self, request):
+        if not isinstance(request.data, dict):
+            raise ValidationError({'detail': 'Request body must be an object.'})
+        operations = request.data.get('operations')
+        max_operations = getattr(settings, 'BATCH_MAX_OPERATIONS', 50)
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError({'operations': 'Must be a non-empty list.'})
+        if len(operations) > max_operations:
+            raise ValidationError({'operations': f'At most {max_operations} operations per batch.'})
+        for operation in operations:
+            if not isinstance(operation, dict) or str(operation.get('method', '')).upper() not in self.ALLOWED_METHODS:
+                raise ValidationError({'operations': f'Each operation needs a method in {", ".join(self.ALLOWED_METHODS)} and a path.'})
+
+        results = []
+        with transaction.atomic():
+            for operation in operations:
+                if results and results[-1]['status'] >= 400:
+                    results.append({
+                        'status': 424,
+                        'body': {'detail': 'Not run: an earlier operation failed.'},
+                    })
+                    continue
+                try:
+                    with transaction.atomic():
+                        status, body = dispatch_subrequest(
+                            request._request, operation['method'], operation.get('path'),
+                            operation.get('body'), excluded_views=BATCH_VIEWS,
+                        )
+                except SubrequestError as exc:
+                    status, body = 400, {'detail': str(exc)}
+                results.append({'status': status, 'body': body})
+            committed = all(result['status'] < 400 for result in results)
+            if not committed:
+                transaction.set_rollback(True)
+
+        return Response({'committed': committed, 'results': results})
+
+
+class BatchGetViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    Run several independent GETs in one request.
+
+    Each URL is resolved and its view called in this process, so the
+    sub-requests skip HTTP, CORS and session handling. Up to
+    BATCH_GET_WORKERS run at once, each on its own database connection.
+    Results come back in the order of the URLs, with each sub-request's own
+    status; one failing does not affect the others.
+    Example:
+        POST /api/batch-get/
+        {"urls": ["/api/patients/1/",
+                  "/api/medications/?patient=1&is_active=true",
+                  "/api/appointments/?patient=1"]}
+    """
+
+    def create(self, request):
+        if not isinstance(request.data, dict):
+            raise ValidationError({'detail': 'Request body must be an object.'})
+        urls = request.data.get('urls')
+        max_urls = getattr(settings, 'BATCH_GET_MAX_URLS', 50)
+        if not isinstance(urls, list) or not urls:
+            raise ValidationError({'urls': 'Must be a non-empty list.'})
+        if len(urls) > max_urls:
+            raise ValidationError({'urls': f'At most {max_urls} URLs per request.'})
+
+        responses = dispatch_gets(
+            request._request, urls, excluded_views=BATCH_VIEWS,
+            workers=getattr(settings, 'BATCH_GET_WORKERS', 4),
+        )
+        return Response({'results': [
+            {'url': url, 'status': status, 'body': body}
+            for url, (status, body) in zip(urls, responses)
+        ]})
+
+
+# Views the batch endpoints refuse to run as sub-requests
+BATCH_VIEWS = (BatchViewSet, BatchGetViewSet)
+
+
+class SlowQueryViewSet(viewsets.ViewSet):
+    """
+    Slowest SQL statements seen by the slow-query log (see slowqueries.py),
+    with the plan of each one's slowest execution. Staff only.
+
+    Query parameters:
+        order: total (default), mean, max or count
+        top: number of statements (default 20, at most 200)
+    Example: GET /api/slow-queries/?order=mean&top=10
+    """
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        order = request.query_params.get('order', 'total')
+        if order not in ORDERINGS:
+            raise ValidationError({'order': f'Must be one of {", ".join(ORDERINGS)}.'})
+        try:
+            top = min(int(request.query_params.get('top', 20)), 200)
+        except ValueError:
+            raise ValidationError({'top': 'Must be an integer.'})
+        return Response(SlowQuerySerializer(top_slow_queries(order, top), many=True).data)
+
+class ChangeFeedViewSet(AuditMixin, viewsets.ViewSet):
+    """
+    The change feed (see outbox.py): every create, update and delete of the
+    EHR models, in order, for downstream systems. Staff only.
+
+    A consumer reads from its checkpoint, processes the events, then
+    acknowledges the last position so the next read starts after it. Reads
+    are repeatable until acknowledged, so delivery is at least once.
+
+    Query parameters:
+        consumer: read after this consumer's checkpoint, or
+        after: read after this feed position
+        limit: events per read (default 500, at most CHANGE_FEED_MAX_BATCH)
+    Examples:
+        GET /api/changes/?consumer=billing&limit=500
+        POST /api/changes/ack/ {"consumer": "billing", "offset": 1234}
+    """
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        max_batch = getattr(settings, 'CHANGE_FEED_MAX_BATCH', 1000)
+        limit = request.query_params.get('limit', '500')
+        if not limit.isdigit() or not 0 < int(limit) <= max_batch:
+            raise ValidationError({'limit': f'Must be a whole number from 1 to {max_batch}.'})
+        consumer = request.query_params.get('consumer')
+        after = request.query_params.get('after')
+        if after is not None:
+            if not after.isdigit():
+                raise ValidationError({'after': 'Must be a feed position.'})
+            after = int(after)
+        elif consumer:
+            after = consumer_offset(consumer)
+        else:
+            raise ValidationError({'consumer': 'Provide a consumer name or an "after" position.'})
+
+        events = read_changes(after, int(limit))
+        return Response({
+            'consumer': consumer,
+            'after': after,
+            'last': events[-1].position if events else after,
+            'events': ChangeEventSerializer(events, many=True).data,
+        })
+
+    @action(detail=False, methods=['post'])
+    def ack(self, request):
+        """Move a consumer's checkpoint forward to the last event it processed."""
+        consumer = request.data.get('consumer')
+        offset = request.data.get('offset')
+        if not isinstance(consumer, str) or not 0 < len(consumer) <= 100:
+            raise ValidationError({'consumer': 'Must be a name of at most 100 characters.'})
+        if not isinstance(offset, int) or offset < 0:
+            raise ValidationError({'offset': 'Must be a feed position.'})
+        acknowledge(consumer, offset)
+        return Response({'consumer': consumer, 'offset': consumer_offset(consumer)})
+
+async def live_events(request):
+    """
+    Server-Sent Events stream of new vital signs and appointment status
+    changes for up to LIVE_EVENTS_MAX_PATIENTS patients (see live.py).
+    Serve through backend/asgi.py; each idle stream is one coroutine.
+    Example: GET /api/live/?patients=1,2,3
+
+    Events are "vital_sign" and "appointment", with the same data as the
+    REST endpoints. A "resync" event means events were dropped for a slow
+    client, which should reload the chart.
+    """
+    raw_ids = [pk for pk in request.GET.get('patients', '').split(',') if pk]
+    max_patients = getattr(settings, 'LIVE_EVENTS_MAX_PATIENTS', 50)
+    if not raw_ids or not all(pk.isdigit() for pk in raw_ids):
+        return JsonResponse({'patients': 'Provide a comma-separated list of patient IDs.'}, status=400)
+    if len(raw_ids) > max_patients:
+        return JsonResponse({'patients': f'At most {max_patients} patients per stream.'}, status=400)
+    patient_ids = {int(pk) for pk in raw_ids}
+
+    # No AuthenticationMiddleware (hence no auser) under EHR_PROFILE=api
+    user = await request.auser() if hasattr(request, 'auser') else None
+    actor = user.get_username() if user is not None and user.is_authenticated else 'anonymous'
+    for patient_id in patient_ids:
+        audit_log.record(actor, patient_id, 'live-events', 'stream', '', 'GET', 200)
+
+    response = StreamingHttpResponse(stream_events(patient_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+async def stream_events(patient_ids):
+    subscription = broadcaster.subscribe(patient_ids)
+    heartbeat = getattr(settings, 'LIVE_EVENTS_HEARTBEAT', 15)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if message is None:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            yield message
+    finally:
+        broadcaster.unsubscribe(subscription)
@@ -0,0 +1,174 @@
+# Compact vital sign stream store
+# Packs high-frequency monitor readings into one VitalSignBlock per patient
+# per hour. Every column is a little-endian fixed-width array:
+#
+#     offsets                   uint16  seconds since hour_start
+#     heart_rate                uint16  beats per minute
+#     blood_pressure_systolic   uint16  mmHg
+#     blood_pressure_diastolic  uint16  mmHg
+#     oxygen_saturation         uint8   percent, 255 = not measured
+#     temperature               uint16  tenths of a degree F, 0 = not measured
+#
+# That is 11 bytes per reading. Appends concatenate the new bytes onto each
+# column; only out-of-order writes re-sort a block. Reads decode the blobs
+# straight into NumPy arrays, never building per-row objects.
+
+from datetime import timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+
+from .models import VitalSignBlock
+
+COLUMNS = {
+    'offsets': np.dtype('<u2'),
+    'heart_rate': np.dtype('<u2'),
+    'blood_pressure_systolic': np.dtype('<u2'),
+    'blood_pressure_diastolic': np.dtype('<u2'),
+    'oxygen_saturation': np.dtype('u1'),
+    'temperature': np.dtype('<u2'),
+}
+BYTES_PER_READING = sum(dtype.itemsize for dtype in COLUMNS.values())
+MISSING_OXYGEN_SATURATION = 255
+MISSING_TEMPERATURE = 0
+
+
+def hour_floor(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def encode_readings(hour_start, readings):
+    """Encode reading dicts that fall in one hour into column arrays."""
+    columns = {
+        'offsets': [int((r['recorded_at'] - hour_start).total_seconds()) for r in readings],
+        'heart_rate': [r['heart_rate'] for r in readings],
+        'blood_pressure_systolic': [r['blood_pressure_systolic'] for r in readings],
+        'blood_pressure_diastolic': [r['blood_pressure_diastolic'] for r in readings],
+        'oxygen_saturation': [
+            MISSING_OXYGEN_SATURATION if r.get('oxygen_saturation') is None
+            else r['oxygen_saturation']
+            for r in readings
+        ],
+        'temperature': [
+            MISSING_TEMPERATURE if r.get('temperature') is None
+            else int(round(float(r['temperature']) * 10))
+            for r in readings
+        ],
+    }
+    return {name: np.array(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+
+
+def decode_block(block):
+    """Decode a block's blobs (row or values dict) into column arrays."""
+    return {
+        name: np.frombuffer(bytes(block[name]), dtype=dtype)
+        for name, dtype in COLUMNS.items()
+    }
+
+
+def append_readings(patient_id, readings):
+    """
+    Append readings (dicts with recorded_at, heart_rate,
+    blood_pressure_systolic, blood_pressure_diastolic and optionally
+    oxygen_saturation and temperature) for one patient. Returns the number of
+    readings stored.
+    """
+    by_hour = {}
+    for reading in readings:
+        by_hour.setdefault(hour_floor(reading['recorded_at']), []).append(reading)
+
+    with transaction.atomic():
+        for hour_start, hour_readings in sorted(by_hour.items()):
+            new = encode_readings(hour_start, hour_readings)
+            block, _ = VitalSignBlock.objects.select_for_update().get_or_create(
+                patient_id=patient_id, hour_start=hour_start
+            )
+            existing = decode_block({name: getattr(block, name) for name in COLUMNS})
+            in_order = (
+                np.all(np.diff(new['offsets'].astype(np.int32)) >= 0)
+                and (not block.count or new['offsets'][0] >= existing['offsets'][-1])
+            )
+            if in_order:
+                for name in COLUMNS:
+                    setattr(block, name, bytes(getattr(block, name)) + new[name].tobytes())
+            else:
+                order = np.argsort(
+                    np.concatenate([existing['offsets'], new['offsets']]), kind='stable'
+                )
+                for name in COLUMNS:
+                    merged = np.concatenate([existing[name], new[name]])[order]
+                    setattr(block, name, merged.tobytes())
+            block.count += len(hour_readings)
+            block.save()
+    return len(readings)
+
+
+def read_readings(patient_id, start, end):
+    """
+    Decode every reading for ``patient_id`` with start <= recorded_at < end.
+
+    Returns a dict of NumPy arrays: 'recorded_at' (datetime64[s], UTC) plus
+    one array per measurement column.
+    """
+    blocks = VitalSignBlock.objects.filter(
+        patient_id=patient_id,
+        hour_start__gte=hour_floor(start),
+        hour_start__lt=end,
+    ).order_by('hour_start').values('hour_start', *COLUMNS)
+
+    decoded = []
+    for block in blocks:
+        columns = decode_block(block)
+        base = int(block['hour_start'].timestamp())
+        columns['recorded_at'] = base + columns.pop('offsets').astype(np.int64)
+        decoded.append(columns)
+    names = ['recorded_at'] + [name for name in COLUMNS if name != 'offsets']
+    if not decoded:
+        empty = {name: np.array([], dtype=COLUMNS[name]) for name in names[1:]}
+        return {'recorded_at': np.array([], dtype='datetime64[s]'), **empty}
+
+    result = {name: np.concatenate([columns[name] for columns in decoded]) for name in names}
+    mask = (result['recorded_at'] >= int(start.timestamp())) & (
+        result['recorded_at'] < int(end.timestamp())
+    )
+    result = {name: values[mask] for name, values in result.items()}
+    result['recorded_at'] = result['recorded_at'].astype('datetime64[s]')
+    return result
+
+
+def readings_to_json(patient_id, columns):
+    """
+    Render decoded columns in the same shape as VitalSignSerializer. Fields
+    monitors do not stream (weight, height, notes, row timestamps) are empty.
+    """
+    recorded_at = [f'{value}Z' for value in np.datetime_as_string(columns['recorded_at'], unit='s')]
+    temperature = columns['temperature']
+    temperature = np.where(
+        temperature == MISSING_TEMPERATURE, '', np.char.mod('%.1f', temperature / 10.0)
+    ).tolist()
+    oxygen_saturation = columns['oxygen_saturation'].tolist()
+    return [
+        {
+            'id': None,
+            'patient': patient_id,
+            'recorded_at': recorded,
+            'blood_pressure_systolic': systolic,
+            'blood_pressure_diastolic': diastolic,
+            'heart_rate': heart_rate,
+            'temperature': temp or None,
+            'weight': None,
+            'height': None,
+            'oxygen_saturation': None if spo2 == MISSING_OXYGEN_SATURATION else spo2,
+            'notes': '',
+            'created_at': None,
+            'updated_at': None,
+        }
+        for recorded, systolic, diastolic, heart_rate, temp, spo2 in zip(
+            recorded_at,
+            columns['blood_pressure_systolic'].tolist(),
+            columns['blood_pressure_diastolic'].tolist(),
+            columns['heart_rate'].tolist(),
+            temperature,
+            oxygen_saturation,
+        )
+    ]
@@ -0,0 +1,152 @@
+# Production-like server configuration
+# Run the API the way it is deployed: a gunicorn master that imports Django
+# once (preload_app) and forks CPU-count-based workers which share those
+# pages copy-on-write. EHR_SERVER_MODE=asgi uses uvicorn workers, which
+# /api/live/ streams need; the default is plain WSGI.
+#
+#     gunicorn -c backend/gunicorn.conf.py backend.wsgi:application
+#     EHR_SERVER_MODE=asgi gunicorn -c backend/gunicorn.conf.py backend.asgi:application
+#
+# `python dev.py` (option 2) starts this, reloads it without dropping
+# requests and stops it. Every EHR_SERVER_STATS_INTERVAL seconds the master
+# logs each worker's RSS and PSS (its fair share of pages shared with the
+# other workers) and its request rate.
+#
+# With preload_app a HUP does not reload application code: the new workers
+# are forked from the master's old copy. To deploy new code, start a second
+# master on the same port (reuse_port is on) and TERM the old one, which
+# finishes in-flight requests first. dev.py does exactly this.
+#
+# Unless PROMETHEUS_MULTIPROC_DIR is already set, each master creates a fresh
+# one for its workers' metric files, so /metrics on any worker reports them
+# all, and removes it on exit.
+
+import gc
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+bind = os.environ.get('EHR_SERVER_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY') or (os.cpu_count() or 1) * 2 + 1)
+preload_app = True
+reuse_port = True
+control_socket_disable = True  # two masters overlap during a reload
+graceful_timeout = 30
+timeout = 60
+accesslog = os.environ.get('EHR_SERVER_ACCESS_LOG') or None
+if os.environ.get('EHR_SERVER_MODE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+
+STATS_INTERVAL = float(os.environ.get('EHR_SERVER_STATS_INTERVAL', 10))
+READY_FILE = os.environ.get('EHR_SERVER_READY_FILE')
+
+# Must be set before the preloaded app imports prometheus_client
+METRICS_DIR = None
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    METRICS_DIR = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='ehr-metrics-')
+
+# Per-worker (pid, requests) counters in an anonymous shared mapping created
+# in the master before any fork, so workers write and the master reads.
+SLOT = struct.Struct('qq')
+MAX_SLOTS = max(workers * 2, 64)
+counters = mmap.mmap(-1, SLOT.size * MAX_SLOTS)
+slot = None
+slot_lock = threading.Lock()
+
+
+def count_request(**kwargs):
+    with slot_lock:
+        pid, requests = SLOT.unpack_from(counters, slot * SLOT.size)
+        SLOT.pack_into(counters, slot * SLOT.size, pid, requests + 1)
+
+
+def memory_kb(pid):
+    """(RSS, PSS) in kB; PSS is None where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            fields = dict(line.split(':', 1) for line in smaps if line.startswith(('Rss:', 'Pss:')))
+        return int(fields['Rss'].split()[0]), int(fields['Pss'].split()[0])
+    except (OSError, KeyError):
+        output = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True).stdout
+        return (int(output) if output.strip() else 0), None
+
+
+def report_stats(server):
+    previous = {}
+    while True:
+        time.sleep(STATS_INTERVAL)
+        lines = []
+        total_rss = total_pss = total_rate = 0
+        for pid, worker in sorted(server.WORKERS.items()):
+            worker_slot = getattr(worker, 'stats_slot', None)
+            if worker_slot is None:
+                continue
+            slot_pid, requests = SLOT.unpack_from(counters, worker_slot * SLOT.size)
+            if slot_pid != pid:
+                continue  # still booting
+            rate = (requests - previous.get(pid, 0)) / STATS_INTERVAL
+            previous[pid] = requests
+            rss, pss = memory_kb(pid)
+            total_rss += rss
+            total_pss += pss or 0
+            total_rate += rate
+            pss_text = f'{pss / 1024:7.1f}' if pss is not None else '      -'
+            lines.append(f'  worker {pid:>7}  rss {rss / 1024:7.1f}MB  pss {pss_text}MB  '
+                         f'{rate:8.1f} req/s  {requests:>9} total')
+        previous = {pid: count for pid, count in previous.items() if pid in server.WORKERS}
+        master_rss, _ = memory_kb(os.getpid())
+        server.log.info(
+            'Workers: %d, %.1f req/s; RSS %.1fMB (PSS %.1fMB) + master %.1fMB\n%s',
+            len(lines), total_rate, total_rss / 1024, total_pss / 1024, master_rss / 1024,
+            '\n'.join(lines),
+        )
+
+
+# Server hooks
+
+def when_ready(server):
+    # Keep the preloaded objects out of the collector so the first gc pass in
+    # a worker does not touch (and copy) every shared page
+    gc.collect()
+    gc.freeze()
+    if STATS_INTERVAL > 0:
+        threading.Thread(target=report_stats, args=(server,), name='worker-stats', daemon=True).start()
+    if READY_FILE:
+        with open(READY_FILE, 'w') as ready:
+            ready.write(str(os.getpid()))
+
+
+def pre_fork(server, worker):
+    taken = {getattr(other, 'stats_slot', None) for other in server.WORKERS.values()}
+    worker.stats_slot = next(index for index in range(MAX_SLOTS) if index not in taken)
+
+
+def post_fork(server, worker):
+    global slot
+    from django.core.signals import request_finished
+    from django.db import connections
+
+    # Never share the master's database connections with a worker
+    connections.close_all()
+    slot = worker.stats_slot
+    SLOT.pack_into(counters, slot * SLOT.size, os.getpid(), 0)
+    request_finished.connect(count_request, dispatch_uid='gunicorn_count_request')
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's in-progress and open-connection gauges
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if READY_FILE and os.path.exists(READY_FILE):
+        os.unlink(READY_FILE)
+    if METRICS_DIR:
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
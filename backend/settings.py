@@ -44,11 +44,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
     'backend.ehr',
 ]
 
 MIDDLEWARE = [
+    'backend.ehr.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,6 +80,30 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Startup profile
+# EHR_PROFILE=api boots only what the JSON API needs: no admin, sessions,
+# messages, static files, templates or browsable API. Use it for API workers
+# and short-lived management commands; keep the default 'full' profile for
+# the admin and for running migrations of the contrib apps.
+# Measure with `python manage.py startup_profile --compare`.
+EHR_PROFILE = os.environ.get('EHR_PROFILE', 'full')
+if EHR_PROFILE == 'api':
+    INSTALLED_APPS = [
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'rest_framework',
+        'rest_framework.authtoken',
+        'corsheaders',
+        'backend.ehr',
+    ]
+    MIDDLEWARE = [
+        'backend.ehr.metrics.MetricsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+    TEMPLATES = []
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -142,9 +168,103 @@ if not DEBUG:
 
 # REST Framework Settings
 REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'rest_framework.authentication.TokenAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
+if EHR_PROFILE == 'api':
+    # No sessions or templates: JSON only. Clients send
+    # "Authorization: Token <key>" (python manage.py drf_create_token <user>);
+    # a token is one indexed lookup, where basic auth would hash the password
+    # on every request.
+    REST_FRAMEWORK.update({
+        'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+        'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.TokenAuthentication'],
+    })
+
+# Cohort queries
+# Seconds to keep cohort membership bitmaps in the cache before re-querying.
+COHORT_CACHE_TIMEOUT = int(os.environ.get('COHORT_CACHE_TIMEOUT', 300))
+
+# Access audit log
+# Entries are buffered in memory and written in batches by a background thread.
+AUDIT_LOG_ENABLED = os.environ.get('AUDIT_LOG_ENABLED', 'True') == 'True'
+AUDIT_LOG_BUFFER_SIZE = 10000       # entries held before backpressure applies
+AUDIT_LOG_BATCH_SIZE = 500          # flush as soon as this many are buffered
+AUDIT_LOG_FLUSH_INTERVAL = 1.0      # ...or after this many seconds
+AUDIT_LOG_BACKPRESSURE = 'drop_oldest'  # or 'drop_newest', 'block'
+
+# Batch endpoints
+BATCH_MAX_OPERATIONS = 50
+BATCH_GET_MAX_URLS = 50  # URLs per /api/batch-get/ request
+BATCH_GET_WORKERS = 4    # sub-requests run at once, each with its own DB connection
+
+# Ward boards
+LATEST_VITALS_MAX_IDS = 1000  # patients per /api/patients/latest-vitals/ request
+
+# Archival
+# VitalSign and MedicalRecord rows older than this move to the archive tables
+# when `python manage.py archive_records` runs.
+EHR_ARCHIVE_HORIZON_DAYS = int(os.environ.get('EHR_ARCHIVE_HORIZON_DAYS', 730))
+
+# Medication schedules
+MEDICATION_SCHEDULE_HORIZON_HOURS = 48  # doses materialized ahead (materialize_doses)
+MEDICATION_DOSE_RETENTION_HOURS = 24   # past doses kept for overdue lists
+MEDICATION_DUE_MAX_HOURS = 24          # longest window per /api/medications/due/
+
+# Scheduled expiry (`python manage.py expire_records`)
+# Scheduled appointments this long past their time become no-shows.
+APPOINTMENT_NO_SHOW_AFTER_HOURS = 24
+
+# Vital streams
+VITAL_STREAM_MAX_RANGE_HOURS = 24  # longest range per /api/vital-streams/ read
+
+# Duplicate-patient detection
+DEDUP_MATCH_THRESHOLD = 0.85   # minimum score reported as a likely duplicate
+DEDUP_MAX_BLOCK_SIZE = 1000    # larger blocking-key groups are skipped
+
+# Patient autocomplete
+AUTOCOMPLETE_REBUILD_INTERVAL = 900  # seconds between background index rebuilds
+AUTOCOMPLETE_MAX_OVERLAY = 1000      # local patient writes served before an early rebuild
+
+# Live chart events (/api/live/)
+LIVE_EVENTS_MAX_PATIENTS = 50   # patients per stream
+LIVE_EVENTS_QUEUE_SIZE = 100    # undelivered events per stream before a resync
+LIVE_EVENTS_HEARTBEAT = 15      # seconds between keep-alive comments
+# Directory for the per-worker sockets that share events between workers on
+# one host; leave unset when running a single worker.
+LIVE_EVENTS_SOCKET_DIR = os.environ.get('LIVE_EVENTS_SOCKET_DIR') or None
+
+# Slow-query log
+# Queries slower than the threshold are recorded with their EXPLAIN plan by a
+# background thread; see `python manage.py slow_queries`.
+SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG_ENABLED', 'True') == 'True'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_QUEUE_SIZE = 1000     # queued slow queries before new ones are dropped
+SLOW_QUERY_FLUSH_INTERVAL = 1.0  # seconds to collect a burst before aggregating
+SLOW_QUERY_PLAN_TTL = 3600       # seconds before a fingerprint's plan is re-captured
+SLOW_QUERY_CAPTURE_PARAMS = False  # store the slowest run's parameters (patient data)
+
+# Prometheus metrics (/metrics)
+# Set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers so
+# a scrape of any worker reports all of them (gunicorn.conf.py does this).
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+
+# Appointment calendar (/api/appointments/calendar/)
+APPOINTMENT_CALENDAR_MAX_DAYS = 31       # longest window per request
+APPOINTMENT_CALENDAR_CACHE_TIMEOUT = 60  # seconds a cached window is served
+
+# Patient purge (DELETE /api/patients/<id>/)
+PATIENT_PURGE_BATCH_SIZE = 2000  # chart rows deleted per transaction
+
+# Change feed (/api/changes/)
+CHANGE_FEED_MAX_BATCH = 1000              # events per read
+CHANGE_FEED_RETENTION_HOURS = 24          # keep acknowledged events this long for replay
+CHANGE_FEED_MAX_RETENTION_HOURS = 24 * 14  # drop older events even if unacknowledged
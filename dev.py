@@ -10,6 +10,8 @@ import subprocess
 import time
 import signal
 import platform
+import select
+import tempfile
 from pathlib import Path
 
 class PatientEHRManager:
@@ -17,6 +19,8 @@ class PatientEHRManager:
         self.backend_process = None
         self.frontend_process = None
         self.is_windows = platform.system() == "Windows"
+        self.server_generation = 0
+        self.reload_requested = False
         
     def print_header(self):
         print("=" * 50)
@@ -28,9 +32,10 @@ class PatientEHRManager:
         print("Please select an option:")
         print()
         print("1. Start Development Servers (Backend + Frontend)")
-        print("2. Reset Database")
-        print("3. Seed Database with Sample Data")
-        print("4. Exit")
+        print("2. Start Production-like Backend (preforked workers)")
+        print("3. Reset Database")
+        print("4. Seed Database with Sample Data")
+        print("5. Exit")
         print()
         
     def get_python_executable(self):
@@ -202,14 +207,18 @@ class PatientEHRManager:
         finally:
             self.cleanup()
             
-    def start_backend(self):
-        """Start Django backend server"""
+    def start_backend(self, production_mode=None):
+        """Start Django backend server (runserver, or gunicorn in 'wsgi'/'asgi' mode)"""
         print("Starting Django backend...")
         
         python_exe = self.get_python_executable()
         if not python_exe:
             return False
             
+        if production_mode:
+            self.backend_process = self.spawn_gunicorn(python_exe, production_mode)
+            return self.backend_process is not None
+            
         cmd = [python_exe, "manage.py", "runserver", "8000"]
         
         try:
@@ -221,6 +230,136 @@ class PatientEHRManager:
             print(f"✗ Failed to start backend: {e}")
             return False
             
+    def spawn_gunicorn(self, python_exe, mode):
+        """Start a gunicorn master and wait until it is accepting connections"""
+        self.server_generation += 1
+        ready_file = Path(tempfile.gettempdir()) / f"ehr-server-{os.getpid()}-{self.server_generation}.ready"
+        env = dict(os.environ, EHR_SERVER_MODE=mode, EHR_SERVER_READY_FILE=str(ready_file))
+        if mode == "asgi":
+            # Share live events between the workers
+            env.setdefault("LIVE_EVENTS_SOCKET_DIR", str(Path(tempfile.gettempdir()) / "ehr-live"))
+        app = "backend.asgi:application" if mode == "asgi" else "backend.wsgi:application"
+        cmd = [python_exe, "-m", "gunicorn", "-c", "backend/gunicorn.conf.py", app]
+        
+        try:
+            process = subprocess.Popen(cmd, env=env)
+        except Exception as e:
+            print(f"✗ Failed to start backend: {e}")
+            return None
+            
+        deadline = time.time() + 60
+        while not ready_file.exists():
+            if process.poll() is not None or time.time() > deadline:
+                print("✗ Backend server failed to start")
+                if process.poll() is None:
+                    process.kill()
+                return None
+            time.sleep(0.2)
+        print(f"✓ Backend server ({mode.upper()}, master pid {process.pid}) ready on http://localhost:8000")
+        return process
+        
+    def reload_backend(self, mode):
+        """Graceful reload: start a new master on the same port, then retire the old one"""
+        python_exe = self.get_python_executable()
+        if not python_exe:
+            return
+            
+        print("\nReloading backend (new code, zero dropped requests)...")
+        new_process = self.spawn_gunicorn(python_exe, mode)
+        if new_process is None:
+            print("Reload failed; the old server is still running.")
+            return
+            
+        old_process, self.backend_process = self.backend_process, new_process
+        # TERM is a graceful shutdown: in-flight requests finish first
+        old_process.send_signal(signal.SIGTERM)
+        try:
+            old_process.wait(timeout=35)
+        except subprocess.TimeoutExpired:
+            old_process.kill()
+        print("✓ Reload complete")
+        
+    def start_production_server(self):
+        """Run the backend like production: gunicorn with preloaded, preforked workers"""
+        print("=" * 50)
+        print("Production-like Backend")
+        print("=" * 50)
+        print()
+        
+        if self.is_windows:
+            print("gunicorn does not run on Windows. Use WSL, or run:")
+            print("  uvicorn backend.asgi:application --workers 4")
+            return
+            
+        python_exe = self.get_python_executable()
+        if not python_exe:
+            return
+            
+        check = subprocess.run([python_exe, "-c", "import gunicorn"], capture_output=True)
+        if check.returncode != 0:
+            print("gunicorn is not installed. Run:")
+            print(f"  {python_exe} -m pip install -r requirements.txt")
+            return
+            
+        print("1. WSGI (sync workers, like a gunicorn deployment)")
+        print("2. ASGI (uvicorn workers, needed for /api/live/ streams)")
+        print()
+        mode = "asgi" if input("Enter your choice (1-2): ").strip() == "2" else "wsgi"
+        workers = os.environ.get("WEB_CONCURRENCY") or (os.cpu_count() or 1) * 2 + 1
+        print(f"\nStarting {workers} workers (set WEB_CONCURRENCY to change)...")
+        
+        self.setup_signal_handlers()
+        if not self.start_backend(production_mode=mode):
+            return
+            
+        try:
+            self.monitor_production_server(mode)
+        finally:
+            self.cleanup()
+            
+    def monitor_production_server(self, mode):
+        """Serve until stopped; 'r' reloads gracefully, 'q' stops"""
+        print()
+        print("=" * 50)
+        print("API:      http://localhost:8000/api/")
+        interval = os.environ.get("EHR_SERVER_STATS_INTERVAL", "10")
+        print(f"Worker memory and request rates are logged every {interval}s")
+        print("(EHR_SERVER_STATS_INTERVAL). Load-test with e.g.:")
+        print("  ab -n 5000 -c 50 http://127.0.0.1:8000/api/patients/")
+        print()
+        print(f"Type 'r' + Enter (or kill -HUP {os.getpid()}) to reload new code")
+        print("Type 'q' + Enter or press Ctrl+C to stop")
+        print("=" * 50)
+        print()
+        
+        self.reload_requested = False
+        
+        def request_reload(signum, frame):
+            self.reload_requested = True
+            
+        signal.signal(signal.SIGHUP, request_reload)
+        
+        try:
+            while True:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload_backend(mode)
+                if self.backend_process.poll() is not None:
+                    print("\nBackend server has stopped unexpectedly.")
+                    break
+                # Wait for a command without blocking reloads and health checks
+                readable, _, _ = select.select([sys.stdin], [], [], 0.5)
+                if readable:
+                    command = sys.stdin.readline()
+                    if not command or command.strip().lower() == "q":
+                        break
+                    if command.strip().lower() == "r":
+                        self.reload_requested = True
+        except KeyboardInterrupt:
+            print("\n\nShutting down servers...")
+        finally:
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            
     def start_frontend(self):
         """Start React frontend server"""
         print("Starting React frontend...")
@@ -337,22 +476,24 @@ class PatientEHRManager:
             self.print_menu()
             
             try:
-                choice = input("Enter your choice (1-4): ").strip()
+                choice = input("Enter your choice (1-5): ").strip()
                 print()
                 
                 if choice == '1':
                     self.start_dev_servers()
                 elif choice == '2':
-                    self.reset_database()
+                    self.start_production_server()
                 elif choice == '3':
-                    self.seed_database()
+                    self.reset_database()
                 elif choice == '4':
+                    self.seed_database()
+                elif choice == '5':
                     print("Goodbye!")
                     break
                 else:
-                    print("Invalid choice. Please enter 1, 2, 3, or 4.")
+                    print("Invalid choice. Please enter 1, 2, 3, 4, or 5.")
                     
-                if choice in ['2', '3']:
+                if choice in ['3', '4']:
                     input("\nPress Enter to continue...")
                     
             except KeyboardInterrupt:
@@ -1,6 +1,7 @@
 import type {
   Patient,
   PatientFormData,
+  PatientMatch,
   MedicalRecord,
   Medication,
   VitalSign,
@@ -94,6 +95,10 @@ const apiFetch = async <T>(
 export const patientAPI = {
   getAll: () => apiFetch<PaginatedResponse<Patient>>("/patients/"),
   getOne: (id: string | number) => apiFetch<Patient>(`/patients/${id}/`),
+  autocomplete: (query: string, limit = 10) =>
+    apiFetch<PatientMatch[]>(
+      `/patients/autocomplete/?q=${encodeURIComponent(query)}&limit=${limit}`
+    ),
   create: (data: PatientFormData) =>
     apiFetch<Patient>("/patients/", {
       method: "POST",
@@ -162,3 +167,33 @@ export const appointmentAPI = {
       body: JSON.stringify(data),
     }),
 };
+
+export interface LiveEventHandlers {
+  onVitalSign?: (vitalSign: VitalSign) => void;
+  onAppointment?: (appointment: Appointment) => void;
+  onResync?: () => void;
+}
+
+/**
+ * Subscribe to live chart events for one or more patients via Server-Sent
+ * Events. The browser reconnects automatically; a "resync" event means
+ * events were dropped and the chart should be reloaded.
+ *
+ * @returns A function that closes the stream
+ */
+export const subscribeToPatients = (
+  patientIds: Array<string | number>,
+  handlers: LiveEventHandlers
+): (() => void) => {
+  const source = new EventSource(
+    `${API_BASE_URL}/live/?patients=${patientIds.join(",")}`
+  );
+  source.addEventListener("vital_sign", (event) => {
+    handlers.onVitalSign?.(JSON.parse((event as MessageEvent).data).data);
+  });
+  source.addEventListener("appointment", (event) => {
+    handlers.onAppointment?.(JSON.parse((event as MessageEvent).data).data);
+  });
+  source.addEventListener("resync", () => handlers.onResync?.());
+  return () => source.close();
+};
@@ -6,6 +6,7 @@ import {
   medicationAPI,
   vitalSignAPI,
   appointmentAPI,
+  subscribeToPatients,
 } from "../api";
 import type {
   Patient,
@@ -36,6 +37,24 @@ function PatientDetail() {
     }
   }, [id]);
 
+  useEffect(() => {
+    if (!id) return;
+    return subscribeToPatients([id], {
+      onVitalSign: (vitalSign) =>
+        setVitalSigns((current) => [
+          vitalSign,
+          ...current.filter((v) => v.id !== vitalSign.id),
+        ]),
+      onAppointment: (appointment) =>
+        setAppointments((current) =>
+          current.some((a) => a.id === appointment.id)
+            ? current.map((a) => (a.id === appointment.id ? appointment : a))
+            : [appointment, ...current]
+        ),
+      onResync: loadPatientData,
+    });
+  }, [id]);
+
   const loadPatientData = async () => {
     if (!id) return;
 
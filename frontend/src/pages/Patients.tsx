@@ -1,12 +1,15 @@
-import { useState, useEffect, FormEvent, ChangeEvent } from "react";
+import { useState, useEffect, useRef, FormEvent, ChangeEvent } from "react";
 import { Link } from "react-router-dom";
 import { patientAPI } from "../api";
-import type { Patient, PatientFormData } from "../types";
+import type { Patient, PatientFormData, PatientMatch } from "../types";
 
 function Patients() {
   const [patients, setPatients] = useState<Patient[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [showForm, setShowForm] = useState<boolean>(false);
+  const [query, setQuery] = useState<string>("");
+  const [matches, setMatches] = useState<PatientMatch[]>([]);
+  const latestQuery = useRef<string>("");
   const [formData, setFormData] = useState<PatientFormData>({
     medical_record_number: "",
     first_name: "",
@@ -37,6 +40,23 @@ function Patients() {
     }
   };
 
+  const handleSearch = async (e: ChangeEvent<HTMLInputElement>) => {
+    const value = e.target.value;
+    setQuery(value);
+    latestQuery.current = value;
+    if (!value.trim()) {
+      setMatches([]);
+      return;
+    }
+    try {
+      const results = await patientAPI.autocomplete(value);
+      // Ignore responses for keystrokes the user has already typed past
+      if (latestQuery.current === value) setMatches(results);
+    } catch (error) {
+      console.error("Error searching patients:", error);
+    }
+  };
+
   const handleSubmit = async (e: FormEvent<HTMLFormElement>) => {
     e.preventDefault();
     try {
@@ -79,6 +99,29 @@ function Patients() {
         </button>
       </div>
 
+      <div className="patient-search">
+        <input
+          type="search"
+          placeholder="Search by name or MRN"
+          value={query}
+          onChange={handleSearch}
+        />
+        {matches.length > 0 && (
+          <ul className="search-results">
+            {matches.map((match) => (
+              <li key={match.id}>
+                <Link to={`/patient/${match.id}`}>
+                  {match.first_name} {match.last_name}
+                  <span>
+                    {match.medical_record_number} · {match.date_of_birth}
+                  </span>
+                </Link>
+              </li>
+            ))}
+          </ul>
+        )}
+      </div>
+
       {showForm && (
         <form onSubmit={handleSubmit} className="patient-form">
           <div className="form-grid">
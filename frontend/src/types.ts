@@ -29,6 +29,14 @@ export interface PatientFormData {
   emergency_contact_phone: string;
 }
 
+export interface PatientMatch {
+  id: number;
+  first_name: string;
+  last_name: string;
+  medical_record_number: string;
+  date_of_birth: string;
+}
+
 export interface MedicalRecord {
   id: number;
   patient: number;